@@ -1,25 +1,82 @@
 import logging
-from typing import List, Dict
-from app.db.connection import chats_collection
-from fastapi import APIRouter
+import re
+from datetime import datetime
+from typing import List, Dict, Optional
+from app.db.connection import chat_buckets_collection
+from app.utils.chat_retention import CHAT_BUCKET_SIZE
+from fastapi import APIRouter, HTTPException, Query, Response
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
-LIMIT_MESSAGES = 100  
+LIMIT_MESSAGES = 100
+MAX_LIMIT_MESSAGES = 500
+
+_MESSAGE_ID_PATTERN = re.compile(r"^[0-9a-f]{24}$")
+
+
+def _parse_cursor(before: str) -> dict:
+    """
+    Turns the `before` cursor (a message_id or an ISO-8601 timestamp) into the
+    bucket and message filters used by the history pipeline.
+    """
+    if _MESSAGE_ID_PATTERN.match(before):
+        # Hex ids sort in creation order, so buckets starting at or after the cursor are skipped.
+        return {"bucket": {"first_message_id": {"$lt": before}}, "message": {"message_id": {"$lt": before}}}
+    try:
+        timestamp = datetime.fromisoformat(before.replace("Z", "+00:00")).replace(tzinfo=None)
+    except ValueError:
+        raise HTTPException(status_code=422, detail="Invalid cursor: expected a message_id or ISO-8601 timestamp.")
+    return {"bucket": {"start_ts": {"$lt": timestamp}}, "message": {"timestamp": {"$lt": timestamp}}}
+
 
 @router.post("/history", response_model=List[Dict])
-async def get_history(user_id: int, pet_id: int) -> List[Dict]:
+async def get_history(
+    response: Response,
+    user_id: int,
+    pet_id: int,
+    limit: int = Query(LIMIT_MESSAGES, ge=1, le=MAX_LIMIT_MESSAGES, description="Page size"),
+    before: Optional[str] = Query(None, description="Return messages older than this message_id or ISO timestamp"),
+) -> List[Dict]:
+    """
+    Returns one page of history, oldest first. Without `before` this is the newest page.
+    When older messages may exist, the X-Next-Cursor header holds the message_id to pass
+    as `before` for the next page.
+    """
+    bucket_match = {"user_id": user_id, "pet_id": pet_id}
+    message_match = None
+    if before:
+        cursor = _parse_cursor(before)
+        bucket_match.update(cursor["bucket"])
+        message_match = cursor["message"]
+
     try:
-        query = {"user_id": user_id, "pet_id": pet_id}
-        document = await chats_collection.find_one(query)
+        # Only the newest buckets that can hold one page are unwound; paging happens in Mongo.
+        buckets_needed = -(-limit // CHAT_BUCKET_SIZE) + 1
+        pipeline = [
+            {"$match": bucket_match},
+            {"$sort": {"start_ts": -1}},
+            {"$limit": buckets_needed},
+            {"$unwind": "$messages"},
+            {"$replaceRoot": {"newRoot": "$messages"}},
+        ]
+        if message_match:
+            pipeline.append({"$match": message_match})
+        pipeline += [
+            {"$sort": {"message_id": -1}},
+            {"$limit": limit},
+            {"$sort": {"message_id": 1}},
+        ]
+        messages = await chat_buckets_collection.aggregate(pipeline).to_list(length=limit)
 
-        if not document or "messages" not in document:
-            logger.warning(f"No chat history found for user {user_id} and pet {pet_id}")
+        if not messages:
+            logger.warning("No chat history found for user %s and pet %s", user_id, pet_id)
             return []
 
-        return document.get("messages", [][-LIMIT_MESSAGES:]) 
+        if len(messages) == limit:
+            response.headers["X-Next-Cursor"] = messages[0]["message_id"]
+        return messages
 
     except Exception as e:
-        logger.error(f"Error retrieving history for user {user_id}, pet {pet_id}: {e}", exc_info=True)
-        return []
\ No newline at end of file
+        logger.error("Error retrieving history for user %s, pet %s: %s", user_id, pet_id, e, exc_info=True)
+        return []
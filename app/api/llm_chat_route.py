@@ -1,23 +1,33 @@
 import logging
 import json
 import re
-import datetime
-from fastapi import APIRouter, Depends, HTTPException, Header, BackgroundTasks, Form, Request
+import asyncio
+import time
+from datetime import datetime
+
+import httpx
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Header, Form, Request
+from fastapi.responses import StreamingResponse
 
 # --- App Imports ---
 from app.models.main_schema import ChatResponse
-from app.utils.prompt_builder import build_pet_prompt, system_prompt
-from app.utils.chat_handler import generate_response
-from app.utils.extract_response import extract_response_features
-from app.utils.chat_retention import save_message_and_get_context
-from app.utils.php_service import get_user_by_id, get_pet_by_id, get_pet_status_by_id
+from app.utils.prompt_budget import build_budgeted_prompts
+from app.utils.chat_handler import generate_response, stream_response, MODEL_NAME
+from app.utils.extract_response import extract_response_features, StreamingFeatureParser
+from app.utils.chat_retention import get_conversation_context, save_messages_and_get_context, new_message, RECENT_MESSAGES_LIMIT
+from app.utils.php_cache import get_user_by_id, get_pet_by_id, get_pet_status_by_id
 from app.utils.user_operations import get_or_create_user_profile
-from app.utils.fact_extractor import extract_and_save_user_facts
+from app.utils.background_jobs import enqueue_job
+from app.utils.metrics import stage_timer, stage_duration, timed
+from app.utils.pet_memory import recall_memories, drop_recent, format_memory, memory_available
+from app.utils.chat_summary import note_new_messages
+from app.utils.fact_extractor import passes_prefilter  # importing registers the "extract_user_facts" job
 
 # --- Basic Setup ---
 router = APIRouter()
-logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
+# Reply text; sampled in production (see LOG_SAMPLE_RATES)
+payload_logger = logging.getLogger(__name__ + ".payload")
 
 # --- Auth dependency ---
 async def get_auth_token(authorization: str = Header(...)):
@@ -27,10 +37,15 @@ async def get_auth_token(authorization: str = Header(...)):
 
 # --- Helper Functions ---
 
+class UpstreamError(Exception):
+    """Raised when a required upstream service (PHP API) fails."""
+
 def _log_user_profile(profile: dict):
     """
     Logs detailed user profile information for debugging purposes.
     """
+    if not logger.isEnabledFor(logging.DEBUG):
+        return
     logger.debug("=== [USER PROFILE LOADED] ===")
     logger.debug("User ID: %s, Name: %s", profile.get("user_id"), profile.get("first_name"))
     
@@ -42,15 +57,10 @@ def _log_user_profile(profile: dict):
     else:
         logger.debug("Biography Facts: None")
 
-async def _fetch_chat_data(user_id: int, pet_id: int, token: str) -> dict:
-    user_data_from_php = await get_user_by_id(user_id, token)
-    if not user_data_from_php:
-        raise ValueError("User not found.")
-
-    user_profile = await get_or_create_user_profile(user_id, user_data_from_php)
-    if not user_profile:
-        raise ValueError("Profile creation or retrieval failed.")
-
+def _apply_php_user_details(user_profile: dict, user_data_from_php: dict) -> dict:
+    """
+    Copies profession, gender and age from the PHP user payload into the profile biography.
+    """
     if "biography" not in user_profile:
         user_profile["biography"] = {}
         
@@ -72,15 +82,78 @@ async def _fetch_chat_data(user_id: int, pet_id: int, token: str) -> dict:
             user_profile["biography"]["age"] = age
         except (ValueError, TypeError):
             logger.warning("Could not parse birth_date: %s", birth_date_str)    
-    
-    pet_data = await get_pet_by_id(pet_id, token)
+    return user_profile
+
+async def _fetch_user_branch(user_id: int, token: str) -> dict:
+    # PHP user -> Mongo profile is the only dependent chain in this stage.
+    try:
+        user_data_from_php = await get_user_by_id(user_id, token)
+    except httpx.HTTPError as e:
+        raise UpstreamError(f"User service unavailable: {e.__class__.__name__}") from e
+    if not user_data_from_php:
+        raise ValueError("User not found.")
+
+    user_profile = await get_or_create_user_profile(user_id, user_data_from_php)
+    if not user_profile:
+        raise ValueError("Profile creation or retrieval failed.")
+
+    return _apply_php_user_details(user_profile, user_data_from_php)
+
+async def _fetch_pet_branch(pet_id: int, token: str) -> dict:
+    try:
+        pet_data = await get_pet_by_id(pet_id, token)
+    except httpx.HTTPError as e:
+        raise UpstreamError(f"Pet service unavailable: {e.__class__.__name__}") from e
     if not pet_data:
         raise ValueError("Pet not found.")
+    return pet_data
 
-    pet_status_data = await get_pet_status_by_id(pet_id, token)
+async def _fetch_status_branch(pet_id: int, token: str) -> dict:
+    # The status only tunes the prompt, so a failure here degrades instead of failing the chat.
+    try:
+        return await get_pet_status_by_id(pet_id, token)
+    except httpx.HTTPError as e:
+        logger.warning("Pet status unavailable for pet %s, continuing without it: %s", pet_id, e)
+        return {}
+
+async def _fetch_context_branch(user_id: int, pet_id: int) -> dict:
+    # Missing history only costs the pet its short-term memory, so degrade to no context.
+    try:
+        return await get_conversation_context(user_id, pet_id)
+    except Exception as e:
+        logger.error("Could not load conversation context for user %s, pet %s: %s", user_id, pet_id, e)
+        return {"summary": "", "messages": []}
 
-    return {"user": user_profile, "pet": pet_data, "status": pet_status_data}
+@timed("fetch_chat_data")
+async def _fetch_chat_data(user_id: int, pet_id: int, token: str, message: str = "") -> dict:
+    """
+    Fetches user profile, pet, pet status, recent conversation (running summary plus
+    unsummarized tail) and related long-term memories concurrently. The whole stage takes roughly as long as the slowest branch
+    (PHP user + Mongo profile, PHP pet, PHP status, Mongo history, memory recall).
+    If a required branch fails, the remaining branches are cancelled.
+    """
+    try:
+        async with asyncio.TaskGroup() as tg:
+            user_task = tg.create_task(_fetch_user_branch(user_id, token))
+            pet_task = tg.create_task(_fetch_pet_branch(pet_id, token))
+            status_task = tg.create_task(_fetch_status_branch(pet_id, token))
+            context_task = tg.create_task(_fetch_context_branch(user_id, pet_id))
+            memory_task = tg.create_task(recall_memories(user_id, pet_id, message))
+    except* (ValueError, UpstreamError) as eg:
+        # Surface the first branch failure as-is so the route can map it to a status code.
+        raise eg.exceptions[0] from None
 
+    context = context_task.result()
+    return {
+        "user": user_task.result(),
+        "pet": pet_task.result(),
+        "status": status_task.result(),
+        "context": context["messages"],
+        "summary": context["summary"],
+        "memories": drop_recent(memory_task.result(), context["messages"]),
+    }
+
+@timed("llm_call")
 async def _call_ai_service(system_prompt_str: str, user_prompt_str: str) -> str:
     """
     Handles the entire LLM call, including JSON parsing and error checking.
@@ -95,9 +168,12 @@ async def _call_ai_service(system_prompt_str: str, user_prompt_str: str) -> str:
         raise HTTPException(status_code=502, detail="AI service returned malformed data.")
 
     if response_data.get("status") == "error":
-        error_message = response_data.get("error", {}).get("message", "Unknown AI error")
+        error = response_data.get("error", {})
+        error_message = error.get("message", "Unknown AI error")
         logger.error("[ERROR] LLM Service: %s", error_message)
-        raise HTTPException(status_code=502, detail=error_message)
+        # Provider quota exhausted: tell the client to come back instead of reporting a bad gateway
+        status_code = 503 if error.get("code") == "rate_limited" else 502
+        raise HTTPException(status_code=status_code, detail=error_message)
 
     ai_response_text = response_data.get("data", {}).get("response")
     if not ai_response_text:
@@ -106,66 +182,191 @@ async def _call_ai_service(system_prompt_str: str, user_prompt_str: str) -> str:
         
     return ai_response_text
 
-# --- Main Chat Route ---
-@router.post("/chat", response_model=ChatResponse)
-async def chat(
-    request: Request,
-    background_tasks: BackgroundTasks,
-    user_id: int = Form(...),
-    pet_id: int = Form(...),
-    message: str = Form(...),
-    authorization: str = Depends(get_auth_token),
-):
-    logger.info("=== [CHAT REQUEST RECEIVED] User ID: %s | Pet ID: %s ===", user_id, pet_id)
-
+async def _prepare_chat_turn(
+    user_id: int,
+    pet_id: int,
+    message: str,
+    authorization: str,
+) -> dict:
+    """
+    Shared first half of a chat turn: loads user/pet data and recent history
+    and builds both prompts. The user message is only
+    persisted at the end of the turn, together with the AI reply.
+    """
     # Fetch all data 
     try:
-        data = await _fetch_chat_data(user_id, pet_id, authorization)
+        data = await _fetch_chat_data(user_id, pet_id, authorization, message)
         user_profile = data["user"]
         pet_data = data["pet"]
         pet_status_data = data["status"]
+        conversation_context = data["context"]
     except ValueError as e:
         logger.error("[ERROR] Data fetching failed for user %s: %s", user_id, e)
         raise HTTPException(status_code=404, detail=str(e))
+    except UpstreamError as e:
+        logger.error("[ERROR] Upstream failure for user %s: %s", user_id, e)
+        raise HTTPException(status_code=502, detail=str(e))
 
     # Log profile details for debugging 
     _log_user_profile(user_profile)
 
-    # Start background tasks and prepare context
-    background_tasks.add_task(extract_and_save_user_facts, user_id, message)
-    
-    conversation_context = await save_message_and_get_context(user_id, pet_id, "user", message)
-    
+    user_message = new_message("user", message)
+    conversation_context = (conversation_context + [user_message])[-RECENT_MESSAGES_LIMIT:]
+
     owner_name = user_profile.get("first_name", "Friend")
     pet_name = pet_data.get("name", "Your Pet")
-    
-    history_snippet = "\n".join(
-        f"{owner_name}: {msg['text']}" if msg["sender"] == "user" else f"{pet_name}: {msg['text']}"
-        for msg in conversation_context
-    )
 
-    # Build the prompts
-    build_system_prompt = system_prompt(pet_data, owner_name)
-    prompt = build_pet_prompt(
-        pet_data,
-        owner_name,
-        memory_snippet=history_snippet,
-        pet_status=pet_status_data,
-        message=message,
-        biography_snippet=user_profile.get("biography", {}),
-    )
-    prompt += f"\n{pet_name}:"
+    # Build the prompts within the model's token budget
+    with stage_timer("build_prompts"):
+        prompts = build_budgeted_prompts(
+            pet_data,
+            owner_name,
+            pet_name,
+            conversation_context,
+            model=MODEL_NAME,
+            pet_status=pet_status_data,
+            message=message,
+            biography_snippet=user_profile.get("biography", {}),
+            recalled_memories=data["memories"],
+            conversation_summary=data["summary"],
+        )
+    build_system_prompt = prompts["system_prompt"]
+    prompt = prompts["prompt"]
+
+    return {
+        "system_prompt": build_system_prompt,
+        "prompt": prompt,
+        "owner_name": owner_name,
+        "pet_name": pet_name,
+        "user_message": user_message,
+        # Messages outside the running summary once this turn is saved
+        "unsummarized": len(data["context"]) + 2,
+    }
 
-    # Call the AI 
-    ai_response_text = await _call_ai_service(build_system_prompt, prompt)
+async def _save_turn(user_id: int, pet_id: int, turn: dict, reply: str, background_tasks: BackgroundTasks):
+    """
+    Stores the user message and reply in one write, then leaves the follow-up work to
+    background_tasks, which runs it once the response has been sent. Only successful
+    turns get here.
+    """
+    ai_message = new_message("ai", reply)
+    await save_messages_and_get_context(user_id, pet_id, [turn["user_message"], ai_message], limit=0)
+    background_tasks.add_task(_schedule_follow_up, user_id, pet_id, turn, ai_message)
+
+async def _schedule_follow_up(user_id: int, pet_id: int, turn: dict, ai_message: dict):
+    """
+    Queues fact extraction (only for messages the pre-filter lets through) and
+    embedding the exchange into long-term memory, and, once enough messages have
+    piled up, the rolling summary. A failure here only loses this turn's follow-up work.
+    """
+    user_text = turn["user_message"]["text"]
+    try:
+        if passes_prefilter(user_id, user_text):
+            await enqueue_job("extract_user_facts", user_id=user_id, user_message=user_text)
+        await note_new_messages(user_id, pet_id, turn["unsummarized"], turn["owner_name"], turn["pet_name"])
+        if memory_available():
+            await enqueue_job(
+                "index_pet_memory",
+                user_id=user_id,
+                pet_id=pet_id,
+                memory_id=ai_message["message_id"],
+                document=format_memory(turn["owner_name"], turn["pet_name"], user_text, ai_message["text"]),
+                timestamp=ai_message["timestamp"].timestamp(),
+            )
+    except Exception as e:
+        logger.error("Could not schedule follow-up work for user %s, pet %s: %s", user_id, pet_id, e, exc_info=True)
 
-    # The final response
-    cleaned_response = re.sub(rf"^{re.escape(pet_name)}\s*:\s*", "", ai_response_text, count=1).strip()
+def _sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
 
-    await save_message_and_get_context(user_id, pet_id, "ai", cleaned_response)
+# --- Main Chat Route ---
+@router.post("/chat", response_model=ChatResponse)
+async def chat(
+    request: Request,
+    background_tasks: BackgroundTasks,
+    user_id: int = Form(...),
+    pet_id: int = Form(...),
+    message: str = Form(...),
+    authorization: str = Depends(get_auth_token),
+):
+    logger.info("=== [CHAT REQUEST RECEIVED] User ID: %s | Pet ID: %s ===", user_id, pet_id)
 
-    features = extract_response_features(cleaned_response)
+    with stage_timer("chat"):
+        turn = await _prepare_chat_turn(user_id, pet_id, message, authorization)
+        pet_name = turn["pet_name"]
 
-    logger.info("=== [RESPONSE SENT] AI Response: %s ===", cleaned_response)
+        # Call the AI 
+        ai_response_text = await _call_ai_service(turn["system_prompt"], turn["prompt"])
+
+        # The final response
+        cleaned_response = re.sub(rf"^{re.escape(pet_name)}\s*:\s*", "", ai_response_text, count=1).strip()
+
+        await _save_turn(user_id, pet_id, turn, cleaned_response, background_tasks)
+
+        with stage_timer("extract_features"):
+            features = extract_response_features(cleaned_response)
+
+    payload_logger.info("=== [RESPONSE SENT] AI Response: %s ===", cleaned_response)
     
-    return {"response": cleaned_response, "features": features}
\ No newline at end of file
+    return {"response": cleaned_response, "features": features}
+
+# --- Streaming Chat Route ---
+@router.post("/chat/stream")
+async def chat_stream(
+    request: Request,
+    background_tasks: BackgroundTasks,
+    user_id: int = Form(...),
+    pet_id: int = Form(...),
+    message: str = Form(...),
+    authorization: str = Depends(get_auth_token),
+):
+    """
+    Same as /chat, but streams the reply as server-sent events:
+      - `feature` for each (emotion), {motion} or <sound> as soon as it is complete
+      - `delta` for each chunk of reply text
+      - `done` with the full ChatResponse once the LLM finishes
+      - `error` if the LLM fails mid-stream
+    The user and AI messages are stored only after the stream completes.
+    """
+    logger.info("=== [CHAT STREAM REQUEST RECEIVED] User ID: %s | Pet ID: %s ===", user_id, pet_id)
+
+    turn = await _prepare_chat_turn(user_id, pet_id, message, authorization)
+
+    async def event_source():
+        parser = StreamingFeatureParser(turn["pet_name"])
+        started = time.perf_counter()
+        try:
+            with stage_timer("llm_stream"):
+                async for delta in stream_response(turn["system_prompt"], turn["prompt"]):
+                    if started is not None:
+                        stage_duration.observe("llm_first_delta", time.perf_counter() - started)
+                        started = None
+                    for event, payload in parser.feed(delta):
+                        yield _sse_event(event, payload if event == "feature" else {"text": payload})
+            for event, payload in parser.close():
+                yield _sse_event(event, payload if event == "feature" else {"text": payload})
+        except Exception as e:
+            logger.error("[ERROR] LLM stream failed for user %s: %s", user_id, e)
+            yield _sse_event("error", {"detail": "AI service is currently unavailable."})
+            return
+
+        cleaned_response = parser.text
+        if not cleaned_response:
+            yield _sse_event("error", {"detail": "AI service returned an incomplete response."})
+            return
+
+        await _save_turn(user_id, pet_id, turn, cleaned_response, background_tasks)
+
+        with stage_timer("extract_features"):
+            features = extract_response_features(cleaned_response)
+        response = ChatResponse(response=cleaned_response, features=features)
+        payload_logger.info("=== [STREAM RESPONSE SENT] AI Response: %s ===", cleaned_response)
+        yield _sse_event("done", response.model_dump())
+
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        # Runs the follow-up tasks _save_turn adds once the stream has been sent
+        background=background_tasks,
+    )
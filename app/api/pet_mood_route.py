@@ -0,0 +1,52 @@
+import logging
+
+import numpy as np
+from decouple import config
+from fastapi import APIRouter, HTTPException
+
+from app.models.main_schema import MoodBatchRequest, MoodBatchResponse
+from app.utils.metrics import stage_timer
+from app.utils.pet_logic.behavior_engine import MOOD_VALUES, get_mood_rules
+
+router = APIRouter()
+logger = logging.getLogger(__name__)
+
+MOOD_BATCH_MAX_PETS = config("MOOD_BATCH_MAX_PETS", default=100000, cast=int)
+
+_STATUS_COLUMNS = ("hunger", "energy", "health", "stress", "cleanliness", "happiness", "is_sick")
+
+
+@router.post("/moods/batch", response_model=MoodBatchResponse)
+def evaluate_mood_batch(batch: MoodBatchRequest) -> dict:
+    """
+    Computes the mood and behavior tag for many pets at once, e.g. for push
+    notifications or dashboards. Takes one list per status field, evaluates them with
+    the same mood rules as the chat path's BehaviorEngine, and returns the moods and
+    tags in input order, plus how many pets are in each mood.
+
+    A plain `def` on purpose: FastAPI runs it in the thread pool, so large batches
+    do not hold up the event loop.
+    """
+    columns = {name: getattr(batch, name) for name in _STATUS_COLUMNS}
+    if batch.pet_ids is not None:
+        columns["pet_ids"] = batch.pet_ids
+    sizes = {len(values) for values in columns.values()}
+    if len(sizes) != 1:
+        raise HTTPException(status_code=422, detail="All status lists must have the same length.")
+    size = sizes.pop()
+    if size > MOOD_BATCH_MAX_PETS:
+        raise HTTPException(status_code=413, detail=f"At most {MOOD_BATCH_MAX_PETS} pets per batch.")
+
+    with stage_timer("mood_batch"):
+        # One rule table for moods and tags, even if the rules reload mid-request
+        rules = get_mood_rules()
+        codes = rules.evaluate_batch({name: columns[name] for name in _STATUS_COLUMNS})
+        counts = np.bincount(codes, minlength=len(MOOD_VALUES))
+        result = {
+            "pet_ids": batch.pet_ids,
+            "moods": MOOD_VALUES[codes].tolist(),
+            "behavior_tags": rules.tags[codes].tolist(),
+            "counts": {mood: int(count) for mood, count in zip(MOOD_VALUES.tolist(), counts) if count},
+        }
+    logger.debug("Evaluated moods for %d pets", size)
+    return result
@@ -1,4 +1,6 @@
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import OperationFailure
 from decouple import config
 from functools import lru_cache
 import logging
@@ -26,3 +28,46 @@ def get_db():
 db = get_db()
 chats_collection = db.chats
 user_profiles_collection = db.user_profiles
+# Chat history lives in fixed-size buckets; `chats` keeps one header document per conversation
+chat_buckets_collection = db.chat_buckets
+# Durable queue for post-response work (see app/utils/background_jobs.py)
+background_jobs_collection = db.background_jobs
+
+async def ensure_indexes():
+    """
+    Creates the indexes the chat path relies on. Safe to call on every startup.
+    """
+    await chat_buckets_collection.create_index(
+        [("user_id", ASCENDING), ("pet_id", ASCENDING), ("start_ts", DESCENDING)],
+        name="conversation_recent_buckets",
+    )
+    try:
+        # Only one bucket per sequence number, so concurrent turns cannot both open
+        # the next bucket. Buckets migrated from the legacy layout carry no seq.
+        await chat_buckets_collection.create_index(
+            [("user_id", ASCENDING), ("pet_id", ASCENDING), ("seq", ASCENDING)],
+            name="conversation_bucket_seq_unique",
+            unique=True,
+            partialFilterExpression={"seq": {"$exists": True}},
+        )
+    except OperationFailure as exc:
+        logger.error("Could not create the unique chat_buckets seq index: %s", exc)
+    await chats_collection.create_index(
+        [("user_id", ASCENDING), ("pet_id", ASCENDING)],
+        name="conversation_header",
+    )
+    await background_jobs_collection.create_index(
+        [("status", ASCENDING), ("run_at", ASCENDING)],
+        name="background_jobs_ready",
+    )
+    try:
+        # Profiles are created by upsert on user_id; the unique index keeps concurrent
+        # first messages from creating duplicates.
+        await user_profiles_collection.create_index(
+            [("user_id", ASCENDING)],
+            name="user_profiles_user_id_unique",
+            unique=True,
+        )
+    except OperationFailure as exc:
+        # Usually existing duplicates; see scripts/dedupe_user_profiles.py
+        logger.error("Could not create the unique user_profiles index: %s", exc)
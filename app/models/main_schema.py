@@ -1,6 +1,6 @@
 from pydantic import BaseModel
 from fastapi import Form, Request, UploadFile, File
-from typing import Literal, List
+from typing import Dict, Literal, List, Optional, Union
 
 # User Profile Form
 def get_user_profile_form(
@@ -54,4 +54,22 @@ class ChatFeatures(BaseModel):
 
 class ChatResponse(BaseModel):
     response: str
-    features: ChatFeatures
\ No newline at end of file
+    features: ChatFeatures
+
+# Batch Mood Evaluation (columnar: entry i of every list belongs to the same pet)
+class MoodBatchRequest(BaseModel):
+    pet_ids: Optional[List[int]] = None
+    hunger: List[float]
+    energy: List[float]
+    health: List[float]
+    stress: List[float]
+    cleanliness: List[float]
+    happiness: List[float]
+    is_sick: List[Union[str, int]]
+
+class MoodBatchResponse(BaseModel):
+    pet_ids: Optional[List[int]] = None
+    moods: List[str]
+    behavior_tags: List[str]
+    counts: Dict[str, int]
+
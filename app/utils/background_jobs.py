@@ -0,0 +1,361 @@
+import asyncio
+import itertools
+import logging
+import random
+import time
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, Optional
+
+from decouple import config
+from pymongo import ReturnDocument
+
+from app.db.connection import background_jobs_collection
+
+logger = logging.getLogger("background_jobs")
+
+# --- Config ---
+# "mongo" keeps jobs across restarts; "memory" is for tests and local runs.
+BACKGROUND_JOB_BACKEND = config("BACKGROUND_JOB_BACKEND", default="mongo")
+# Workers bound how many jobs run at once. Fact extraction jobs wait on the shared
+# micro-batcher, so this is also the upper bound on how many messages share a batch.
+BACKGROUND_JOB_WORKERS = config("BACKGROUND_JOB_WORKERS", default=20, cast=int)
+# Pending jobs beyond this are rejected at enqueue time instead of piling up.
+BACKGROUND_JOB_QUEUE_SIZE = config("BACKGROUND_JOB_QUEUE_SIZE", default=1000, cast=int)
+BACKGROUND_JOB_MAX_ATTEMPTS = config("BACKGROUND_JOB_MAX_ATTEMPTS", default=4, cast=int)
+BACKGROUND_JOB_RETRY_BASE = config("BACKGROUND_JOB_RETRY_BASE", default=2.0, cast=float)
+BACKGROUND_JOB_RETRY_MAX = config("BACKGROUND_JOB_RETRY_MAX", default=120.0, cast=float)
+# A claimed Mongo job is handed to another worker if not finished within the lease.
+BACKGROUND_JOB_LEASE_SECONDS = config("BACKGROUND_JOB_LEASE_SECONDS", default=300, cast=int)
+BACKGROUND_JOB_POLL_INTERVAL = config("BACKGROUND_JOB_POLL_INTERVAL", default=1.0, cast=float)
+BACKGROUND_JOB_SHUTDOWN_TIMEOUT = config("BACKGROUND_JOB_SHUTDOWN_TIMEOUT", default=10.0, cast=float)
+# Workers hold off while this many foreground requests are in flight, for at most
+# BACKGROUND_JOB_MAX_DEFER seconds per job so background work cannot starve.
+BACKGROUND_JOB_FOREGROUND_THRESHOLD = config("BACKGROUND_JOB_FOREGROUND_THRESHOLD", default=4, cast=int)
+BACKGROUND_JOB_MAX_DEFER = config("BACKGROUND_JOB_MAX_DEFER", default=2.0, cast=float)
+
+JobHandler = Callable[..., Awaitable[None]]
+
+_handlers: Dict[str, JobHandler] = {}
+
+
+def register_job(name: str):
+    """
+    Registers an async handler under `name`. Handlers receive the job's kwargs and
+    should raise to have the job retried.
+    """
+    def decorator(func: JobHandler) -> JobHandler:
+        _handlers[name] = func
+        return func
+    return decorator
+
+
+def _retry_delay(attempts: int) -> float:
+    delay = min(BACKGROUND_JOB_RETRY_BASE * (2 ** (attempts - 1)), BACKGROUND_JOB_RETRY_MAX)
+    return delay * random.uniform(0.5, 1.5)
+
+
+# --- Backends ---
+
+class InMemoryJobBackend:
+    """Process-local backend. Pending jobs are lost on restart."""
+
+    def __init__(self, maxsize: int = BACKGROUND_JOB_QUEUE_SIZE):
+        self.maxsize = maxsize
+        self._pending: Dict[int, dict] = {}
+        self._ids = itertools.count(1)
+        self.failed = []
+
+    async def put(self, job: dict) -> bool:
+        if len(self._pending) >= self.maxsize:
+            return False
+        job["_id"] = next(self._ids)
+        self._pending[job["_id"]] = job
+        return True
+
+    async def claim(self) -> Optional[dict]:
+        now = datetime.utcnow()
+        ready = [job for job in self._pending.values() if job["run_at"] <= now]
+        if not ready:
+            return None
+        job = min(ready, key=lambda j: (j["run_at"], j["_id"]))
+        del self._pending[job["_id"]]
+        job["attempts"] += 1
+        return job
+
+    async def complete(self, job: dict):
+        pass
+
+    async def retry(self, job: dict, run_at: datetime, error: str):
+        job.update(run_at=run_at, last_error=error)
+        self._pending[job["_id"]] = job
+
+    async def fail(self, job: dict, error: str):
+        job["last_error"] = error
+        self.failed.append(job)
+
+    async def depth(self) -> int:
+        return len(self._pending)
+
+
+class MongoJobBackend:
+    """
+    Durable backend on the `background_jobs` collection. Jobs are claimed with a lease,
+    so jobs held by a crashed process become claimable again once the lease expires.
+    Finished jobs are deleted; jobs out of attempts stay behind with status "failed".
+    """
+
+    def __init__(self, collection=None, maxsize: int = BACKGROUND_JOB_QUEUE_SIZE):
+        self.collection = collection if collection is not None else background_jobs_collection
+        self.maxsize = maxsize
+        self._depth = 0
+        self._depth_checked = 0.0
+
+    async def put(self, job: dict) -> bool:
+        # The depth check is refreshed at most once a second to keep enqueue to one write.
+        if time.monotonic() - self._depth_checked > 1.0:
+            await self.depth()
+        if self._depth >= self.maxsize:
+            return False
+        job["status"] = "pending"
+        await self.collection.insert_one(job)
+        self._depth += 1
+        return True
+
+    async def claim(self) -> Optional[dict]:
+        now = datetime.utcnow()
+        return await self.collection.find_one_and_update(
+            {
+                "$or": [
+                    {"status": "pending", "run_at": {"$lte": now}},
+                    {"status": "running", "lease_until": {"$lt": now}},
+                ]
+            },
+            {
+                "$set": {"status": "running", "lease_until": now + timedelta(seconds=BACKGROUND_JOB_LEASE_SECONDS)},
+                "$inc": {"attempts": 1},
+            },
+            sort=[("run_at", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    async def complete(self, job: dict):
+        await self.collection.delete_one({"_id": job["_id"]})
+
+    async def retry(self, job: dict, run_at: datetime, error: str):
+        await self.collection.update_one(
+            {"_id": job["_id"]},
+            {"$set": {"status": "pending", "run_at": run_at, "last_error": error}, "$unset": {"lease_until": ""}},
+        )
+
+    async def fail(self, job: dict, error: str):
+        await self.collection.update_one(
+            {"_id": job["_id"]},
+            {"$set": {"status": "failed", "last_error": error, "failed_at": datetime.utcnow()}, "$unset": {"lease_until": ""}},
+        )
+
+    async def depth(self) -> int:
+        self._depth = await self.collection.count_documents({"status": {"$in": ["pending", "running"]}})
+        self._depth_checked = time.monotonic()
+        return self._depth
+
+
+def _make_backend():
+    if BACKGROUND_JOB_BACKEND == "memory":
+        return InMemoryJobBackend()
+    return MongoJobBackend()
+
+
+# --- Queue & workers ---
+
+class BackgroundJobQueue:
+    """
+    Runs registered jobs on a fixed pool of worker tasks, below foreground traffic:
+    a worker waits (up to BACKGROUND_JOB_MAX_DEFER) while too many foreground
+    requests are in flight before it claims the next job.
+    """
+
+    def __init__(self, backend=None, workers: int = BACKGROUND_JOB_WORKERS):
+        self.backend = backend if backend is not None else _make_backend()
+        self.workers = workers
+        self._tasks = []
+        self._stopping = False
+        self._wake = asyncio.Event()
+        self._foreground_in_flight = 0
+        self._foreground_idle = asyncio.Event()
+        self._foreground_idle.set()
+        self._stats = {
+            "enqueued": 0,
+            "rejected": 0,
+            "completed": 0,
+            "retried": 0,
+            "failed": 0,
+            "in_flight": 0,
+            "deferred": 0,
+        }
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    # Foreground tracking
+    def foreground_started(self):
+        self._foreground_in_flight += 1
+        if self._foreground_in_flight >= BACKGROUND_JOB_FOREGROUND_THRESHOLD:
+            self._foreground_idle.clear()
+
+    def foreground_finished(self):
+        self._foreground_in_flight -= 1
+        if self._foreground_in_flight < BACKGROUND_JOB_FOREGROUND_THRESHOLD:
+            self._foreground_idle.set()
+
+    async def enqueue(self, name: str, **kwargs) -> bool:
+        """Queues a job; returns False if the queue is full or the backend is unavailable."""
+        if name not in _handlers:
+            raise ValueError(f"Unknown background job: {name}")
+        now = datetime.utcnow()
+        job = {"name": name, "kwargs": kwargs, "attempts": 0, "run_at": now, "created_at": now}
+        try:
+            accepted = await self.backend.put(job)
+        except Exception as e:
+            logger.error("Could not enqueue background job %s: %s", name, e)
+            accepted = False
+        if not accepted:
+            self._stats["rejected"] += 1
+            logger.warning("Background job %s rejected (queue full or unavailable)", name)
+            return False
+        self._stats["enqueued"] += 1
+        self._wake.set()
+        return True
+
+    async def start(self):
+        if self.running:
+            return
+        self._stopping = False
+        self._tasks = [
+            asyncio.create_task(self._worker(), name=f"background-job-worker-{i}")
+            for i in range(self.workers)
+        ]
+        logger.info("Background job queue started with %d workers (%s backend)", self.workers, type(self.backend).__name__)
+
+    async def stop(self, timeout: float = BACKGROUND_JOB_SHUTDOWN_TIMEOUT):
+        """Lets running jobs finish within `timeout`, then cancels the workers."""
+        if not self.running:
+            return
+        self._stopping = True
+        self._wake.set()
+        self._foreground_idle.set()
+        _, pending = await asyncio.wait(self._tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        self._tasks = []
+
+    async def _worker(self):
+        while not self._stopping:
+            if not self._foreground_idle.is_set():
+                self._stats["deferred"] += 1
+                try:
+                    await asyncio.wait_for(self._foreground_idle.wait(), BACKGROUND_JOB_MAX_DEFER)
+                except asyncio.TimeoutError:
+                    pass
+
+            try:
+                job = await self.backend.claim()
+            except Exception as e:
+                logger.error("Background job backend unavailable: %s", e)
+                job = None
+
+            if job is None:
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), BACKGROUND_JOB_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            await self._run(job)
+
+    async def _run(self, job: dict):
+        name = job["name"]
+        handler = _handlers.get(name)
+        self._stats["in_flight"] += 1
+        try:
+            if handler is None:
+                raise LookupError(f"No handler registered for {name}")
+            await handler(**job.get("kwargs", {}))
+        except Exception as e:
+            error = f"{e.__class__.__name__}: {e}"
+            if handler is not None and job["attempts"] < BACKGROUND_JOB_MAX_ATTEMPTS:
+                delay = _retry_delay(job["attempts"])
+                self._stats["retried"] += 1
+                logger.warning("Background job %s failed (attempt %d), retrying in %.1fs: %s", name, job["attempts"], delay, error)
+                await self._settle(self.backend.retry(job, datetime.utcnow() + timedelta(seconds=delay), error))
+            else:
+                self._stats["failed"] += 1
+                logger.error("Background job %s failed permanently after %d attempts: %s", name, job["attempts"], error)
+                await self._settle(self.backend.fail(job, error))
+        else:
+            self._stats["completed"] += 1
+            await self._settle(self.backend.complete(job))
+        finally:
+            self._stats["in_flight"] -= 1
+
+    async def _settle(self, operation: Awaitable):
+        # Bookkeeping errors are logged; the lease makes the job claimable again.
+        try:
+            await operation
+        except Exception as e:
+            logger.error("Could not update background job state: %s", e)
+
+    async def stats(self) -> dict:
+        try:
+            depth = await self.backend.depth()
+        except Exception:
+            depth = None
+        return {
+            **self._stats,
+            "depth": depth,
+            "max_depth": self.backend.maxsize,
+            "workers": self.workers if self.running else 0,
+            "foreground_in_flight": self._foreground_in_flight,
+        }
+
+
+job_queue = BackgroundJobQueue()
+
+
+async def enqueue_job(name: str, **kwargs) -> bool:
+    return await job_queue.enqueue(name, **kwargs)
+
+
+async def start_background_jobs():
+    await job_queue.start()
+
+
+async def stop_background_jobs():
+    await job_queue.stop()
+
+
+async def get_background_job_stats() -> dict:
+    return await job_queue.stats()
+
+
+class ForegroundTrackingMiddleware:
+    """
+    ASGI middleware that counts in-flight requests under the given path prefixes
+    (including streamed response bodies) so background workers can yield to them.
+    """
+
+    def __init__(self, app, prefixes=("/api/v1/chat",)):
+        self.app = app
+        self.prefixes = tuple(prefixes)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(self.prefixes):
+            await self.app(scope, receive, send)
+            return
+        job_queue.foreground_started()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            job_queue.foreground_finished()
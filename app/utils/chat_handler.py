@@ -1,62 +1,82 @@
 
 from decouple import config
 import logging
-from groq import AsyncGroq, GroqError
-import json
- 
+from groq import AsyncGroq
+
+from app.utils.llm_gateway import LLMResult, Priority
+from app.utils.model_router import ModelRouter, GroqProvider, FakeProvider, routes_from_config
+
+# Retries are owned by the gateway, which also knows about the shared rate limits
 client = AsyncGroq(
     api_key= config("GROQ_API_KEY"),
+    max_retries=0,
 )
  
 SITE_URL = config("SITE_URL", default="http://localhost")
 SITE_TITLE = config("SITE_TITLE", default="Librarian Chatbot")
 
-# Production-ready model but not quite as good as the qwen3-32b
-# MODEL_NAME = "llama-3.1-8b-instant" 
-# Backup model for testing purposes. reasoning_effort="low,medium,high" 
-MODEL_NAME = "openai/gpt-oss-20b" 
-# Default model. Uncomment reasoning_format and reasoning_effort to use qwen3-32b
-# MODEL_NAME = "qwen/qwen3-32b"
 logger = logging.getLogger("llm_client")
- 
-async def generate_response(system_prompt: str, prompt: str) -> str:
-
-    try:
-        logger.info(f"Recieved system prompt: {system_prompt}\n")
-        chat_completion = await client.chat.completions.create(
-                messages=[
-                    {
-                        "role": "system",
-                        "content": system_prompt,
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt,
-                    }
-                ],
-                model=MODEL_NAME,
-                temperature=0.7,
-                max_tokens=250,
-                top_p=0.9,
-                reasoning_format="hidden",
-                reasoning_effort="low"
-            )
-
-        response_content = chat_completion.choices[0].message.content
-        success_response = {
-            "status": "success",
-            "data": {
-                "response": response_content
-            }
-        }
-
-        logger.info(f"LLM response: {response_content}")
-        return json.dumps(success_response)
-
-    except GroqError as e:
-        logger.error(f"Groq API error: {e.__class__.__name__} - {e}")
-        return "[ERROR]: The AI service returned an error. Please check the logs."
-    except Exception as e:
-        logger.error(f"An unexpected error occurred: {e}")
-        return "[ERROR]: The AI service is currently unavailable. Please try again later."
+# Full prompts and replies; sampled in production (see LOG_SAMPLE_RATES)
+payload_logger = logging.getLogger("llm_client.payload")
+
+# Models are chosen per call type by the router; see LLM_ROUTE_* in model_router.py.
+# The "fake" provider answers locally and is meant for tests and load runs.
+router = ModelRouter(
+    routes_from_config(),
+    providers={"groq": GroqProvider(client), "fake": FakeProvider()},
+)
+# Primary chat model, used for prompt budgeting
+MODEL_NAME = router.primary("chat").model
+
+
+async def complete(
+    system_prompt: str,
+    prompt: str,
+    max_tokens: int = 250,
+    priority: Priority = Priority.FOREGROUND,
+    call_type: str = "chat",
+) -> LLMResult:
+    logger.debug("Received system prompt of %d chars", len(system_prompt))
+    result = await router.complete(call_type, system_prompt, prompt, max_tokens, priority)
+    if result.ok:
+        payload_logger.info("LLM response from %s: %s", result.model, result.text)
+    else:
+        logger.error("LLM call failed (%s) after %d attempts: %s", result.error, result.attempts, result.message)
+    return result
+
+
+async def generate_response(
+    system_prompt: str,
+    prompt: str,
+    max_tokens: int = 250,
+    priority: Priority = Priority.FOREGROUND,
+    call_type: str = "chat",
+) -> str:
+    """
+    Returns the JSON envelope {"status": "success", "data": {"response": ...}} or,
+    on failure, {"status": "error", "error": {"code": ..., "message": ...}}.
+    """
+    return (await complete(system_prompt, prompt, max_tokens, priority, call_type)).to_json()
+
+
+async def stream_response(
+    system_prompt: str,
+    prompt: str,
+    priority: Priority = Priority.FOREGROUND,
+    call_type: str = "chat",
+):
+    """
+    Streams the completion and yields text deltas as they arrive.
+    Errors are raised to the caller, which decides how to report them mid-stream.
+    """
+    logger.info("Streaming completion for system prompt of %d chars", len(system_prompt))
+    async for delta in router.stream(call_type, system_prompt, prompt, priority=priority):
+        yield delta
+
+
+def get_llm_gateway_stats() -> dict:
+    return router.providers["groq"].stats()
+
 
+def get_model_router_stats() -> dict:
+    return router.stats()
@@ -2,45 +2,172 @@ import logging
 from datetime import datetime
 from typing import List, Dict
 
-from app.db.connection import chats_collection
+from bson import ObjectId
+from decouple import config
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from app.db.connection import chat_buckets_collection, chats_collection
+from app.utils.metrics import timed
 
 logger = logging.getLogger("chat_retention")
 
-RECENT_MESSAGES_LIMIT = 10 
+RECENT_MESSAGES_LIMIT = 10
+# Messages per bucket document. A bucket is closed once it holds this many messages,
+# so no conversation document grows without bound.
+CHAT_BUCKET_SIZE = max(config("CHAT_BUCKET_SIZE", default=100, cast=int), RECENT_MESSAGES_LIMIT)
+# Attempts to open the next bucket when concurrent turns race for it
+BUCKET_OPEN_RETRIES = 5
+
+
+def new_message(sender: str, message: str, timestamp: datetime = None) -> Dict:
+    # message_id is an ObjectId hex string, so ids sort in creation order.
+    return {
+        "message_id": str(ObjectId()),
+        "text": message,
+        "sender": sender,
+        "timestamp": timestamp or datetime.utcnow(),
+    }
+
+
+async def get_recent_messages(user_id: int, pet_id: int, limit: int = RECENT_MESSAGES_LIMIT) -> List[Dict]:
+    """
+    Returns the last `limit` messages, oldest first, in one round trip. Since a bucket
+    holds at least RECENT_MESSAGES_LIMIT messages, the two newest buckets always cover the window.
+    """
+    buckets_needed = -(-limit // CHAT_BUCKET_SIZE) + 1
+    cursor = chat_buckets_collection.find(
+        {"user_id": user_id, "pet_id": pet_id},
+        projection={"_id": 0, "start_ts": 1, "messages": {"$slice": -limit}},
+        sort=[("start_ts", -1)],
+        limit=buckets_needed,
+    )
+    buckets = await cursor.to_list(length=buckets_needed)
+
+    messages = []
+    for bucket in reversed(buckets):
+        messages.extend(bucket.get("messages", []))
+    return messages[-limit:]
+
+
+async def get_conversation_context(user_id: int, pet_id: int, limit: int = RECENT_MESSAGES_LIMIT) -> Dict:
+    """
+    Returns {"summary": ..., "messages": [...]}: the running summary from the
+    conversation's `chats` header and the last `limit` messages not yet folded into
+    it, oldest first. The bucket query pulls the header in with a $lookup, so this
+    is one round trip.
+    """
+    buckets_needed = -(-limit // CHAT_BUCKET_SIZE) + 1
+    pipeline = [
+        {"$match": {"user_id": user_id, "pet_id": pet_id}},
+        {"$sort": {"start_ts": -1}},
+        {"$limit": buckets_needed},
+        # Joined on user_id (the conversation_header index prefix), then narrowed to this pet
+        {"$lookup": {"from": chats_collection.name, "localField": "user_id", "foreignField": "user_id", "as": "header"}},
+        {"$project": {
+            "_id": 0,
+            "messages": {"$slice": ["$messages", -limit]},
+            "header": {"$map": {
+                "input": {"$filter": {"input": "$header", "as": "h", "cond": {"$eq": ["$$h.pet_id", pet_id]}}},
+                "as": "h",
+                "in": {"summary": "$$h.summary", "summarized_through": "$$h.summarized_through"},
+            }},
+        }},
+    ]
+    buckets = await chat_buckets_collection.aggregate(pipeline).to_list(length=buckets_needed)
 
-async def save_message_and_get_context(
-    user_id: int, 
-    pet_id: int, 
-    sender: str, 
-    message: str
+    messages = []
+    for bucket in reversed(buckets):
+        messages.extend(bucket.get("messages", []))
+    header = (buckets[0]["header"] or [{}])[0] if buckets else {}
+    through = header.get("summarized_through") or ""
+    return {
+        "summary": header.get("summary") or "",
+        "messages": [msg for msg in messages[-limit:] if msg.get("message_id", "") > through],
+    }
+
+
+@timed("save_messages")
+async def save_messages_and_get_context(
+    user_id: int,
+    pet_id: int,
+    messages: List[Dict],
+    limit: int = RECENT_MESSAGES_LIMIT,
 ) -> List[Dict]:
     """
-    Saves a message to chat history and returns a recent slice of the conversation.
-    Fact extraction is handled by the route layer via BackgroundTasks.
+    Atomically appends messages to the conversation's open bucket and returns the
+    recent window from the same find_one_and_update. Opening a bucket and the read
+    right after a bucket rolls over take extra round trips. Pass limit=0 to skip
+    returning the window.
     """
     try:
-        query = {"user_id": user_id, "pet_id": pet_id}
-        msg_obj = {"text": message, "sender": sender, "timestamp": datetime.utcnow()}
-        
-        await chats_collection.update_one(
-            query,
-            {
-                "$push": {"messages": msg_obj},
-                "$set": {"lastUpdatedAt": datetime.utcnow()}
-            },
-            upsert=True
+        bucket = await _append_to_open_bucket(
+            user_id,
+            pet_id,
+            messages,
+            # _id stays in: mongomock (load test) cannot return the AFTER document without it
+            {"count": 1, "messages": {"$slice": -limit}} if limit else {"count": 1},
         )
 
-        updated_document = await chats_collection.find_one(
-            query,
-            projection={"messages": {"$slice": -RECENT_MESSAGES_LIMIT}}
-        )
-        
-        if not updated_document or "messages" not in updated_document:
+        if not limit:
             return []
-
-        return updated_document.get("messages", [])
+        window = (bucket or {}).get("messages", [])
+        if len(window) < limit and (bucket or {}).get("count", 0) < limit:
+            # The bucket was just opened; older messages live in the previous one.
+            return await get_recent_messages(user_id, pet_id, limit)
+        return window
 
     except Exception as e:
-        logger.error(f"Error in save_message_and_get_context for user {user_id}, pet {pet_id}: {e}", exc_info=True)
-        return []
\ No newline at end of file
+        logger.error("Error in save_messages_and_get_context for user %s, pet %s: %s", user_id, pet_id, e, exc_info=True)
+        return []
+
+
+async def _append_to_open_bucket(user_id: int, pet_id: int, messages: List[Dict], projection: Dict) -> Dict:
+    """
+    Appends to the bucket that still has room. When there is none, the next bucket is
+    created by an upsert on its sequence number; the unique (user_id, pet_id, seq)
+    index lets only one of two concurrent turns create it, and the other retries and
+    appends to it (or to the one after, if it filled up meanwhile).
+    """
+    open_filter = {"user_id": user_id, "pet_id": pet_id, "count": {"$lt": CHAT_BUCKET_SIZE}}
+    update = {
+        "$push": {"messages": {"$each": messages}},
+        "$inc": {"count": len(messages)},
+        "$set": {"end_ts": messages[-1]["timestamp"]},
+    }
+    for _ in range(BUCKET_OPEN_RETRIES):
+        bucket = await chat_buckets_collection.find_one_and_update(
+            open_filter,
+            update,
+            sort=[("start_ts", -1)],
+            projection=projection,
+            return_document=ReturnDocument.AFTER,
+        )
+        if bucket is not None:
+            return bucket
+
+        # Buckets migrated from the legacy layout have no seq; numbering starts after them at 0
+        latest = await chat_buckets_collection.find_one(
+            {"user_id": user_id, "pet_id": pet_id, "seq": {"$exists": True}},
+            projection={"_id": 0, "seq": 1},
+            sort=[("seq", -1)],
+        )
+        seq = (latest or {}).get("seq", -1) + 1
+        try:
+            return await chat_buckets_collection.find_one_and_update(
+                {**open_filter, "seq": seq},
+                {
+                    **update,
+                    "$setOnInsert": {
+                        "start_ts": messages[0]["timestamp"],
+                        "first_message_id": messages[0]["message_id"],
+                        "createdAt": datetime.utcnow(),
+                    },
+                },
+                projection=projection,
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+        except DuplicateKeyError:
+            logger.debug("Bucket %d for user %s, pet %s was opened concurrently; retrying", seq, user_id, pet_id)
+    raise RuntimeError(f"Could not open a chat bucket for user {user_id}, pet {pet_id}")
@@ -0,0 +1,192 @@
+import json
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+from decouple import config
+
+from app.db.connection import chat_buckets_collection, chats_collection
+from app.utils.background_jobs import enqueue_job, register_job
+from app.utils.chat_handler import generate_response
+from app.utils.chat_retention import CHAT_BUCKET_SIZE, RECENT_MESSAGES_LIMIT
+from app.utils.llm_gateway import Priority
+
+logger = logging.getLogger("chat_summary")
+
+# Rolling summary: once a conversation has CHAT_SUMMARY_TRIGGER messages that are not
+# in its summary yet, a background job folds all but the newest CHAT_SUMMARY_TAIL of
+# them into the running summary on the `chats` header. Prompts then carry the summary
+# plus the unsummarized tail, so their size stays bounded however long the chat runs.
+CHAT_SUMMARY_ENABLED = config("CHAT_SUMMARY_ENABLED", default=True, cast=bool)
+# Kept at or below the recent window so every unsummarized message still reaches the prompt
+CHAT_SUMMARY_TRIGGER = min(config("CHAT_SUMMARY_TRIGGER", default=RECENT_MESSAGES_LIMIT, cast=int), RECENT_MESSAGES_LIMIT)
+CHAT_SUMMARY_TAIL = min(config("CHAT_SUMMARY_TAIL", default=4, cast=int), CHAT_SUMMARY_TRIGGER - 1)
+# Messages folded per run; a longer backlog is worked off by follow-up runs
+CHAT_SUMMARY_MAX_FOLD = config("CHAT_SUMMARY_MAX_FOLD", default=40, cast=int)
+CHAT_SUMMARY_MAX_WORDS = config("CHAT_SUMMARY_MAX_WORDS", default=150, cast=int)
+CHAT_SUMMARY_MAX_TOKENS = config("CHAT_SUMMARY_MAX_TOKENS", default=300, cast=int)
+# A summary job that has not finished after this long no longer blocks a new one
+CHAT_SUMMARY_STALE_SECONDS = config("CHAT_SUMMARY_STALE_SECONDS", default=600, cast=int)
+
+SUMMARY_SYSTEM_PROMPT = "You are a helpful assistant that summarizes conversations between a pet owner and their virtual pet."
+
+SUMMARY_PROMPT = """
+Update the running summary of the conversation between {owner_name} (the owner) and {pet_name} (their pet).
+Keep facts about the owner, shared experiences, plans, promises and how the owner has been feeling.
+Drop greetings and small talk. Write in the third person, at most {max_words} words.
+
+Current summary:
+{summary}
+
+New messages (oldest first):
+{messages}
+
+Updated summary:
+"""
+
+_summary_stats = {
+    "scheduled": 0,
+    "runs": 0,
+    "folded_messages": 0,
+    "failures": 0,
+}
+
+
+async def note_new_messages(user_id: int, pet_id: int, unsummarized: int, owner_name: str, pet_name: str):
+    """
+    Queues a summary job once `unsummarized` (the messages not in the summary yet,
+    counted from the context the turn already read) reaches CHAT_SUMMARY_TRIGGER.
+    Below the trigger this costs no database call. Never raises.
+    """
+    if not CHAT_SUMMARY_ENABLED or unsummarized < CHAT_SUMMARY_TRIGGER:
+        return
+    try:
+        now = datetime.utcnow()
+        # Claim the run so concurrent turns do not queue the same job twice
+        claimed = await chats_collection.update_one(
+            {
+                "user_id": user_id,
+                "pet_id": pet_id,
+                "$or": [
+                    {"summary_pending_since": None},
+                    {"summary_pending_since": {"$lt": now - timedelta(seconds=CHAT_SUMMARY_STALE_SECONDS)}},
+                ],
+            },
+            {"$set": {"summary_pending_since": now}},
+        )
+        if not claimed.matched_count:
+            # Either a run is already pending or the conversation has no header yet
+            created = await chats_collection.update_one(
+                {"user_id": user_id, "pet_id": pet_id},
+                {"$setOnInsert": {"createdAt": now, "summary_pending_since": now}},
+                upsert=True,
+            )
+            if created.upserted_id is None:
+                return
+        _summary_stats["scheduled"] += 1
+        await enqueue_job(
+            "summarize_conversation",
+            user_id=user_id, pet_id=pet_id, owner_name=owner_name, pet_name=pet_name, pending=unsummarized,
+        )
+    except Exception as e:
+        logger.error("Could not schedule a summary for user %s, pet %s: %s", user_id, pet_id, e)
+
+
+async def _unsummarized_messages(user_id: int, pet_id: int, through: str, count: int) -> List[Dict]:
+    # Only the newest buckets that can hold `count` messages are unwound
+    buckets_needed = -(-count // CHAT_BUCKET_SIZE) + 1
+    pipeline = [
+        {"$match": {"user_id": user_id, "pet_id": pet_id}},
+        {"$sort": {"start_ts": -1}},
+        {"$limit": buckets_needed},
+        {"$unwind": "$messages"},
+        {"$match": {"messages.message_id": {"$gt": through}}},
+        {"$replaceRoot": {"newRoot": "$messages"}},
+        {"$sort": {"message_id": 1}},
+    ]
+    return await chat_buckets_collection.aggregate(pipeline).to_list(length=None)
+
+
+def _render_messages(messages: List[Dict], owner_name: str, pet_name: str) -> str:
+    return "\n".join(
+        f"{owner_name if msg['sender'] == 'user' else pet_name}: {msg['text']}" for msg in messages
+    )
+
+
+@register_job("summarize_conversation")
+async def summarize_conversation_job(user_id: int, pet_id: int, owner_name: str, pet_name: str, pending: int = 0):
+    """
+    Folds the oldest unsummarized messages, up to CHAT_SUMMARY_MAX_FOLD and never the
+    newest CHAT_SUMMARY_TAIL, into the running summary, and queues another run while
+    the backlog is still over the trigger. `pending` is how many unsummarized
+    messages the scheduling turn saw. Raises on LLM or database errors so the job
+    is retried.
+    """
+    _summary_stats["runs"] += 1
+    header = await chats_collection.find_one(
+        {"user_id": user_id, "pet_id": pet_id},
+        projection={"_id": 0, "summary": 1, "summarized_through": 1},
+    ) or {}
+    through = header.get("summarized_through", "")
+    pending = max(pending, CHAT_SUMMARY_TRIGGER)
+    # Before the first summary, history older than the counted messages is left alone
+    messages = (await _unsummarized_messages(user_id, pet_id, through, pending))[-pending:]
+    fold = (messages[:-CHAT_SUMMARY_TAIL] if CHAT_SUMMARY_TAIL else messages)[:CHAT_SUMMARY_MAX_FOLD]
+    if not fold:
+        await chats_collection.update_one(
+            {"user_id": user_id, "pet_id": pet_id},
+            {"$set": {"summary_pending_since": None}},
+        )
+        return
+
+    prompt = SUMMARY_PROMPT.format(
+        owner_name=owner_name,
+        pet_name=pet_name,
+        max_words=CHAT_SUMMARY_MAX_WORDS,
+        summary=header.get("summary") or "(none yet)",
+        messages=_render_messages(fold, owner_name, pet_name),
+    )
+    response_data = json.loads(await generate_response(
+        SUMMARY_SYSTEM_PROMPT,
+        prompt,
+        max_tokens=CHAT_SUMMARY_MAX_TOKENS,
+        priority=Priority.BACKGROUND,
+        call_type="summary",
+    ))
+    if response_data.get("status") == "error":
+        _summary_stats["failures"] += 1
+        error_message = response_data.get("error", {}).get("message", "Unknown AI error")
+        raise RuntimeError(f"Summary LLM call failed for user {user_id}, pet {pet_id}: {error_message}")
+    summary = (response_data.get("data", {}).get("response") or "").strip()
+    if not summary:
+        _summary_stats["failures"] += 1
+        raise RuntimeError(f"Summary LLM call for user {user_id}, pet {pet_id} returned nothing")
+
+    # Only advance if no other run moved the summary in the meantime
+    remaining = len(messages) - len(fold)
+    backlog = remaining >= CHAT_SUMMARY_TRIGGER
+    updated = await chats_collection.update_one(
+        {"user_id": user_id, "pet_id": pet_id, "summarized_through": header.get("summarized_through")},
+        {
+            "$set": {
+                "summary": summary,
+                "summarized_through": fold[-1]["message_id"],
+                "summary_updated_at": datetime.utcnow(),
+                "summary_pending_since": datetime.utcnow() if backlog else None,
+            },
+        },
+    )
+    if not updated.modified_count:
+        return
+    _summary_stats["folded_messages"] += len(fold)
+    logger.info("Folded %d messages into the summary for user %s, pet %s", len(fold), user_id, pet_id)
+    if backlog:
+        _summary_stats["scheduled"] += 1
+        await enqueue_job(
+            "summarize_conversation",
+            user_id=user_id, pet_id=pet_id, owner_name=owner_name, pet_name=pet_name, pending=remaining,
+        )
+
+
+def get_chat_summary_stats() -> dict:
+    return dict(_summary_stats)
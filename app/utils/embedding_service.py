@@ -0,0 +1,211 @@
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+import numpy as np
+from decouple import config
+
+from app.utils.micro_batcher import MicroBatcher
+
+logger = logging.getLogger("embedding_service")
+
+# Sentence embeddings for long-term memory. "onnx" runs an ONNX Runtime export of the
+# model (see scripts/export_embedding_onnx.py), "torch" runs it through
+# sentence-transformers, "auto" picks ONNX whenever an export exists.
+EMBEDDING_MODEL = config("EMBEDDING_MODEL", default="sentence-transformers/all-MiniLM-L6-v2")
+EMBEDDING_BACKEND = config("EMBEDDING_BACKEND", default="auto")
+EMBEDDING_ONNX_DIR = config("EMBEDDING_ONNX_DIR", default=os.path.abspath("./models/all-MiniLM-L6-v2-onnx"))
+EMBEDDING_ONNX_FILE = config("EMBEDDING_ONNX_FILE", default="model.onnx")
+EMBEDDING_MAX_LENGTH = config("EMBEDDING_MAX_LENGTH", default=256, cast=int)
+# Requests from concurrent coroutines are coalesced for up to EMBEDDING_BATCH_WINDOW_MS
+# (or until EMBEDDING_MAX_BATCH texts) and encoded as one batch.
+EMBEDDING_BATCH_WINDOW_MS = config("EMBEDDING_BATCH_WINDOW_MS", default=5, cast=int)
+EMBEDDING_MAX_BATCH = config("EMBEDDING_MAX_BATCH", default=32, cast=int)
+# Inference threads: pool workers running batches, and intra-op threads per batch.
+# Both runtimes release the GIL while computing, so threads are enough here.
+EMBEDDING_WORKERS = config("EMBEDDING_WORKERS", default=1, cast=int)
+EMBEDDING_INTRA_OP_THREADS = config("EMBEDDING_INTRA_OP_THREADS", default=2, cast=int)
+EMBEDDING_CACHE_SIZE = config("EMBEDDING_CACHE_SIZE", default=2048, cast=int)
+
+
+class OnnxBackend:
+    """Mean-pooled, L2-normalized sentence embeddings from an ONNX export with its tokenizer.json."""
+    name = "onnx"
+
+    def __init__(self, model_dir: str = EMBEDDING_ONNX_DIR, model_file: str = EMBEDDING_ONNX_FILE,
+                 threads: int = EMBEDDING_INTRA_OP_THREADS, max_length: int = EMBEDDING_MAX_LENGTH):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = threads
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(
+            os.path.join(model_dir, model_file), options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length)
+        pad_id = self.tokenizer.token_to_id("[PAD]") or 0
+        self.tokenizer.enable_padding(pad_id=pad_id, pad_token="[PAD]")
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        feeds = {
+            "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+            "attention_mask": attention_mask,
+            "token_type_ids": np.array([e.type_ids for e in encodings], dtype=np.int64),
+        }
+        hidden = self.session.run(None, {k: v for k, v in feeds.items() if k in self.input_names})[0]
+        mask = attention_mask[..., None].astype(np.float32)
+        pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        return pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+
+
+class TorchBackend:
+    name = "torch"
+
+    def __init__(self, model_name: str = EMBEDDING_MODEL, threads: int = EMBEDDING_INTRA_OP_THREADS):
+        import torch
+        from sentence_transformers import SentenceTransformer
+
+        torch.set_num_threads(threads)
+        self.model = SentenceTransformer(model_name, device="cpu")
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        return self.model.encode(texts, batch_size=len(texts), normalize_embeddings=True, convert_to_numpy=True)
+
+
+def load_backend(name: str = EMBEDDING_BACKEND):
+    if name == "auto":
+        name = "onnx" if os.path.exists(os.path.join(EMBEDDING_ONNX_DIR, EMBEDDING_ONNX_FILE)) else "torch"
+    if name == "onnx":
+        return OnnxBackend()
+    if name == "torch":
+        return TorchBackend()
+    raise ValueError(f"Unknown EMBEDDING_BACKEND: {name}")
+
+
+class EmbeddingService:
+    """
+    Micro-batches embedding requests from concurrent coroutines and runs each batch on
+    a small thread pool, so inference never blocks the event loop. Recent results are
+    kept in an LRU cache keyed by the exact text.
+    """
+
+    def __init__(
+        self,
+        backend: str = EMBEDDING_BACKEND,
+        window_ms: int = EMBEDDING_BATCH_WINDOW_MS,
+        max_batch: int = EMBEDDING_MAX_BATCH,
+        workers: int = EMBEDDING_WORKERS,
+        cache_size: int = EMBEDDING_CACHE_SIZE,
+    ):
+        self.backend_name = backend
+        self._batcher = MicroBatcher("embedding-batcher", self._process, window_ms, max_batch)
+        self.workers = workers
+        self.cache_size = cache_size
+        self.backend = None
+        self.failed = False
+        self._cache: OrderedDict = OrderedDict()
+        self._executor: ThreadPoolExecutor = None
+        self._stats = {
+            "requests": 0,
+            "cache_hits": 0,
+            "batches": 0,
+            "batched_texts": 0,
+            "inference_seconds": 0.0,
+        }
+
+    @property
+    def running(self) -> bool:
+        return self._batcher.running
+
+    async def start(self):
+        """Loads the model on the pool and starts batching. A load failure sets `failed`."""
+        if self.running:
+            return
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="embedding")
+        if self.backend is None:
+            try:
+                self.backend = await asyncio.get_running_loop().run_in_executor(
+                    self._executor, load_backend, self.backend_name
+                )
+            except Exception as e:
+                self.failed = True
+                logger.warning("Embedding backend %r unavailable: %s", self.backend_name, e)
+                return
+        self._batcher.start()
+        logger.info(
+            "Embedding service started (backend=%s, window=%sms, max_batch=%s)",
+            self.backend.name, int(self._batcher.window * 1000), self._batcher.max_size,
+        )
+
+    async def stop(self):
+        """Stops batching, finishes queued requests and shuts the pool down."""
+        # Every submitted text is encoded before the pool goes away
+        await self._batcher.stop()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    async def embed(self, text: str) -> List[float]:
+        self._stats["requests"] += 1
+        cached = self._cache.get(text)
+        if cached is not None:
+            self._cache.move_to_end(text)
+            self._stats["cache_hits"] += 1
+            return cached.tolist()
+        if not self.running:
+            raise RuntimeError("Embedding service is not running")
+        return (await self._batcher.submit(text)).tolist()
+
+    async def embed_many(self, texts: List[str]) -> List[List[float]]:
+        return list(await asyncio.gather(*(self.embed(text) for text in texts)))
+
+    def _remember(self, text: str, vector: np.ndarray):
+        if self.cache_size <= 0:
+            return
+        self._cache[text] = vector
+        self._cache.move_to_end(text)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    async def _process(self, batch: list):
+        # Identical texts in one window are encoded once
+        unique = list(dict.fromkeys(text for text, _ in batch))
+        started = time.perf_counter()
+        vectors = await asyncio.get_running_loop().run_in_executor(self._executor, self.backend.encode, unique)
+        self._stats["inference_seconds"] += time.perf_counter() - started
+        self._stats["batches"] += 1
+        self._stats["batched_texts"] += len(unique)
+
+        by_text = {}
+        for text, vector in zip(unique, np.asarray(vectors, dtype=np.float32)):
+            by_text[text] = vector
+            self._remember(text, vector)
+        for text, future in batch:
+            if not future.done():
+                future.set_result(by_text[text])
+
+    def stats(self) -> dict:
+        stats = dict(self._stats)
+        stats["backend"] = self.backend.name if self.backend else None
+        stats["cache_size"] = len(self._cache)
+        stats["avg_batch_size"] = round(stats["batched_texts"] / stats["batches"], 2) if stats["batches"] else 0.0
+        stats["inference_seconds"] = round(stats["inference_seconds"], 3)
+        return stats
+
+
+embedding_service = EmbeddingService()
+
+
+def get_embedding_stats() -> dict:
+    return embedding_service.stats()
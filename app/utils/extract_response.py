@@ -1,23 +1,138 @@
 import re
 
-def extract_response_features(text):
-    valid_emotions = [
-        "happy", "sad", "curious", "anxious", "excited", 
-        "sleepy", "loving", "surprised", "confused", "content"
-    ]
+VALID_EMOTIONS = [
+    "happy", "sad", "curious", "anxious", "excited",
+    "sleepy", "loving", "surprised", "confused", "content"
+]
+
+EMOTION_PATTERN = re.compile(r'\((%s)\)' % '|'.join(VALID_EMOTIONS))
+MOTION_PATTERN = re.compile(r'\{([^}]+)\}')
+SOUND_PATTERN = re.compile(r'<([^>]+)>')
 
-    emotion_pattern = r'\((%s)\)' % '|'.join(valid_emotions)
+def extract_response_features(text):
+    emotions = EMOTION_PATTERN.findall(text)
 
-    emotions = re.findall(emotion_pattern, text)
-     
-    motions = re.findall(r'\{([^}]+)\}', text)
-    sounds = re.findall(r'<([^>]+)>', text)
+    motions = MOTION_PATTERN.findall(text)
+    sounds = SOUND_PATTERN.findall(text)
 
-    # emojis = re.findall(r'[\U0001F600-\U0001F64F]', text)  
+    # emojis = re.findall(r'[\U0001F600-\U0001F64F]', text)
 
     return {
         "motions": motions,
         "sounds": sounds,
-        "emotions": emotions   
+        "emotions": emotions
     }
 
+
+# --- Streaming ---
+
+_TAG_PATTERNS = (
+    ("emotion", "(", EMOTION_PATTERN),
+    ("motion", "{", MOTION_PATTERN),
+    ("sound", "<", SOUND_PATTERN),
+)
+_CLOSERS = {"motion": "}", "sound": ">"}
+_EMOTION_TAGS = tuple(f"({emotion})" for emotion in VALID_EMOTIONS)
+
+
+def _may_complete(kind: str, text: str, start: int) -> bool:
+    # Whether more text could still turn the opener at `start` into a tag
+    if kind == "emotion":
+        fragment = text[start:start + len(max(_EMOTION_TAGS, key=len))]
+        return any(tag.startswith(fragment) for tag in _EMOTION_TAGS)
+    return text.find(_CLOSERS[kind], start + 1) == -1
+
+
+class StreamingFeatureParser:
+    """
+    Incremental counterpart of extract_response_features for streamed replies.
+
+    feed() takes raw LLM deltas and returns a list of events:
+      ("feature", {"type": "emotion" | "motion" | "sound", "value": str})
+      ("delta", str)
+    Features are reported as soon as their closing bracket arrives. Text deltas
+    concatenate to the same cleaned text the non-streaming route returns: a leading
+    "<pet name>:" prefix is dropped and surrounding whitespace is stripped.
+    """
+
+    def __init__(self, pet_name: str = ""):
+        self._prefix_pattern = re.compile(rf"{re.escape(pet_name)}\s*:\s*") if pet_name else None
+        self._pet_name = pet_name
+        self._pending = ""
+        self._started = False
+        self._held_whitespace = ""
+        self._scan_pos = {kind: 0 for kind, _, _ in _TAG_PATTERNS}
+        self.text = ""
+
+    def feed(self, delta: str) -> list:
+        if not self._started:
+            self._pending += delta
+            if not self._resolve_prefix():
+                return []
+            delta, self._pending = self._pending.lstrip(), ""
+            self._started = True
+            if not delta:
+                return []
+        return self._emit(delta)
+
+    def close(self) -> list:
+        """Flushes anything still held back once the stream ends."""
+        if not self._started:
+            self._started = True
+            remaining, self._pending = self._pending, ""
+            if self._prefix_pattern:
+                remaining = self._prefix_pattern.sub("", remaining, count=1)
+            remaining = remaining.strip()
+            return self._emit(remaining) if remaining else []
+        return []
+
+    def _resolve_prefix(self) -> bool:
+        # Returns True once we know whether the reply starts with the pet-name prefix.
+        if self._prefix_pattern is None:
+            return bool(self._pending.strip())
+        pending = self._pending
+        match = self._prefix_pattern.match(pending)
+        if match:
+            if match.end() == len(pending):
+                return False  # more whitespace might follow the colon
+            self._pending = pending[match.end():]
+            return True
+        if self._pet_name.startswith(pending) or re.fullmatch(rf"{re.escape(self._pet_name)}\s*", pending):
+            return False
+        return bool(pending.strip())
+
+    def _emit(self, delta: str) -> list:
+        events = []
+        body = self._held_whitespace + delta
+        stripped = body.rstrip()
+        self._held_whitespace = body[len(stripped):]
+        if stripped:
+            self.text += stripped
+            events.append(("delta", stripped))
+        events = self._scan_features() + events
+        return events
+
+    def _scan_features(self) -> list:
+        # Each kind is scanned on its own, like the three findall calls in
+        # extract_response_features, so an unclosed "<" never hides a later {motion}.
+        found = []
+        text = self.text
+        for kind, opener, pattern in _TAG_PATTERNS:
+            pos = self._scan_pos[kind]
+            while True:
+                start = text.find(opener, pos)
+                if start == -1:
+                    pos = len(text)
+                    break
+                match = pattern.match(text, start)
+                if match:
+                    found.append((start, kind, match.group(1)))
+                    pos = match.end()
+                elif _may_complete(kind, text, start):
+                    pos = start  # wait for the rest of the tag
+                    break
+                else:
+                    pos = start + 1
+            self._scan_pos[kind] = pos
+        found.sort()
+        return [("feature", {"type": kind, "value": value}) for _, kind, value in found]
@@ -1,10 +1,17 @@
 import logging
 import json
-import asyncio
 import random
+import re
+from decouple import config
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
 from app.db.connection import user_profiles_collection
 from app.utils.chat_handler import generate_response
+from app.utils.llm_gateway import Priority
+from app.utils.background_jobs import register_job
+from app.utils.micro_batcher import MicroBatcher
 from app.utils.prompt_builder import system_prompt
+from app.utils.user_operations import update_cached_profile
 
 logger = logging.getLogger("fact_extractor")
 
@@ -21,78 +28,318 @@ User's message: "{user_message}"
 JSON output:
 """
 
+BATCH_FACT_EXTRACTION_PROMPT = """
+Analyze each of the user messages below and identify personal facts about the person who wrote it, such as their name, gender, location, preferences, likes, or dislikes.
+Messages are independent; never mix facts between ids. Keys inside "facts" should be snake_case.
+- "My name is John" -> {{"name": "John"}}
+- "I love listening to rock music" -> {{"favorite_music": "rock"}}
+- A message with no personal facts -> {{}}
+
+Messages (JSON):
+{items_json}
+
+Return only valid JSON of the form {{"results": [{{"id": <id>, "facts": {{...}}}}]}} with one entry per id.
+
+JSON output:
+"""
+
+# --- Micro-batching ---
+# Pending messages from all users are coalesced for up to FACT_BATCH_WINDOW_MS (or until
+# FACT_BATCH_MAX_SIZE messages) and sent to the LLM as one multi-item prompt.
+FACT_BATCH_ENABLED = config("FACT_BATCH_ENABLED", default=True, cast=bool)
+FACT_BATCH_WINDOW_MS = config("FACT_BATCH_WINDOW_MS", default=250, cast=int)
+FACT_BATCH_MAX_SIZE = config("FACT_BATCH_MAX_SIZE", default=20, cast=int)
+# Output tokens allowed per batched message (plus a fixed allowance for the wrapper)
+FACT_BATCH_TOKENS_PER_ITEM = config("FACT_BATCH_TOKENS_PER_ITEM", default=60, cast=int)
+
+# --- Local pre-filter ---
+# A cheap rule-based score of how likely a message states first-person facts.
+# Messages scoring below the threshold never reach the LLM.
+FACT_PREFILTER_ENABLED = config("FACT_PREFILTER_ENABLED", default=True, cast=bool)
+FACT_PREFILTER_THRESHOLD = config("FACT_PREFILTER_THRESHOLD", default=0.5, cast=float)
+
+_FACT_SIGNALS = [
+    (re.compile(r"\bmy (?:name|birthday|job|work|school|major|hobby|hobbies|favou?rite|wife|husband|partner|"
+                r"boyfriend|girlfriend|kids?|son|daughter|mom|dad|mother|father|brother|sister|family|age|"
+                r"home|hometown|city|country|email|phone)\b", re.I), 1.0),
+    (re.compile(r"\bmy \w+(?: \w+)? (?:is|are|was)\b", re.I), 0.6),
+    (re.compile(r"\b(?:call me|i go by)\b", re.I), 1.0),
+    (re.compile(r"\bi (?:live|work|study|teach|was born|grew up|moved)\b", re.I), 1.0),
+    (re.compile(r"\bi(?:'m| am) (?:a|an|from|in|at|\d+|married|single|learning|studying|working)\b", re.I), 0.8),
+    (re.compile(r"\bi (?:really )?(?:love|like|hate|prefer|enjoy|dislike|adore|can't stand)\b", re.I), 0.8),
+    (re.compile(r"\bi (?:have|own|got) (?:a|an|two|three|\d+)\b", re.I), 0.6),
+    (re.compile(r"\b\d{1,3} (?:years?|yrs?) old\b", re.I), 1.0),
+    (re.compile(r"\b(?:i'm|i am|im) \w+", re.I), 0.3),
+    (re.compile(r"\bmy\b", re.I), 0.3),
+]
+_LATIN_LETTER = re.compile(r"[A-Za-z]")
+_ANY_LETTER = re.compile(r"[^\W\d_]")
+
+_extraction_stats = {
+    "checked": 0,
+    "skipped_by_prefilter": 0,
+    "llm_calls": 0,
+    "batches": 0,
+    "batched_messages": 0,
+}
+
+
+def score_fact_likelihood(user_message: str) -> float:
+    """
+    Scores a message from 0.0 to 1.0 by summing the weights of the first-person
+    fact patterns it contains.
+    """
+    text = (user_message or "").strip()
+    if len(text) < 4:
+        return 0.0
+
+    letters = _ANY_LETTER.findall(text)
+    latin = _LATIN_LETTER.findall(text)
+    if letters and len(latin) < len(letters) / 2:
+        # The rules are English-only; let other languages through to the LLM.
+        return 1.0
+
+    score = sum(weight for pattern, weight in _FACT_SIGNALS if pattern.search(text))
+    return min(score, 1.0)
+
+
+def might_contain_facts(user_message: str) -> bool:
+    if not FACT_PREFILTER_ENABLED:
+        return True
+    return score_fact_likelihood(user_message) >= FACT_PREFILTER_THRESHOLD
+
+
+def get_fact_extraction_stats() -> dict:
+    stats = dict(_extraction_stats)
+    stats["skip_rate"] = round(stats["skipped_by_prefilter"] / stats["checked"], 4) if stats["checked"] else 0.0
+    return stats
+
+def _field_name(key) -> str:
+    # Keys come from the LLM; "." would nest and a leading "$" is rejected by Mongo
+    return re.sub(r"[.$\s]+", "_", str(key)).strip("_")
+
+
+def _build_update_fields(extracted_facts: dict) -> dict:
+    update_fields = {}
+    for key, value in extracted_facts.items():
+        field = _field_name(key)
+        if field:
+            update_fields[f"biography.{field}"] = value
+
+    if "name" in extracted_facts:
+        # Also update the top-level first_name field for convenience
+        update_fields["first_name"] = extracted_facts["name"]
+    return update_fields
+
+
+def _parse_json_object(llm_output: str):
+    # Finds the first '{' and the last '}' to isolate the JSON object
+    json_str = (llm_output or "").strip()
+    start = json_str.find('{')
+    end = json_str.rfind('}')
+    if start == -1 or end == -1:
+        return None
+    return json.loads(json_str[start : end + 1])
+
+
+def passes_prefilter(user_id: int, user_message: str) -> bool:
+    """might_contain_facts plus the skip-rate bookkeeping; callers run it before queueing work."""
+    _extraction_stats["checked"] += 1
+    if not might_contain_facts(user_message):
+        _extraction_stats["skipped_by_prefilter"] += 1
+        logger.debug("Fact extraction skipped by pre-filter for user_id %s", user_id)
+        return False
+    return True
+
+
+async def _extract_user_facts(user_id: int, user_message: str):
+    """
+    Extracts facts from one message and saves them, through the shared micro-batcher
+    when it is running. Raises when the LLM call or the write fails, so the job
+    queue can retry; unusable LLM output is logged and dropped.
+    """
+    if fact_batcher.running:
+        await fact_batcher.submit(user_id, user_message)
+        return
+
+    logger.info("BACKGROUND TASK: Starting fact extraction for user_id %s", user_id)
+
+    build_system_prompt =  f"You are a helpful assistant that extracts personal facts about the user from their messages."
+    prompt = FACT_EXTRACTION_PROMPT.format(user_message=user_message)
+
+    # ---> 1. This now returns a JSON STRING, not plain text
+    _extraction_stats["llm_calls"] += 1
+    llm_json_string = await generate_response(
+        build_system_prompt, prompt, priority=Priority.BACKGROUND, call_type="fact_extraction"
+    )
+
+    # ---> 2. Parse the outer JSON from generate_response
+    response_data = json.loads(llm_json_string)
+
+    # ---> 3. Check for errors and get the actual content
+    if response_data.get("status") == "error":
+        error_message = response_data.get("error", {}).get("message", "Unknown AI error")
+        raise RuntimeError(f"LLM call failed inside fact_extractor for user_id {user_id}. API Error: {error_message}")
+
+    # This is the string we actually want to process (e.g., `{"name": "John"}`)
+    actual_llm_output = response_data.get("data", {}).get("response")
+
+    if not actual_llm_output:
+        logger.warning("LLM response for user %s was empty or malformed.", user_id)
+        return
+
+    # ---> 4. Isolate and parse the JSON object in the LLM output
+    try:
+        extracted_facts = _parse_json_object(actual_llm_output)
+    except json.JSONDecodeError:
+        logger.warning("Fact extractor could not parse final JSON from LLM response for user %s: %s", user_id, actual_llm_output)
+        return
+
+    if extracted_facts is None:
+        logger.warning("Could not find a JSON object in the LLM response for user %s: %s", user_id, actual_llm_output)
+        return
+
+    if not isinstance(extracted_facts, dict) or not extracted_facts:
+        logger.info("No new facts to save for user_id: %s", user_id)
+        return
+
+    logger.info("Found facts for user_id %s: %s", user_id, extracted_facts)
+
+    update_fields = _build_update_fields(extracted_facts)
+    if not update_fields:
+        logger.info("No usable fact keys for user_id %s", user_id)
+        return
+
+    await user_profiles_collection.update_one(
+        {"user_id": user_id},
+        {"$set": update_fields}
+    )
+    update_cached_profile(user_id, update_fields)
+    logger.info("BACKGROUND TASK FINISHED SUCCESSFULLY for user_id %s.", user_id)
+
+
 async def extract_and_save_user_facts(user_id: int, user_message: str):
     """
     Analyzes a user's message to find personal facts and saves them to their
-    user_profile document. This function is now robust against API errors.
+    user_profile document. Never raises; use the "extract_user_facts" job for retries.
     """
+    if not passes_prefilter(user_id, user_message):
+        return
     try:
-        logger.info(f"BACKGROUND TASK: Starting fact extraction for user_id {user_id}")
-        
-        # Optional: Keep a small delay if you want to avoid rate-limiting
-        # await asyncio.sleep(random.uniform(1.0, 1.5))
-
-        build_system_prompt =  f"You are a helpful assistant that extracts personal facts about the user from their messages."
-        prompt = FACT_EXTRACTION_PROMPT.format(user_message=user_message)
-        
-        # ---> 1. This now returns a JSON STRING, not plain text
-        llm_json_string = await generate_response(build_system_prompt,prompt)
-
-        # ---> 2. Parse the outer JSON from generate_response
-        response_data = json.loads(llm_json_string)
+        await _extract_user_facts(user_id, user_message)
+    except Exception:
+        # This will catch ANY unexpected error
+        logger.error(
+            "--- FATAL ERROR IN BACKGROUND TASK for user_id %s ---", user_id,
+            exc_info=True  # This includes the full error traceback in your logs
+        )
 
-        # ---> 3. Check for errors and get the actual content
-        if response_data.get("status") == "error":
-            error_message = response_data.get("error", {}).get("message", "Unknown AI error")
-            logger.error(f"LLM call failed inside fact_extractor for user_id {user_id}. API Error: {error_message}")
-            return
-        
-        # This is the string we actually want to process (e.g., `{"name": "John"}`)
-        actual_llm_output = response_data.get("data", {}).get("response")
-        
-        if not actual_llm_output:
-            logger.warning(f"LLM response for user {user_id} was empty or malformed.")
-            return
 
-        # ---> 4. Make the JSON cleanup much more robust to prevent crashes
-        # It finds the first '{' and the last '}' to isolate the JSON object
-        json_str = actual_llm_output.strip()
-        start = json_str.find('{')
-        end = json_str.rfind('}')
-        
-        if start == -1 or end == -1:
-            logger.warning(f"Could not find a JSON object in the LLM response for user {user_id}: {json_str}")
-            return
-            
-        json_str = json_str[start : end + 1]
+@register_job("extract_user_facts")
+async def extract_user_facts_job(user_id: int, user_message: str):
+    # Enqueued only for messages that passed the pre-filter
+    await _extract_user_facts(user_id, user_message)
+
 
-        # ---> 5. Now, parse the cleaned, extracted JSON string
-        extracted_facts = json.loads(json_str)
+class FactExtractionBatcher:
+    """
+    Coalesces fact-extraction requests from many users into one LLM call per window
+    and writes the results back with a single bulk_write.
+    """
+
+    def __init__(self, window_ms: int = FACT_BATCH_WINDOW_MS, max_size: int = FACT_BATCH_MAX_SIZE):
+        self._batcher = MicroBatcher("fact-extraction-batcher", self._process, window_ms, max_size)
 
-        if not isinstance(extracted_facts, dict) or not extracted_facts:
-            logger.info("No new facts to save for user_id: %s", user_id)
+    @property
+    def running(self) -> bool:
+        return self._batcher.running
+
+    async def start(self):
+        if self.running:
             return
+        self._batcher.start()
+        logger.info(
+            "Fact extraction batcher started (window=%sms, max_size=%s)",
+            int(self._batcher.window * 1000), self._batcher.max_size,
+        )
 
-        logger.info(f"Found facts for user_id {user_id}: {extracted_facts}")
-        
-        update_fields = {f"biography.{key}": value for key, value in extracted_facts.items()}
-        
-        if "name" in extracted_facts:
-            # Also update the top-level first_name field for convenience
-            update_fields["first_name"] = extracted_facts["name"]
-
-        await user_profiles_collection.update_one(
-            {"user_id": user_id},
-            {"$set": update_fields}
+    async def stop(self):
+        """Stops accepting work and flushes whatever is still queued."""
+        await self._batcher.stop()
+
+    async def submit(self, user_id: int, user_message: str) -> dict:
+        """Queues one message and waits for the facts extracted from it."""
+        return await self._batcher.submit((user_id, user_message))
+
+    async def _process(self, batch: list):
+        results = await self._extract_batch([message for (_, message), _ in batch])
+        failed = await self._save([item for item, _ in batch], results)
+        for ((user_id, _), future), facts in zip(batch, results):
+            if future.done():
+                continue
+            if user_id in failed:
+                future.set_exception(RuntimeError(f"Saving facts for user {user_id} failed: {failed[user_id]}"))
+            else:
+                future.set_result(facts)
+
+    async def _extract_batch(self, messages: list) -> list:
+        items_json = json.dumps([{"id": i, "message": message} for i, message in enumerate(messages)], ensure_ascii=False)
+        build_system_prompt = "You are a helpful assistant that extracts personal facts about users from their messages."
+        prompt = BATCH_FACT_EXTRACTION_PROMPT.format(items_json=items_json)
+
+        _extraction_stats["llm_calls"] += 1
+        _extraction_stats["batches"] += 1
+        _extraction_stats["batched_messages"] += len(messages)
+        llm_json_string = await generate_response(
+            build_system_prompt,
+            prompt,
+            max_tokens=50 + FACT_BATCH_TOKENS_PER_ITEM * len(messages),
+            priority=Priority.BACKGROUND,
+            call_type="fact_extraction",
         )
-        logger.info(f"BACKGROUND TASK FINISHED SUCCESSFULLY for user_id {user_id}.")
 
-    except json.JSONDecodeError:
-        # This will catch malformed JSON from the LLM's *actual_llm_output*
-        logger.warning(f"Fact extractor could not parse final JSON from LLM response for user {user_id}: {actual_llm_output}")
-    except Exception as e:
-        # This will catch ANY other unexpected error
-        logger.error(
-            f"--- FATAL ERROR IN BACKGROUND TASK for user_id {user_id} ---",
-            exc_info=True  # This includes the full error traceback in your logs
-        )
\ No newline at end of file
+        response_data = json.loads(llm_json_string)
+        if response_data.get("status") == "error":
+            error_message = response_data.get("error", {}).get("message", "Unknown AI error")
+            raise RuntimeError(f"LLM call failed for fact batch: {error_message}")
+
+        parsed = _parse_json_object(response_data.get("data", {}).get("response"))
+        by_id = {}
+        for entry in (parsed or {}).get("results", []):
+            if isinstance(entry, dict) and isinstance(entry.get("facts"), dict):
+                by_id[str(entry.get("id"))] = entry["facts"]
+        return [by_id.get(str(i), {}) for i in range(len(messages))]
+
+    async def _save(self, batch: list, results: list) -> dict:
+        """
+        Writes the batch's facts with one unordered bulk_write. Returns {user_id: error}
+        for the users whose update was rejected; everyone else's update stands.
+        """
+        # Several messages from the same user are merged; later messages win.
+        updates = {}
+        for (user_id, _), facts in zip(batch, results):
+            fields = _build_update_fields(facts) if facts else {}
+            if fields:
+                updates.setdefault(user_id, {}).update(fields)
+        if not updates:
+            return {}
+        user_ids = list(updates)
+        operations = [UpdateOne({"user_id": user_id}, {"$set": updates[user_id]}) for user_id in user_ids]
+        failed = {}
+        try:
+            await user_profiles_collection.bulk_write(operations, ordered=False)
+        except BulkWriteError as exc:
+            write_errors = exc.details.get("writeErrors", [])
+            if not write_errors:
+                raise
+            for error in write_errors:
+                failed[user_ids[error["index"]]] = error.get("errmsg", "write error")
+            logger.error("Batched fact save rejected for %d of %d users: %s", len(failed), len(user_ids), failed)
+        for user_id, fields in updates.items():
+            if user_id not in failed:
+                update_cached_profile(user_id, fields)
+        logger.info("Saved batched facts for %d users (%d messages)", len(updates) - len(failed), len(batch))
+        return failed
+
+
+fact_batcher = FactExtractionBatcher()
@@ -0,0 +1,319 @@
+import asyncio
+import heapq
+import itertools
+import json
+import logging
+import random
+import time
+from dataclasses import dataclass, field
+from enum import IntEnum
+from typing import AsyncIterator, Dict, Optional
+
+from decouple import config
+from groq import (
+    APIConnectionError,
+    APIStatusError,
+    APITimeoutError,
+    GroqError,
+    InternalServerError,
+    RateLimitError,
+)
+
+logger = logging.getLogger("llm_gateway")
+
+# --- Config ---
+# Provider quota per model. 0 disables that limit.
+LLM_RPM_LIMIT = config("LLM_RPM_LIMIT", default=1000, cast=int)
+LLM_TPM_LIMIT = config("LLM_TPM_LIMIT", default=250000, cast=int)
+LLM_MAX_IN_FLIGHT = config("LLM_MAX_IN_FLIGHT", default=16, cast=int)
+# In-flight slots background calls may never take, so chat always has capacity.
+LLM_FOREGROUND_RESERVE = config("LLM_FOREGROUND_RESERVE", default=4, cast=int)
+# Longest a call waits for admission before failing with "rate_limited".
+LLM_FOREGROUND_QUEUE_TIMEOUT = config("LLM_FOREGROUND_QUEUE_TIMEOUT", default=15.0, cast=float)
+LLM_BACKGROUND_QUEUE_TIMEOUT = config("LLM_BACKGROUND_QUEUE_TIMEOUT", default=120.0, cast=float)
+LLM_MAX_RETRIES = config("LLM_MAX_RETRIES", default=3, cast=int)
+LLM_BACKOFF_BASE = config("LLM_BACKOFF_BASE", default=0.5, cast=float)
+LLM_BACKOFF_MAX = config("LLM_BACKOFF_MAX", default=20.0, cast=float)
+
+
+class Priority(IntEnum):
+    FOREGROUND = 0
+    BACKGROUND = 1
+
+
+@dataclass
+class LLMResult:
+    """Outcome of one gateway call. `error` is None on success."""
+    text: str = ""
+    error: Optional[str] = None  # "rate_limited" | "provider_error" | "unavailable"
+    message: str = ""
+    model: str = ""
+    attempts: int = 0
+    latency: float = 0.0
+    usage: Dict[str, int] = field(default_factory=dict)
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    def to_json(self) -> str:
+        """The {"status": ...} JSON envelope returned by generate_response."""
+        if self.ok:
+            return json.dumps({"status": "success", "data": {"response": self.text}})
+        return json.dumps({"status": "error", "error": {"code": self.error, "message": self.message}})
+
+
+class RateLimitedError(Exception):
+    """Raised by LLMGateway.stream() when a call cannot be admitted or keeps hitting 429."""
+
+
+class TokenBucket:
+    """
+    Refills `limit` units per minute, scaled by `scale` (lowered after a 429).
+    Consumption may go negative when actual usage exceeds the estimate.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.available = float(limit)
+        self.scale = 1.0
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        rate = self.limit * self.scale / 60.0
+        self.available = min(self.limit, self.available + (now - self._updated) * rate)
+        self._updated = now
+
+    def delay(self, amount: float) -> float:
+        """Seconds until `amount` units are available (0 if they are now)."""
+        if not self.limit:
+            return 0.0
+        self._refill()
+        # A single call larger than the bucket only waits for a full bucket.
+        amount = min(amount, self.limit)
+        if self.available >= amount:
+            return 0.0
+        return (amount - self.available) / (self.limit * self.scale / 60.0)
+
+    def consume(self, amount: float):
+        if self.limit:
+            self._refill()
+            self.available -= amount
+
+
+def _estimate_tokens(completion_args: dict) -> int:
+    prompt_chars = sum(len(m.get("content") or "") for m in completion_args.get("messages", []))
+    return prompt_chars // 4 + 1 + completion_args.get("max_tokens", 0)
+
+
+def _retry_after(error: APIStatusError) -> Optional[float]:
+    try:
+        value = error.response.headers.get("retry-after")
+        return float(value) if value is not None else None
+    except (AttributeError, ValueError):
+        return None
+
+
+class LLMGateway:
+    """
+    Admission control in front of one provider model:
+      - request and token buckets for the provider's RPM/TPM quota
+      - at most LLM_MAX_IN_FLIGHT concurrent calls, LLM_FOREGROUND_RESERVE of them
+        kept for foreground calls
+      - waiting calls are admitted in priority order, FIFO within a lane
+      - on 429 the whole gateway pauses for the provider's retry-after and halves its
+        rate; successes restore it gradually (AIMD)
+    """
+
+    def __init__(
+        self,
+        client,
+        model: str,
+        rpm: int = LLM_RPM_LIMIT,
+        tpm: int = LLM_TPM_LIMIT,
+        max_in_flight: int = LLM_MAX_IN_FLIGHT,
+    ):
+        self.client = client
+        self.model = model
+        self.max_in_flight = max_in_flight
+        self._requests = TokenBucket(rpm)
+        self._tokens = TokenBucket(tpm)
+        self._in_flight = 0
+        self._paused_until = 0.0
+        self._waiters = []
+        self._seq = itertools.count()
+        self._cond = asyncio.Condition()
+        self._stats = {
+            "calls": 0,
+            "errors": 0,
+            "rate_limited": 0,
+            "retries": 0,
+            "rejected": 0,
+            "queue_wait_total": 0.0,
+        }
+
+    # --- Admission ---
+
+    def _admission_delay(self, entry, tokens: int) -> Optional[float]:
+        # None means "wait until notified"; 0 means admit now.
+        if self._waiters[0] != entry:
+            return None
+        limit = self.max_in_flight
+        if entry[0] != Priority.FOREGROUND:
+            limit = max(1, limit - LLM_FOREGROUND_RESERVE)
+        if self._in_flight >= limit:
+            return None
+        return max(self._paused_until - time.monotonic(), self._requests.delay(1), self._tokens.delay(tokens), 0.0)
+
+    async def _acquire(self, priority: Priority, tokens: int, timeout: float):
+        entry = (int(priority), next(self._seq))
+        started = time.monotonic()
+        deadline = started + timeout
+        async with self._cond:
+            heapq.heappush(self._waiters, entry)
+            try:
+                while True:
+                    delay = self._admission_delay(entry, tokens)
+                    if delay == 0:
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats["rejected"] += 1
+                        raise RateLimitedError(f"Timed out after {timeout:.0f}s waiting for LLM capacity")
+                    try:
+                        await asyncio.wait_for(self._cond.wait(), min(delay, remaining) if delay is not None else remaining)
+                    except asyncio.TimeoutError:
+                        pass
+                heapq.heappop(self._waiters)
+                self._requests.consume(1)
+                self._tokens.consume(tokens)
+                self._in_flight += 1
+                self._stats["queue_wait_total"] += time.monotonic() - started
+            finally:
+                if entry in self._waiters:
+                    self._waiters.remove(entry)
+                    heapq.heapify(self._waiters)
+                self._cond.notify_all()
+
+    async def _release(self):
+        async with self._cond:
+            self._in_flight -= 1
+            self._cond.notify_all()
+
+    def _on_rate_limited(self, error: RateLimitError, attempt: int) -> float:
+        self._stats["rate_limited"] += 1
+        delay = _retry_after(error) or min(LLM_BACKOFF_BASE * (2 ** attempt), LLM_BACKOFF_MAX)
+        self._paused_until = max(self._paused_until, time.monotonic() + delay)
+        for bucket in (self._requests, self._tokens):
+            bucket.scale = max(0.1, bucket.scale * 0.5)
+        logger.warning("LLM %s rate limited, pausing %.1fs (rate scale %.2f)", self.model, delay, self._requests.scale)
+        return delay
+
+    def _on_success(self, estimated: int, usage) -> Dict[str, int]:
+        for bucket in (self._requests, self._tokens):
+            bucket.scale = min(1.0, bucket.scale + 0.05)
+        if usage is None:
+            return {}
+        # Charge the difference between the estimate and what the call really used.
+        self._tokens.consume(usage.total_tokens - estimated)
+        return {"prompt_tokens": usage.prompt_tokens, "completion_tokens": usage.completion_tokens}
+
+    def _timeout_for(self, priority: Priority) -> float:
+        return LLM_FOREGROUND_QUEUE_TIMEOUT if priority == Priority.FOREGROUND else LLM_BACKGROUND_QUEUE_TIMEOUT
+
+    # --- Calls ---
+
+    async def complete(self, completion_args: dict, priority: Priority = Priority.FOREGROUND) -> LLMResult:
+        """Runs one chat completion. Never raises; failures come back as LLMResult.error."""
+        estimated = _estimate_tokens(completion_args)
+        started = time.monotonic()
+        result = LLMResult(model=self.model)
+        self._stats["calls"] += 1
+
+        for attempt in range(LLM_MAX_RETRIES + 1):
+            result.attempts = attempt + 1
+            try:
+                await self._acquire(priority, estimated, self._timeout_for(priority))
+            except RateLimitedError as e:
+                result.error, result.message = "rate_limited", str(e)
+                break
+            retry_delay = None
+            try:
+                completion = await self.client.chat.completions.create(**completion_args)
+                result.text = completion.choices[0].message.content or ""
+                result.usage = self._on_success(estimated, getattr(completion, "usage", None))
+                result.error = None
+                break
+            except RateLimitError as e:
+                result.error, result.message = "rate_limited", "The AI service is busy. Please try again shortly."
+                retry_delay = self._on_rate_limited(e, attempt)
+            except (APIConnectionError, APITimeoutError, InternalServerError) as e:
+                logger.warning("LLM %s transient error: %s - %s", self.model, e.__class__.__name__, e)
+                result.error, result.message = "unavailable", "The AI service is currently unavailable. Please try again later."
+                retry_delay = min(LLM_BACKOFF_BASE * (2 ** attempt), LLM_BACKOFF_MAX) * random.uniform(0.5, 1.5)
+            except GroqError as e:
+                logger.error("Groq API error: %s - %s", e.__class__.__name__, e)
+                result.error, result.message = "provider_error", "The AI service returned an error. Please check the logs."
+                break
+            except Exception as e:
+                logger.error("An unexpected error occurred: %s", e)
+                result.error, result.message = "unavailable", "The AI service is currently unavailable. Please try again later."
+                break
+            finally:
+                await self._release()
+
+            if attempt < LLM_MAX_RETRIES:
+                self._stats["retries"] += 1
+                # The pause after a 429 is enforced at admission; other errors back off here.
+                if result.error == "unavailable":
+                    await asyncio.sleep(retry_delay)
+
+        if result.error:
+            self._stats["errors"] += 1
+        result.latency = time.monotonic() - started
+        return result
+
+    async def stream(self, completion_args: dict, priority: Priority = Priority.FOREGROUND) -> AsyncIterator[str]:
+        """
+        Streams text deltas. 429s before the first chunk are retried like complete();
+        any other failure is raised to the caller.
+        """
+        estimated = _estimate_tokens(completion_args)
+        self._stats["calls"] += 1
+        for attempt in range(LLM_MAX_RETRIES + 1):
+            await self._acquire(priority, estimated, self._timeout_for(priority))
+            try:
+                try:
+                    stream = await self.client.chat.completions.create(**completion_args, stream=True)
+                except RateLimitError as e:
+                    self._on_rate_limited(e, attempt)
+                    if attempt == LLM_MAX_RETRIES:
+                        raise RateLimitedError("The AI service is busy. Please try again shortly.") from e
+                    self._stats["retries"] += 1
+                    continue
+                async for chunk in stream:
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    if delta:
+                        yield delta
+                self._on_success(estimated, None)
+                return
+            except Exception:
+                self._stats["errors"] += 1
+                raise
+            finally:
+                await self._release()
+
+    def stats(self) -> dict:
+        calls = self._stats["calls"]
+        return {
+            **{k: v for k, v in self._stats.items() if k != "queue_wait_total"},
+            "model": self.model,
+            "in_flight": self._in_flight,
+            "waiting": len(self._waiters),
+            "avg_queue_wait": round(self._stats["queue_wait_total"] / calls, 4) if calls else 0.0,
+            "rate_scale": round(self._requests.scale, 2),
+            "paused_for": round(max(0.0, self._paused_until - time.monotonic()), 2),
+        }
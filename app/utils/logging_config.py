@@ -0,0 +1,155 @@
+import json
+import logging
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+from decouple import config
+
+# "dev": plain text written in place. "production": JSON records handed to a queue and
+# written by a listener thread, so the event loop never blocks on log I/O.
+LOG_MODE = config("LOG_MODE", default="dev")
+LOG_LEVEL = config("LOG_LEVEL", default="INFO")
+LOG_QUEUE_SIZE = config("LOG_QUEUE_SIZE", default=10000, cast=int)
+# Keep this fraction of sub-WARNING records per logger (prefix match, most specific
+# wins), e.g. "llm_client.payload=0.05,app.utils.pet_logic=0". Warnings and errors are
+# never sampled out.
+LOG_SAMPLE_RATES = config(
+    "LOG_SAMPLE_RATES",
+    default="llm_client.payload=0.05,app.api.llm_chat_route.payload=0.05" if LOG_MODE == "production" else "",
+)
+
+TEXT_FORMAT = "%(levelname)s:%(name)s:%(message)s"
+
+# Attributes every LogRecord has; anything else came in through `extra=` and is kept in JSON output
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "taskName"}
+
+_listener = None
+_installed = []
+
+
+def parse_sample_rates(spec: str) -> dict:
+    rates = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, rate = item.partition("=")
+        rates[name.strip()] = min(1.0, max(0.0, float(rate)))
+    return rates
+
+
+class SamplingFilter(logging.Filter):
+    """Drops a share of each configured logger's sub-WARNING records before they are formatted."""
+
+    def __init__(self, rates: dict):
+        super().__init__()
+        self.rates = rates
+        self._resolved = {}
+        self.dropped = 0
+
+    def _rate(self, name: str) -> float:
+        rate = self._resolved.get(name)
+        if rate is None:
+            rate, best = 1.0, -1
+            for prefix, value in self.rates.items():
+                if (name == prefix or name.startswith(prefix + ".")) and len(prefix) > best:
+                    rate, best = value, len(prefix)
+            self._resolved[name] = rate
+        return rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self._rate(record.name)
+        if rate >= 1.0 or random.random() < rate:
+            return True
+        self.dropped += 1
+        return False
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            payload["exc_info"] = record.exc_text
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and key not in payload:
+                payload[key] = value
+        return json.dumps(payload, default=str, ensure_ascii=False)
+
+
+class _DeferredQueueHandler(QueueHandler):
+    """
+    Resolves the message and traceback on the caller's side (the arguments may change
+    after the call) but leaves JSON encoding and the write to the listener thread.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            # A slow sink must not stall the request path; drop instead
+            pass
+
+
+def configure_logging(mode: str = None, level: str = None):
+    """
+    Installs the root handler for the chosen mode and routes uvicorn's loggers through it.
+    Safe to call again; the previous setup is stopped first.
+    """
+    stop_logging()
+    mode = mode or LOG_MODE
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+
+    stream = logging.StreamHandler(sys.stderr)
+    if mode == "production":
+        global _listener
+        stream.setFormatter(JsonFormatter())
+        log_queue = queue.Queue(LOG_QUEUE_SIZE)
+        handler = _DeferredQueueHandler(log_queue)
+        _listener = QueueListener(log_queue, stream, respect_handler_level=True)
+        _listener.start()
+    else:
+        stream.setFormatter(logging.Formatter(TEXT_FORMAT))
+        handler = stream
+
+    rates = parse_sample_rates(LOG_SAMPLE_RATES)
+    if rates:
+        handler.addFilter(SamplingFilter(rates))
+    root.addHandler(handler)
+    root.setLevel(level or LOG_LEVEL)
+    _installed.append(handler)
+
+    if mode == "production":
+        for name in ("uvicorn", "uvicorn.error", "uvicorn.access"):
+            uvicorn_logger = logging.getLogger(name)
+            uvicorn_logger.handlers = []
+            uvicorn_logger.propagate = True
+
+
+def stop_logging():
+    """Flushes queued records and detaches the handlers installed by configure_logging."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+    root = logging.getLogger()
+    while _installed:
+        root.removeHandler(_installed.pop())
@@ -0,0 +1,174 @@
+import asyncio
+import functools
+import logging
+import time
+from bisect import bisect_left
+from typing import Dict, Tuple
+
+from decouple import config
+
+logger = logging.getLogger("metrics")
+
+METRICS_ENABLED = config("METRICS_ENABLED", default=True, cast=bool)
+# Spans go through the OpenTelemetry API; exporting them needs the SDK and OTLP exporter.
+OTEL_ENABLED = config("OTEL_ENABLED", default=False, cast=bool)
+OTEL_SERVICE_NAME = config("OTEL_SERVICE_NAME", default="petpal-ai")
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Histogram:
+    """Prometheus-style histogram with one label; observations are O(log buckets)."""
+
+    def __init__(self, name: str, documentation: str, label: str, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label = label
+        self.buckets = tuple(buckets)
+        self._series: Dict[str, list] = {}
+
+    def observe(self, label_value: str, value: float):
+        series = self._series.get(label_value)
+        if series is None:
+            # per-bucket counts (last slot is +Inf), then sum
+            series = self._series[label_value] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for label_value, series in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'{self.name}_bucket{{{self.label}="{label_value}",le="{le}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{{self.label}="{label_value}"}} {series[-1]:.6f}')
+            lines.append(f'{self.name}_count{{{self.label}="{label_value}"}} {cumulative}')
+        return lines
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, label: str):
+        self.name = name
+        self.documentation = documentation
+        self.label = label
+        self._values: Dict[str, int] = {}
+
+    def inc(self, label_value: str, amount: int = 1):
+        self._values[label_value] = self._values.get(label_value, 0) + amount
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        lines += [f'{self.name}{{{self.label}="{value}"}} {count}' for value, count in sorted(self._values.items())]
+        return lines
+
+
+stage_duration = Histogram(
+    "petpal_stage_duration_seconds", "Time spent in each stage of a chat turn.", "stage"
+)
+stage_errors = Counter(
+    "petpal_stage_errors_total", "Stages that ended with an exception.", "stage"
+)
+
+_tracer = None
+
+
+def setup_tracing(app=None):
+    """
+    Turns on OpenTelemetry spans for stage timers when OTEL_ENABLED is set. With the SDK
+    and OTLP exporter installed, spans are exported (configured through the standard
+    OTEL_EXPORTER_OTLP_* variables) and FastAPI requests are traced too.
+    """
+    global _tracer
+    if not OTEL_ENABLED:
+        return
+    try:
+        from opentelemetry import trace
+    except ImportError:
+        logger.warning("OTEL_ENABLED is set but opentelemetry-api is not installed; tracing stays off")
+        return
+
+    try:
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+        from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
+
+        provider = TracerProvider(resource=Resource.create({"service.name": OTEL_SERVICE_NAME}))
+        provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+        trace.set_tracer_provider(provider)
+    except ImportError:
+        logger.warning("OpenTelemetry SDK or OTLP exporter missing; spans use the globally configured provider")
+
+    if app is not None:
+        try:
+            from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
+            FastAPIInstrumentor.instrument_app(app, excluded_urls="metrics,health.*")
+        except ImportError:
+            pass
+    _tracer = trace.get_tracer("petpal")
+
+
+def shutdown_tracing():
+    if _tracer is None:
+        return
+    from opentelemetry import trace
+    provider = trace.get_tracer_provider()
+    if hasattr(provider, "shutdown"):
+        provider.shutdown()
+
+
+class stage_timer:
+    """
+    Times a block into petpal_stage_duration_seconds{stage=...} and, with tracing on,
+    wraps it in a span of the same name. Works in sync and async code alike:
+
+        with stage_timer("fetch_chat_data"):
+            ...
+    """
+    __slots__ = ("stage", "_started", "_span")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+        self._span = None
+
+    def __enter__(self):
+        if _tracer is not None:
+            self._span = _tracer.start_as_current_span(self.stage)
+            self._span.__enter__()
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if METRICS_ENABLED:
+            stage_duration.observe(self.stage, time.perf_counter() - self._started)
+            if exc_type is not None:
+                stage_errors.inc(self.stage)
+        if self._span is not None:
+            self._span.__exit__(exc_type, exc, tb)
+        return False
+
+
+def timed(stage: str):
+    """Decorator form of stage_timer for sync and async functions."""
+    def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with stage_timer(stage):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage_timer(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def render_metrics() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    lines = stage_duration.render() + stage_errors.render()
+    return "\n".join(lines) + "\n"
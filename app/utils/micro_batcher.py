@@ -0,0 +1,103 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, List, Set, Tuple
+
+logger = logging.getLogger("micro_batcher")
+
+# A batch is a list of (item, future) pairs; the processor resolves the futures.
+Batch = List[Tuple[Any, asyncio.Future]]
+
+
+class MicroBatcher:
+    """
+    Collects submitted items for up to `window_ms` (or until `max_size` are waiting)
+    and hands each batch to `process(batch)`, which resolves the futures. Batches run
+    as tracked background tasks, so the next window starts collecting right away.
+
+    If `process` raises, every future it left unresolved gets the exception. `stop()`
+    flushes the batch being collected and everything still queued, and waits for
+    running batches, so no caller is left waiting on a future nobody will resolve.
+    """
+
+    def __init__(self, name: str, process: Callable[[Batch], Awaitable[None]], window_ms: int, max_size: int):
+        self.name = name
+        self.process = process
+        self.window = window_ms / 1000.0
+        self.max_size = max(1, max_size)
+        self._queue: asyncio.Queue = None
+        self._task: asyncio.Task = None
+        self._inflight: Set[asyncio.Task] = set()
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        if self.running:
+            return
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run(), name=self.name)
+
+    async def stop(self):
+        """Stops collecting, processes what was submitted and waits for running batches."""
+        if self.running:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            pending = []
+            while not self._queue.empty():
+                pending.append(self._queue.get_nowait())
+            for start in range(0, len(pending), self.max_size):
+                self._dispatch(pending[start:start + self.max_size])
+        if self._inflight:
+            await asyncio.gather(*self._inflight)
+
+    async def submit(self, item) -> Any:
+        """Queues one item and waits for the result the processor sets for it."""
+        if not self.running:
+            raise RuntimeError(f"{self.name} is not running")
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((item, future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        batch = []
+        try:
+            while True:
+                batch = [await self._queue.get()]
+                deadline = loop.time() + self.window
+                while len(batch) < self.max_size:
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                    except asyncio.TimeoutError:
+                        break
+                self._dispatch(batch)
+                batch = []
+        except asyncio.CancelledError:
+            # Hand the half-collected window over instead of dropping its futures
+            if batch:
+                self._dispatch(batch)
+            raise
+
+    def _dispatch(self, batch: Batch):
+        task = asyncio.create_task(self._process(batch))
+        self._inflight.add(task)
+        task.add_done_callback(self._inflight.discard)
+
+    async def _process(self, batch: Batch):
+        try:
+            await self.process(batch)
+            error = RuntimeError(f"{self.name} left an item without a result")
+        except Exception as exc:
+            logger.error("%s: batch of %d failed: %s", self.name, len(batch), exc, exc_info=True)
+            error = exc
+        for _, future in batch:
+            if not future.done():
+                future.set_exception(error)
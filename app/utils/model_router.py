@@ -0,0 +1,376 @@
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from decouple import config, Csv
+
+from app.utils.llm_gateway import LLMGateway, LLMResult, Priority
+
+logger = logging.getLogger("model_router")
+
+# --- Routes ---
+# Ordered "provider:model" lists per call type; the first healthy model is the primary.
+LLM_ROUTE_CHAT = config(
+    "LLM_ROUTE_CHAT", default="groq:openai/gpt-oss-20b,groq:llama-3.1-8b-instant", cast=Csv()
+)
+LLM_ROUTE_FACT_EXTRACTION = config(
+    "LLM_ROUTE_FACT_EXTRACTION", default="groq:llama-3.1-8b-instant,groq:openai/gpt-oss-20b", cast=Csv()
+)
+LLM_ROUTE_SUMMARY = config(
+    "LLM_ROUTE_SUMMARY", default="groq:llama-3.1-8b-instant,groq:openai/gpt-oss-20b", cast=Csv()
+)
+# p95 latency (seconds) a model must stay under to remain the primary for a call type
+LLM_SLO_CHAT = config("LLM_SLO_CHAT", default=3.0, cast=float)
+LLM_SLO_FACT_EXTRACTION = config("LLM_SLO_FACT_EXTRACTION", default=15.0, cast=float)
+LLM_SLO_SUMMARY = config("LLM_SLO_SUMMARY", default=20.0, cast=float)
+# Call types that fire a second model when the primary has not answered within the SLO
+LLM_HEDGE_CALL_TYPES = config("LLM_HEDGE_CALL_TYPES", default="chat", cast=Csv())
+
+# --- Health tracking ---
+LLM_ROUTER_WINDOW = config("LLM_ROUTER_WINDOW", default=100, cast=int)
+LLM_ROUTER_MIN_SAMPLES = config("LLM_ROUTER_MIN_SAMPLES", default=10, cast=int)
+LLM_ROUTER_MAX_ERROR_RATE = config("LLM_ROUTER_MAX_ERROR_RATE", default=0.5, cast=float)
+# Share of calls that keep the configured order, so a demoted model can recover
+LLM_ROUTER_PROBE_RATE = config("LLM_ROUTER_PROBE_RATE", default=0.05, cast=float)
+
+# Request options that only some Groq models accept
+GROQ_MODEL_ARGS = {
+    "openai/gpt-oss-20b": {"reasoning_format": "hidden", "reasoning_effort": "low"},
+    "qwen/qwen3-32b": {"reasoning_format": "hidden"},
+    "llama-3.1-8b-instant": {},
+}
+
+
+@dataclass(frozen=True)
+class ModelSpec:
+    provider: str
+    model: str
+
+    @property
+    def key(self) -> str:
+        return f"{self.provider}:{self.model}"
+
+    @classmethod
+    def parse(cls, value: str) -> "ModelSpec":
+        provider, sep, model = value.strip().partition(":")
+        if not sep:
+            provider, model = "groq", provider
+        return cls(provider=provider, model=model)
+
+
+@dataclass
+class Route:
+    models: List[ModelSpec]
+    slo: float
+    hedge: bool = False
+
+
+class ModelHealth:
+    """Rolling latency and error rate over the last LLM_ROUTER_WINDOW calls to one model."""
+
+    def __init__(self, window: int = LLM_ROUTER_WINDOW):
+        self._latencies = deque(maxlen=window)
+        self._outcomes = deque(maxlen=window)
+        self.calls = 0
+
+    def record(self, latency: Optional[float], ok: bool):
+        self.calls += 1
+        self._outcomes.append(ok)
+        if ok and latency is not None:
+            self._latencies.append(latency)
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self._latencies:
+            return None
+        ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    @property
+    def error_rate(self) -> float:
+        if not self._outcomes:
+            return 0.0
+        return self._outcomes.count(False) / len(self._outcomes)
+
+    def degraded(self, slo: float) -> bool:
+        if len(self._outcomes) < LLM_ROUTER_MIN_SAMPLES:
+            return False
+        p95 = self.percentile(0.95)
+        return self.error_rate > LLM_ROUTER_MAX_ERROR_RATE or (p95 is not None and p95 > slo)
+
+    def stats(self) -> dict:
+        p50, p95 = self.percentile(0.5), self.percentile(0.95)
+        return {
+            "calls": self.calls,
+            "samples": len(self._outcomes),
+            "p50": round(p50, 4) if p50 is not None else None,
+            "p95": round(p95, 4) if p95 is not None else None,
+            "error_rate": round(self.error_rate, 4),
+        }
+
+
+# --- Providers ---
+
+class GroqProvider:
+    """Groq chat completions, with one rate-limited gateway per model."""
+
+    def __init__(self, client, temperature: float = 0.7, top_p: float = 0.9):
+        self.client = client
+        self.temperature = temperature
+        self.top_p = top_p
+        self._gateways: Dict[str, LLMGateway] = {}
+
+    def gateway(self, model: str) -> LLMGateway:
+        if model not in self._gateways:
+            self._gateways[model] = LLMGateway(self.client, model)
+        return self._gateways[model]
+
+    def completion_args(self, model: str, system_prompt: str, prompt: str, max_tokens: int) -> dict:
+        return dict(
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": prompt},
+            ],
+            model=model,
+            temperature=self.temperature,
+            max_tokens=max_tokens,
+            top_p=self.top_p,
+            **GROQ_MODEL_ARGS.get(model, {}),
+        )
+
+    async def complete(self, model, system_prompt, prompt, max_tokens, priority) -> LLMResult:
+        args = self.completion_args(model, system_prompt, prompt, max_tokens)
+        return await self.gateway(model).complete(args, priority)
+
+    def stream(self, model, system_prompt, prompt, max_tokens, priority) -> AsyncIterator[str]:
+        args = self.completion_args(model, system_prompt, prompt, max_tokens)
+        return self.gateway(model).stream(args, priority)
+
+    def stats(self) -> dict:
+        return {model: gateway.stats() for model, gateway in self._gateways.items()}
+
+
+class FakeProvider:
+    """
+    Local stand-in for exercising routing, load tests and offline runs. Latency,
+    jitter and error rate can be set per model; `responder(system_prompt, prompt)`
+    overrides the canned reply.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.05,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        text: str = "(happy) {wag tail} <bark> I missed you!",
+        responder: Callable[[str, str], str] = None,
+        per_model: Dict[str, dict] = None,
+        seed: int = None,
+    ):
+        self.defaults = {"latency": latency, "jitter": jitter, "error_rate": error_rate}
+        self.per_model = per_model or {}
+        self.text = text
+        self.responder = responder
+        self._random = random.Random(seed)
+
+    def _settings(self, model: str) -> dict:
+        return {**self.defaults, **self.per_model.get(model, {})}
+
+    def _reply(self, system_prompt: str, prompt: str) -> str:
+        return self.responder(system_prompt, prompt) if self.responder else self.text
+
+    async def _wait(self, settings: dict):
+        delay = settings["latency"] + self._random.uniform(-settings["jitter"], settings["jitter"])
+        await asyncio.sleep(max(0.0, delay))
+
+    async def complete(self, model, system_prompt, prompt, max_tokens, priority) -> LLMResult:
+        settings = self._settings(model)
+        started = time.monotonic()
+        await self._wait(settings)
+        result = LLMResult(model=model, attempts=1)
+        if self._random.random() < settings["error_rate"]:
+            result.error, result.message = "unavailable", "Fake provider error"
+        else:
+            result.text = self._reply(system_prompt, prompt)
+        result.latency = time.monotonic() - started
+        return result
+
+    async def stream(self, model, system_prompt, prompt, max_tokens, priority) -> AsyncIterator[str]:
+        settings = self._settings(model)
+        await self._wait(settings)
+        if self._random.random() < settings["error_rate"]:
+            raise RuntimeError("Fake provider error")
+        for word in self._reply(system_prompt, prompt).split(" "):
+            yield word + " "
+
+    def stats(self) -> dict:
+        return {}
+
+
+# --- Router ---
+
+class ModelRouter:
+    """
+    Picks a model per call from the call type's route:
+      - models whose rolling p95 breaches the route's SLO, or whose error rate is
+        above LLM_ROUTER_MAX_ERROR_RATE, move to the back of the list
+      - failed calls fall back to the next model
+      - for hedged call types, a second model is started when the first has not
+        answered within the SLO, and the first good answer wins
+    """
+
+    def __init__(self, routes: Dict[str, Route], providers: Dict[str, object]):
+        self.routes = routes
+        self.providers = providers
+        self.health: Dict[str, ModelHealth] = {}
+        self._stats = {"fallbacks": 0, "hedges": 0, "hedge_wins": 0, "reordered": 0}
+
+    def _health(self, spec: ModelSpec) -> ModelHealth:
+        if spec.key not in self.health:
+            self.health[spec.key] = ModelHealth()
+        return self.health[spec.key]
+
+    def primary(self, call_type: str) -> ModelSpec:
+        return self.routes[call_type].models[0]
+
+    def _ranked(self, route: Route) -> List[ModelSpec]:
+        healthy = [spec for spec in route.models if not self._health(spec).degraded(route.slo)]
+        return healthy + [spec for spec in route.models if spec not in healthy]
+
+    def order(self, call_type: str) -> List[ModelSpec]:
+        route = self.routes[call_type]
+        if len(route.models) < 2 or random.random() < LLM_ROUTER_PROBE_RATE:
+            return list(route.models)
+        ranked = self._ranked(route)
+        if ranked[0] != route.models[0]:
+            self._stats["reordered"] += 1
+        return ranked
+
+    async def _call(self, spec: ModelSpec, system_prompt, prompt, max_tokens, priority) -> LLMResult:
+        started = time.monotonic()
+        try:
+            result = await self.providers[spec.provider].complete(spec.model, system_prompt, prompt, max_tokens, priority)
+        except asyncio.CancelledError:
+            # A call abandoned by a hedge still tells us the model was at least this slow.
+            self._health(spec).record(time.monotonic() - started, True)
+            raise
+        self._health(spec).record(time.monotonic() - started, result.ok)
+        return result
+
+    async def _hedged(self, first: ModelSpec, second: ModelSpec, slo: float, *args) -> Tuple[LLMResult, bool]:
+        """Returns the result and whether the second model was started."""
+        first_task = asyncio.create_task(self._call(first, *args))
+        done, _ = await asyncio.wait({first_task}, timeout=slo)
+        if done:
+            return first_task.result(), False
+
+        self._stats["hedges"] += 1
+        logger.info("Hedging %s with %s after %.1fs", first.key, second.key, slo)
+        second_task = asyncio.create_task(self._call(second, *args))
+        pending = {first_task, second_task}
+        result = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    result = task.result()
+                    if result.ok:
+                        if task is second_task:
+                            self._stats["hedge_wins"] += 1
+                        return result, True
+            return result, True
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def complete(
+        self,
+        call_type: str,
+        system_prompt: str,
+        prompt: str,
+        max_tokens: int = 250,
+        priority: Priority = Priority.FOREGROUND,
+    ) -> LLMResult:
+        route = self.routes[call_type]
+        order = self.order(call_type)
+        args = (system_prompt, prompt, max_tokens, priority)
+
+        result = None
+        position = 0
+        while position < len(order):
+            if position == 0 and route.hedge and len(order) > 1:
+                result, hedged = await self._hedged(order[0], order[1], route.slo, *args)
+                # Only skip the second model if the hedge actually ran it
+                position = 2 if hedged else 1
+            else:
+                result = await self._call(order[position], *args)
+                position += 1
+            if result.ok:
+                return result
+            if position < len(order):
+                self._stats["fallbacks"] += 1
+                logger.warning("%s call failed on %s (%s), falling back", call_type, result.model, result.error)
+        return result
+
+    async def stream(
+        self,
+        call_type: str,
+        system_prompt: str,
+        prompt: str,
+        max_tokens: int = 250,
+        priority: Priority = Priority.FOREGROUND,
+    ) -> AsyncIterator[str]:
+        """Streams from the first model that produces output; falls back only before the first delta."""
+        order = self.order(call_type)
+        for position, spec in enumerate(order):
+            stream = self.providers[spec.provider].stream(spec.model, system_prompt, prompt, max_tokens, priority)
+            try:
+                first = await stream.__anext__()
+            except StopAsyncIteration:
+                self._health(spec).record(None, True)
+                return
+            except Exception as e:
+                self._health(spec).record(None, False)
+                if position == len(order) - 1:
+                    raise
+                self._stats["fallbacks"] += 1
+                logger.warning("%s stream failed on %s (%s), falling back", call_type, spec.key, e)
+                continue
+
+            try:
+                yield first
+                async for delta in stream:
+                    yield delta
+            except Exception:
+                self._health(spec).record(None, False)
+                raise
+            self._health(spec).record(None, True)
+            return
+
+    def stats(self) -> dict:
+        return {
+            **self._stats,
+            "routes": {
+                call_type: {"order": [spec.key for spec in self._ranked(route)], "slo": route.slo, "hedge": route.hedge}
+                for call_type, route in self.routes.items()
+            },
+            "models": {key: health.stats() for key, health in self.health.items()},
+        }
+
+
+def routes_from_config() -> Dict[str, Route]:
+    def route(call_type: str, models: List[str], slo: float) -> Route:
+        return Route(
+            models=[ModelSpec.parse(value) for value in models if value.strip()],
+            slo=slo,
+            hedge=call_type in LLM_HEDGE_CALL_TYPES,
+        )
+
+    return {
+        "chat": route("chat", LLM_ROUTE_CHAT, LLM_SLO_CHAT),
+        "fact_extraction": route("fact_extraction", LLM_ROUTE_FACT_EXTRACTION, LLM_SLO_FACT_EXTRACTION),
+        "summary": route("summary", LLM_ROUTE_SUMMARY, LLM_SLO_SUMMARY),
+    }
@@ -1,15 +1,28 @@
 from enum import Enum
-from typing import Dict
+from typing import Dict, NamedTuple
+import asyncio
+import json
 import logging
+import math
+import operator
+import os
+from datetime import datetime
+
+import numpy as np
+from decouple import config
 
 logger = logging.getLogger(__name__)
-logging.basicConfig(level=logging.INFO)
+
+# Mood thresholds, behavior tags and prompt modifiers live in mood_rules.json.
+# While the app runs, the file is re-read when it changes, checked every MOOD_RULES_RELOAD_SECONDS (0 disables).
+MOOD_RULES_PATH = config("MOOD_RULES_PATH", default=os.path.join(os.path.dirname(__file__), "mood_rules.json"))
+MOOD_RULES_RELOAD_SECONDS = config("MOOD_RULES_RELOAD_SECONDS", default=5.0, cast=float)
 
 
 class Mood(str, Enum):
     HAPPY = "happy"
-    MISERABLE = "miserable"  
-    SICK = "sick"           
+    MISERABLE = "miserable"
+    SICK = "sick"
     HUNGRY = "hungry"
     TIRED = "tired"
     STRESSED = "stressed"
@@ -17,6 +30,235 @@ class Mood(str, Enum):
     NEUTRAL = "neutral"
 
 
+# Batch evaluation works on mood codes (indexes into MOODS) so large fleets stay in NumPy arrays.
+MOODS = tuple(Mood)
+MOOD_VALUES = np.array([mood.value for mood in MOODS])
+_CODE = {mood: code for code, mood in enumerate(MOODS)}
+
+# PHP sends flags as "0"/"1" strings; /moods/batch may send numbers. Both evaluation
+# paths treat exactly these values (by ==, so 1.0 and True too) as set.
+FLAG_SET_VALUES = ("1", 1)
+
+_OPS = {
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+    "==": operator.eq,
+    "!=": operator.ne,
+}
+
+
+class MoodOutcome(NamedTuple):
+    mood: Mood
+    modifier: str
+    behavior_tag: str
+
+
+class MoodRuleTable:
+    """
+    The mood rules compiled for evaluation. Each rule becomes one line of a generated
+    if-chain (the rules file only supplies validated field names, operators from
+    _OPS and numbers), so a scalar evaluation costs the same as the hand-written
+    chain it replaces and returns mood, modifier and tag in one go. The same rules
+    are kept as (mood code, [(field, op, threshold)]) for NumPy batch evaluation.
+    """
+
+    def __init__(self, rules_config: dict, mtime_ns: int = 0):
+        self.mtime_ns = mtime_ns
+        self.loaded_at = datetime.utcnow()
+        try:
+            self._compile(rules_config)
+        except (KeyError, TypeError, ValueError) as e:
+            raise ValueError(f"Invalid mood rules: {e!r}") from e
+
+    def _compile(self, rules_config: dict):
+        self.defaults = {name: _finite(default) for name, default in rules_config["fields"].items()}
+        self.flags = frozenset(rules_config.get("flags", []))
+        for name in self.defaults:
+            if not name.isidentifier():
+                raise ValueError(f"field name {name!r} is not an identifier")
+        if not self.flags <= self.defaults.keys():
+            raise ValueError(f"flags {sorted(self.flags - self.defaults.keys())} are not fields")
+
+        moods = rules_config["moods"]
+        self.outcomes = {
+            mood: MoodOutcome(mood, str(moods[mood.value]["modifier"]), str(moods[mood.value]["tag"]))
+            for mood in Mood
+        }
+        self.tags = np.array([self.outcomes[mood].behavior_tag for mood in MOODS])
+        self.default_mood = Mood(rules_config["default_mood"])
+
+        self.rules = []
+        for rule in rules_config["rules"]:
+            match_all = "all" in rule
+            conditions = [
+                (field, op, _finite(threshold))
+                for field, op, threshold in (rule["all"] if match_all else rule["any"])
+            ]
+            for field, op, _ in conditions:
+                if field not in self.defaults:
+                    raise ValueError(f"unknown field {field!r}")
+                if op not in _OPS:
+                    raise ValueError(f"unknown operator {op!r}")
+            if not conditions:
+                raise ValueError(f"rule for {rule['mood']!r} has no conditions")
+            self.rules.append((Mood(rule["mood"]), match_all, conditions))
+
+        self.evaluate = self._build_scalar()
+
+    def _build_scalar(self):
+        lines = ["def evaluate(status):", "    get = status.get"]
+        for name, default in self.defaults.items():
+            if name in self.flags:
+                lines.append(f"    v_{name} = 1.0 if get({name!r}) in FLAG_SET_VALUES else 0.0")
+            else:
+                lines.append(f"    v_{name} = get({name!r}, {default!r})")
+        for mood, match_all, conditions in self.rules:
+            test = (" and " if match_all else " or ").join(
+                f"v_{field} {op} {threshold!r}" for field, op, threshold in conditions
+            )
+            lines.append(f"    if {test}:")
+            lines.append(f"        return outcomes[{mood.name!r}]")
+        lines.append(f"    return outcomes[{self.default_mood.name!r}]")
+
+        namespace = {
+            "outcomes": {mood.name: outcome for mood, outcome in self.outcomes.items()},
+            "FLAG_SET_VALUES": FLAG_SET_VALUES,
+        }
+        exec(compile("\n".join(lines), "<mood_rules>", "exec"), namespace)
+        return namespace["evaluate"]
+
+    def evaluate_batch(self, columns: Dict[str, object]) -> np.ndarray:
+        """
+        Vectorized evaluate over columnar status arrays (one entry per pet). Rules are
+        masks in priority order and np.select picks the first one that holds, so both
+        paths agree pet for pet. Missing columns take the field default. Returns an
+        int8 array of indexes into MOODS.
+        """
+        unknown = columns.keys() - self.defaults.keys()
+        if unknown:
+            raise ValueError(f"Unknown mood fields: {sorted(unknown)}")
+        size = len(next(iter(columns.values()))) if columns else 0
+        arrays = {
+            name: _flag_column(columns[name]) if name in self.flags else _float_column(columns[name])
+            for name in columns
+        }
+        for name, default in self.defaults.items():
+            arrays.setdefault(name, np.full(size, 0.0 if name in self.flags else default))
+
+        conditions = []
+        for _, match_all, rule_conditions in self.rules:
+            masks = [_OPS[op](arrays[field], threshold) for field, op, threshold in rule_conditions]
+            combined = masks[0]
+            for mask in masks[1:]:
+                combined = combined & mask if match_all else combined | mask
+            conditions.append(combined)
+        choices = [_CODE[mood] for mood, _, _ in self.rules]
+        return np.select(conditions, choices, default=_CODE[self.default_mood]).astype(np.int8)
+
+
+def _finite(value) -> float:
+    # json.load accepts NaN and Infinity, whose repr is not valid in the generated code
+    number = float(value)
+    if not math.isfinite(number):
+        raise ValueError(f"{value!r} is not a finite number")
+    return number
+
+
+def _float_column(values) -> np.ndarray:
+    if isinstance(values, np.ndarray):
+        return values.astype(np.float64, copy=False)
+    # Lists come straight from JSON; fromiter skips the type sniffing np.asarray does
+    return np.fromiter(values, dtype=np.float64, count=len(values))
+
+
+def _flag_column(values) -> np.ndarray:
+    # Same rule as the scalar path: set when the value is in FLAG_SET_VALUES
+    if isinstance(values, np.ndarray) and values.dtype.kind in "biuf":
+        mask = values == 1
+    elif isinstance(values, np.ndarray) and values.dtype.kind == "U":
+        mask = values == "1"
+    else:
+        mask = np.fromiter((value in FLAG_SET_VALUES for value in values), dtype=bool, count=len(values))
+    return mask.astype(np.float64)
+
+
+def load_mood_rules(path: str = MOOD_RULES_PATH) -> MoodRuleTable:
+    mtime_ns = os.stat(path).st_mtime_ns
+    with open(path, encoding="utf-8") as f:
+        return MoodRuleTable(json.load(f), mtime_ns)
+
+
+# A broken rules file fails startup; at runtime a bad edit keeps the last good rules.
+_rules = load_mood_rules()
+_failed_mtime_ns = None
+_watcher_task = None
+_rules_stats = {"reloads": 0, "reload_errors": 0}
+
+
+def _reload_if_changed():
+    global _rules, _failed_mtime_ns
+    try:
+        mtime_ns = os.stat(MOOD_RULES_PATH).st_mtime_ns
+    except OSError as e:
+        logger.warning("Cannot stat mood rules at %s: %s", MOOD_RULES_PATH, e)
+        return
+    if mtime_ns in (_rules.mtime_ns, _failed_mtime_ns):
+        return
+    try:
+        rules = load_mood_rules()
+    except Exception as e:
+        _failed_mtime_ns = mtime_ns
+        _rules_stats["reload_errors"] += 1
+        logger.error("Keeping the current mood rules; %s could not be loaded: %s", MOOD_RULES_PATH, e)
+        return
+    _rules = rules
+    _rules_stats["reloads"] += 1
+    logger.info("Reloaded mood rules from %s (%d rules)", MOOD_RULES_PATH, len(rules.rules))
+
+
+async def _watch_mood_rules():
+    while True:
+        await asyncio.sleep(MOOD_RULES_RELOAD_SECONDS)
+        await asyncio.to_thread(_reload_if_changed)
+
+
+def start_mood_rules_watcher():
+    """
+    Polls the rules file in the background, so the per-turn path never stats it.
+    """
+    global _watcher_task
+    if MOOD_RULES_RELOAD_SECONDS > 0 and _watcher_task is None:
+        _watcher_task = asyncio.create_task(_watch_mood_rules(), name="mood-rules-watcher")
+
+
+async def stop_mood_rules_watcher():
+    global _watcher_task
+    if _watcher_task is None:
+        return
+    _watcher_task.cancel()
+    try:
+        await _watcher_task
+    except asyncio.CancelledError:
+        pass
+    _watcher_task = None
+
+
+def get_mood_rules() -> MoodRuleTable:
+    return _rules
+
+
+def get_mood_rules_stats() -> dict:
+    return {
+        **_rules_stats,
+        "path": MOOD_RULES_PATH,
+        "rules": len(_rules.rules),
+        "loaded_at": _rules.loaded_at.isoformat(),
+        "reload_seconds": MOOD_RULES_RELOAD_SECONDS,
+    }
+
+
 class BehaviorEngine:
     def __init__(self, status: Dict[str, float]):
         """
@@ -33,90 +275,43 @@ class BehaviorEngine:
         """
         self.status = status
 
-    def get_primary_mood(self) -> Mood:
+    def evaluate(self) -> MoodOutcome:
         """
-        Determine the dominant mood based on a clear priority system.
-        Critical states (sickness, misery) are checked first.
+        Determine the dominant mood with the rules from mood_rules.json, checked in
+        priority order (critical states like sickness and misery first), together
+        with its prompt modifier and behavior tag.
         """
-        hunger = self.status.get("hunger", 0.0)
-        energy = self.status.get("energy", 100.0)
-        stress = self.status.get("stress", 0.0)
-        cleanliness = self.status.get("cleanliness", 100.0)
-        health = self.status.get("health", 100.0)
-        happiness = self.status.get("happiness", 100.0)
-        is_sick = self.status.get("is_sick") == "1"
-
-        logger.info(
-            f"[Mood Check] Happiness: {happiness}, Health: {health}, Hunger: {hunger}, "
-            f"Energy: {energy}, Stress: {stress}, Cleanliness: {cleanliness}, Is Sick: {is_sick}"
-        )
-
-        # Priority 1: Critical Health/Happiness States
-        if is_sick or health < 40:
-            return Mood.SICK
-        if happiness < 25:
-            return Mood.MISERABLE
-
-        # Priority 2: Strong Negative Needs
-        if hunger < 30:
-            return Mood.HUNGRY
-        if energy < 30:
-            return Mood.TIRED
-        if stress > 60:
-            return Mood.STRESSED
-        if cleanliness < 40:
-            return Mood.DIRTY
-
-        # Priority 3: Positive State
-        if happiness > 80 and energy > 60 and stress < 40 and cleanliness > 60:
-            return Mood.HAPPY
-
-        # Default Fallback
-        return Mood.NEUTRAL
+        outcome = _rules.evaluate(self.status)
+        logger.debug("[Mood Check] %s -> %s", self.status, outcome.mood.value)
+        return outcome
+
+    def get_primary_mood(self) -> Mood:
+        return self.evaluate().mood
+
+    @staticmethod
+    def modifier_for_mood(mood: Mood) -> str:
+        return get_mood_rules().outcomes[mood].modifier
+
+    @staticmethod
+    def tag_for_mood(mood: Mood) -> str:
+        return get_mood_rules().outcomes[mood].behavior_tag
 
     def get_prompt_modifier(self) -> str:
         """
         Injects strong, direct behavioral commands into the LLM prompt.
         This is not just a description, it's an order.
         """
-        mood = self.get_primary_mood()
-        match mood:
-            case Mood.MISERABLE:
-                return "You feel deeply sad and unhappy. Your response MUST be withdrawn, whiny, or listless."
-            case Mood.SICK:
-                return "You feel sick and weak. Your response MUST be low-energy, pained, or clingy for comfort."
-            case Mood.HUNGRY:
-                return "You are very hungry. Your response MUST be focused on food, maybe a little grumpy or pleading."
-            case Mood.TIRED:
-                return "You are exhausted. Your response MUST be sleepy, slow, and low-energy. Mention napping."
-            case Mood.STRESSED:
-                return "You are anxious and stressed. Your response MUST be nervous, skittish, or seeking reassurance."
-            case Mood.DIRTY:
-                return "You feel dirty and uncomfortable. Your response MUST be irritable or focused on wanting to be clean."
-            case Mood.HAPPY:
-                return "You are joyful and full of life! Your response MUST be cheerful, energetic, and affectionate."
-            case _:
-                return "You are feeling calm and neutral. Your response should be relaxed and content."
+        return self.evaluate().modifier
 
     def get_behavior_tag(self) -> str:
         """Optional tags that can guide behavior logic."""
-        mood = self.get_primary_mood()
-        return {
-            Mood.MISERABLE: "needs_cheering_up",
-            Mood.SICK: "needs_care",
-            Mood.HUNGRY: "avoid_physical_activities",
-            Mood.TIRED: "sleep_preferred",
-            Mood.STRESSED: "needs_comfort",
-            Mood.DIRTY: "refuses_cuddles",
-            Mood.HAPPY: "play_ready",
-            Mood.NEUTRAL: "passive"
-        }.get(mood, "passive")
+        return self.evaluate().behavior_tag
 
     def get_summary(self) -> Dict[str, str]:
         """Returns both mood and prompt modifier for injection."""
-        mood = self.get_primary_mood()
+        outcome = self.evaluate()
         return {
-            "mood": mood.value,
-            "modifier": self.get_prompt_modifier(),
-            "behavior_tag": self.get_behavior_tag()
-        }
\ No newline at end of file
+            "mood": outcome.mood.value,
+            "modifier": outcome.modifier,
+            "behavior_tag": outcome.behavior_tag
+        }
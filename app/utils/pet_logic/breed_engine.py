@@ -3,7 +3,6 @@ from typing import Dict
 import logging
 
 logger = logging.getLogger(__name__)
-logging.basicConfig(level=logging.INFO)
 
 class Breed(str, Enum):
     # Dogs
@@ -43,10 +42,10 @@ class BreedEngine:
     def get_modifier(self) -> str:
         try:
             behavior = BREED_BEHAVIORS[Breed(self.breed)]
-            logger.info(f"[Breed Behavior] {self.breed} -> {behavior}")
+            logger.debug("[Breed Behavior] %s -> %s", self.breed, behavior)
             return behavior
         except Exception as e:
-            logger.warning(f"Unknown breed: {self.breed} — using fallback behavior.")
+            logger.warning("Unknown breed: %s — using fallback behavior.", self.breed)
             return "Behave according to your general species characteristics."
 
     def get_summary(self) -> Dict[str, str]:
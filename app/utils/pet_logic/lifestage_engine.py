@@ -3,7 +3,6 @@ from typing import Dict
 import logging
 
 logger = logging.getLogger(__name__)
-logging.basicConfig(level=logging.INFO)
 
 
 class Lifestage(str, Enum):
@@ -53,14 +52,14 @@ class LifestageEngine:
     def get_summary(self) -> Dict[str, str]:
         try:
             behavior = LIFESTAGE_BEHAVIORS[Lifestage(self.lifestage)]
-            logger.info(f"[Lifestage Behavior] {self.lifestage} -> {behavior}")
+            logger.debug("[Lifestage Behavior] %s -> %s", self.lifestage, behavior)
             return {
                 "lifestage": self.lifestage,
                 "summary": behavior["summary"],
                 "tone": behavior["tone"]
             }
         except Exception as e:
-            logger.warning(f"Unknown lifestage: {self.lifestage} — using fallback tone.")
+            logger.warning("Unknown lifestage: %s — using fallback tone.", self.lifestage)
             return {
                 "lifestage": self.lifestage,
                 "summary": "You are a pet with an undefined age group.",
@@ -3,7 +3,6 @@ from typing import Dict
 import logging
 
 logger = logging.getLogger(__name__)
-logging.basicConfig(level=logging.INFO)
 
 
 class Lifestage(str, Enum):
@@ -72,7 +71,7 @@ class LifestageEngine:
     def get_summary(self) -> Dict[str, str]:
         try:
             behavior = LIFESTAGE_BEHAVIORS[Lifestage(self.lifestage)]
-            logger.info(f"[Lifestage Behavior] {self.lifestage} -> Summary, Tone, Vocab")
+            logger.debug("[Lifestage Behavior] %s -> Summary, Tone, Vocab", self.lifestage)
             return {
                 "lifestage": self.lifestage,
                 "summary": behavior["summary"],
@@ -80,7 +79,7 @@ class LifestageEngine:
                 "vocabulary": behavior["vocabulary"]
             }
         except Exception as e:
-            logger.warning(f"Unknown lifestage: {self.lifestage} — using fallback tone.")
+            logger.warning("Unknown lifestage: %s — using fallback tone.", self.lifestage)
             return {
                 "lifestage": self.lifestage,
                 "summary": "You are a pet with an undefined age group.",
@@ -3,7 +3,6 @@ from typing import Dict
 import logging
 
 logger = logging.getLogger(__name__)
-logging.basicConfig(level=logging.INFO)
 
 
 class Personality(str, Enum):
@@ -44,10 +43,10 @@ class PersonalityEngine:
     def get_modifier(self) -> str:
         try:
             behavior = PERSONALITY_BEHAVIORS[Personality(self.personality)]
-            logger.info(f"[Personality Behavior] {self.personality} -> {behavior}")
+            logger.debug("[Personality Behavior] %s -> %s", self.personality, behavior)
             return behavior
         except Exception as e:
-            logger.warning(f"Unknown personality: {self.personality} — using neutral fallback.")
+            logger.warning("Unknown personality: %s — using neutral fallback.", self.personality)
             return "Let your natural instincts guide your tone and actions gently."
 
     def get_summary(self) -> Dict[str, str]:
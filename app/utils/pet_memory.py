@@ -0,0 +1,164 @@
+import asyncio
+import logging
+import os
+import time
+from functools import lru_cache
+from typing import Dict, List, Tuple
+
+from decouple import config
+
+from app.utils.background_jobs import register_job
+from app.utils.chat_retention import RECENT_MESSAGES_LIMIT
+from app.utils.embedding_service import embedding_service
+from app.utils.metrics import stage_timer
+
+logger = logging.getLogger("pet_memory")
+
+# Long-term memory: every exchange is embedded and stored per (user_id, pet_id) in a
+# local Chroma collection; the most similar older exchanges are recalled for each turn.
+PET_MEMORY_ENABLED = config("PET_MEMORY_ENABLED", default=True, cast=bool)
+PET_MEMORY_PATH = config("PET_MEMORY_PATH", default=os.path.abspath("./petpal_chromadb"))
+PET_MEMORY_COLLECTION = config("PET_MEMORY_COLLECTION", default="pet_memories")
+PET_MEMORY_TOP_K = config("PET_MEMORY_TOP_K", default=3, cast=int)
+# Recall is skipped (the turn goes on without it) once this budget is spent
+PET_MEMORY_TIMEOUT_MS = config("PET_MEMORY_TIMEOUT_MS", default=150, cast=int)
+# Cosine distance above which a memory is not considered related to the message
+PET_MEMORY_MAX_DISTANCE = config("PET_MEMORY_MAX_DISTANCE", default=0.6, cast=float)
+
+_memory_stats = {
+    "indexed": 0,
+    "recalls": 0,
+    "recalled": 0,
+    "timeouts": 0,
+    "errors": 0,
+    "recall_seconds": 0.0,
+}
+_unavailable = False
+
+
+@lru_cache(maxsize=1)
+def _get_collection():
+    import chromadb
+    client = chromadb.PersistentClient(path=PET_MEMORY_PATH)
+    return client.get_or_create_collection(PET_MEMORY_COLLECTION, metadata={"hnsw:space": "cosine"})
+
+
+def memory_available() -> bool:
+    return PET_MEMORY_ENABLED and not _unavailable and not embedding_service.failed
+
+
+async def start_pet_memory():
+    """
+    Opens the collection off the event loop and starts the embedding service. Missing
+    packages or a broken store turn the feature off instead of failing startup.
+    """
+    global _unavailable
+    if not PET_MEMORY_ENABLED:
+        return
+    try:
+        await asyncio.to_thread(_get_collection)
+    except Exception as e:
+        _unavailable = True
+        logger.warning("Pet memory disabled, vector store unavailable: %s", e)
+        return
+    await embedding_service.start()
+    if embedding_service.failed:
+        logger.warning("Pet memory disabled, no embedding backend")
+
+
+async def stop_pet_memory():
+    await embedding_service.stop()
+
+
+def format_memory(owner_name: str, pet_name: str, user_text: str, pet_text: str) -> str:
+    return f"{owner_name}: {user_text}\n{pet_name}: {pet_text}"
+
+
+def _where(user_id: int, pet_id: int) -> dict:
+    return {"$and": [{"user_id": user_id}, {"pet_id": pet_id}]}
+
+
+def _upsert(memory_id: str, document: str, embedding: List[float], metadata: dict):
+    _get_collection().upsert(ids=[memory_id], embeddings=[embedding], documents=[document], metadatas=[metadata])
+
+
+def _query(user_id: int, pet_id: int, embedding: List[float], n_results: int) -> dict:
+    return _get_collection().query(
+        query_embeddings=[embedding],
+        n_results=n_results,
+        where=_where(user_id, pet_id),
+        include=["documents", "distances"],
+    )
+
+
+async def _search(user_id: int, pet_id: int, message: str, n_results: int) -> dict:
+    embedding = await embedding_service.embed(message)
+    return await asyncio.to_thread(_query, user_id, pet_id, embedding, n_results)
+
+
+@register_job("index_pet_memory")
+async def index_pet_memory_job(
+    user_id: int,
+    pet_id: int,
+    memory_id: str,
+    document: str,
+    timestamp: float,
+):
+    """Embeds one exchange and stores it; upsert by memory_id makes retries harmless."""
+    if not memory_available():
+        return
+    metadata = {"user_id": user_id, "pet_id": pet_id, "timestamp": timestamp}
+    embedding = await embedding_service.embed(document)
+    await asyncio.to_thread(_upsert, memory_id, document, embedding, metadata)
+    _memory_stats["indexed"] += 1
+
+
+async def recall_memories(user_id: int, pet_id: int, message: str, k: int = PET_MEMORY_TOP_K) -> List[Tuple[str, str]]:
+    """
+    Returns (memory_id, document) pairs for the stored exchanges most related to
+    `message`, most relevant first. Over-fetches by the size of the recent history
+    window so drop_recent can still return `k` after removing what the prompt already
+    shows. Never raises and never takes longer than PET_MEMORY_TIMEOUT_MS, so it can
+    run alongside the other per-turn fetches.
+    """
+    if not memory_available() or not message or k <= 0:
+        return []
+    _memory_stats["recalls"] += 1
+    started = time.perf_counter()
+    try:
+        with stage_timer("recall_memories"):
+            result = await asyncio.wait_for(
+                _search(user_id, pet_id, message, k + RECENT_MESSAGES_LIMIT // 2),
+                timeout=PET_MEMORY_TIMEOUT_MS / 1000,
+            )
+    except asyncio.TimeoutError:
+        _memory_stats["timeouts"] += 1
+        logger.warning("Memory recall for user %s, pet %s exceeded %dms", user_id, pet_id, PET_MEMORY_TIMEOUT_MS)
+        return []
+    except Exception as e:
+        _memory_stats["errors"] += 1
+        logger.error("Memory recall failed for user %s, pet %s: %s", user_id, pet_id, e)
+        return []
+    finally:
+        _memory_stats["recall_seconds"] += time.perf_counter() - started
+
+    return [
+        (memory_id, document)
+        for memory_id, document, distance in zip(result["ids"][0], result["documents"][0], result["distances"][0])
+        if distance <= PET_MEMORY_MAX_DISTANCE
+    ]
+
+
+def drop_recent(candidates: List[Tuple[str, str]], recent_messages: List[Dict], k: int = PET_MEMORY_TOP_K) -> List[str]:
+    """Top `k` recalled documents, leaving out exchanges still in the recent history window."""
+    recent_ids = {msg.get("message_id") for msg in recent_messages}
+    memories = [document for memory_id, document in candidates if memory_id not in recent_ids][:k]
+    _memory_stats["recalled"] += len(memories)
+    return memories
+
+
+def get_pet_memory_stats() -> dict:
+    stats = dict(_memory_stats)
+    stats["enabled"] = memory_available()
+    stats["avg_recall_ms"] = round(stats.pop("recall_seconds") / stats["recalls"] * 1000, 2) if stats["recalls"] else 0.0
+    return stats
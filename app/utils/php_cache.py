@@ -0,0 +1,136 @@
+import hashlib
+import logging
+from decouple import config
+
+from app.utils import php_service
+from app.utils.ttl_cache import AsyncTTLCache
+
+logger = logging.getLogger("php_cache")
+
+# --- Cache settings (seconds) ---
+PHP_CACHE_MAXSIZE = config("PHP_CACHE_MAXSIZE", default=10000, cast=int)
+PHP_CACHE_USER_TTL = config("PHP_CACHE_USER_TTL", default=300.0, cast=float)
+PHP_CACHE_PET_TTL = config("PHP_CACHE_PET_TTL", default=120.0, cast=float)
+PHP_CACHE_STATUS_TTL = config("PHP_CACHE_STATUS_TTL", default=15.0, cast=float)
+# Negative cache for pet ids the owner does not have, so bad ids do not re-download the list
+PHP_CACHE_MISSING_PET_TTL = config("PHP_CACHE_MISSING_PET_TTL", default=30.0, cast=float)
+# How long an expired entry may still be served while it is refreshed in the background
+PHP_CACHE_STALE_TTL = config("PHP_CACHE_STALE_TTL", default=60.0, cast=float)
+
+_user_cache = AsyncTTLCache("php_user", PHP_CACHE_MAXSIZE, PHP_CACHE_USER_TTL, PHP_CACHE_STALE_TTL)
+# Per-owner pet index: token hash -> {pet_id: pet}
+_pet_index = AsyncTTLCache("php_pet_index", PHP_CACHE_MAXSIZE, PHP_CACHE_PET_TTL, PHP_CACHE_STALE_TTL)
+_missing_pets = AsyncTTLCache("php_pet_missing", PHP_CACHE_MAXSIZE, PHP_CACHE_MISSING_PET_TTL)
+_status_cache = AsyncTTLCache("php_pet_status", PHP_CACHE_MAXSIZE, PHP_CACHE_STATUS_TTL, PHP_CACHE_STALE_TTL)
+
+
+def token_hash(token: str) -> str:
+    # Tokens are never stored as-is in cache keys.
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()[:32]
+
+
+def _key(token: str, entity_id) -> tuple:
+    return (token_hash(token), str(entity_id))
+
+
+# --- Cached lookups (same signatures as php_service) ---
+
+async def get_user_by_id(user_id: str, token: str):
+    return await _user_cache.get_or_load(
+        _key(token, user_id), lambda: php_service.get_user_by_id(user_id, token)
+    )
+
+async def _load_pet_index(token: str) -> dict:
+    pets = await php_service.get_pets(token)
+    return php_service.index_pets(pets)
+
+async def refresh_pet_index(token: str) -> dict:
+    """Re-downloads the owner's pet list and rebuilds the index."""
+    owner = token_hash(token)
+    _pet_index.invalidate(owner)
+    _missing_pets.invalidate_where(lambda key: key[0] == owner)
+    return await _pet_index.get_or_load(owner, lambda: _load_pet_index(token))
+
+async def get_pet_by_id(pet_id: str, token: str):
+    """
+    Looks the pet up in the owner's pet index. The /pets list is only downloaded
+    when the index is missing or expired, or once more when an id is not found.
+    Ids that are still missing afterwards are negatively cached.
+    """
+    owner = token_hash(token)
+    pid = str(pet_id)
+    if _missing_pets.get((owner, pid)):
+        return None
+
+    index = _pet_index.get(owner)
+    if index is None and php_service.PHP_SINGLE_PET_ENDPOINT:
+        # No list cached yet; fetch just this pet and seed a partial index.
+        pet = await php_service.get_pet(pid, token)
+        if pet is None:
+            _missing_pets.set((owner, pid), True)
+            return None
+        _pet_index.set(owner, {pid: pet})
+        return pet
+
+    if index is None:
+        index = await _pet_index.get_or_load(owner, lambda: _load_pet_index(token))
+    pet = index.get(pid)
+    if pet is not None:
+        return pet
+
+    # The pet may be newer than the cached index.
+    if php_service.PHP_SINGLE_PET_ENDPOINT:
+        pet = await php_service.get_pet(pid, token)
+        if pet is not None:
+            index[pid] = pet
+            return pet
+    else:
+        index = await refresh_pet_index(token)
+        pet = index.get(pid)
+        if pet is not None:
+            return pet
+
+    _missing_pets.set((owner, pid), True)
+    return None
+
+async def get_pet_status_by_id(pet_id: str, token: str):
+    return await _status_cache.get_or_load(
+        _key(token, pet_id), lambda: php_service.get_pet_status_by_id(pet_id, token)
+    )
+
+
+# --- Invalidation ---
+
+def invalidate_user(user_id: str, token: str):
+    _user_cache.invalidate(_key(token, user_id))
+
+def invalidate_pet(pet_id: str, token: str):
+    """Drops the owner's pet index, the negative entry and the pet's status."""
+    key = _key(token, pet_id)
+    _pet_index.invalidate(key[0])
+    _missing_pets.invalidate(key)
+    _status_cache.invalidate(key)
+
+def invalidate_pet_status(pet_id: str, token: str):
+    _status_cache.invalidate(_key(token, pet_id))
+
+def invalidate_token(token: str) -> int:
+    """Drops every entry cached for a token, e.g. on logout."""
+    hashed = token_hash(token)
+    return sum(
+        cache.invalidate_where(lambda key: key[0] == hashed)
+        for cache in (_user_cache, _missing_pets, _status_cache)
+    ) + int(_pet_index.invalidate(hashed))
+
+def clear_php_cache():
+    for cache in (_user_cache, _pet_index, _missing_pets, _status_cache):
+        cache.clear()
+
+
+def get_php_cache_stats() -> dict:
+    return {
+        "user": _user_cache.stats(),
+        "pet_index": _pet_index.stats(),
+        "pet_missing": _missing_pets.stats(),
+        "pet_status": _status_cache.stats(),
+    }
@@ -1,45 +1,185 @@
 import httpx
 import logging
+from decouple import config
 
 API_BASE = "http://3.34.27.237/aipet/api/v1"
 
 logger = logging.getLogger(__name__)
 
-async def get_user_by_id(user_id: str, token: str):
-    headers = {"Authorization": f"Bearer {token}"}
-    async with httpx.AsyncClient(timeout=10.0) as client:
+# --- Connection pool settings ---
+# One client is shared for the whole app lifetime (see the lifespan in main.py),
+# so these limits bound the total number of sockets we hold to the PHP backend.
+PHP_POOL_MAX_CONNECTIONS = config("PHP_POOL_MAX_CONNECTIONS", default=100, cast=int)
+PHP_POOL_MAX_KEEPALIVE = config("PHP_POOL_MAX_KEEPALIVE", default=20, cast=int)
+PHP_KEEPALIVE_EXPIRY = config("PHP_KEEPALIVE_EXPIRY", default=30.0, cast=float)
+PHP_HTTP2 = config("PHP_HTTP2", default=False, cast=bool)
+# Set when the PHP API serves GET /pets/{pet_id}; otherwise pets are read from the /pets list.
+PHP_SINGLE_PET_ENDPOINT = config("PHP_SINGLE_PET_ENDPOINT", default=False, cast=bool)
+
+# Per-endpoint timeouts (seconds). The connect and pool timeouts are shared.
+PHP_CONNECT_TIMEOUT = config("PHP_CONNECT_TIMEOUT", default=3.0, cast=float)
+PHP_POOL_TIMEOUT = config("PHP_POOL_TIMEOUT", default=5.0, cast=float)
+ENDPOINT_TIMEOUTS = {
+    "user": config("PHP_TIMEOUT_USER", default=10.0, cast=float),
+    "pets": config("PHP_TIMEOUT_PETS", default=10.0, cast=float),
+    "pet": config("PHP_TIMEOUT_PET", default=10.0, cast=float),
+    "pet_status": config("PHP_TIMEOUT_PET_STATUS", default=10.0, cast=float),
+}
+
+_client = None
+_stats = {
+    "requests_total": 0,
+    "requests_failed": 0,
+    "in_flight": 0,
+    "peak_in_flight": 0,
+}
+
+
+def _timeout_for(endpoint: str) -> httpx.Timeout:
+    read_timeout = ENDPOINT_TIMEOUTS.get(endpoint, 10.0)
+    return httpx.Timeout(read_timeout, connect=PHP_CONNECT_TIMEOUT, pool=PHP_POOL_TIMEOUT)
+
+
+def _build_client() -> httpx.AsyncClient:
+    limits = httpx.Limits(
+        max_connections=PHP_POOL_MAX_CONNECTIONS,
+        max_keepalive_connections=PHP_POOL_MAX_KEEPALIVE,
+        keepalive_expiry=PHP_KEEPALIVE_EXPIRY,
+    )
+    http2 = PHP_HTTP2
+    if http2:
         try:
-            response = await client.get(f"{API_BASE}/users/profile", headers=headers)
-            response.raise_for_status()
-            return response.json().get("user", {})
-        except httpx.HTTPStatusError as e:
-            logger.error("User API returned %s: %s", e.response.status_code, e)
-            raise
-        except httpx.RequestError as e:
-            logger.error("User API request error: %s", e)
-            raise
+            import h2  # noqa: F401
+        except ImportError:
+            logger.warning("PHP_HTTP2 is enabled but the 'h2' package is missing; falling back to HTTP/1.1")
+            http2 = False
+    return httpx.AsyncClient(
+        base_url=API_BASE,
+        limits=limits,
+        http2=http2,
+        timeout=_timeout_for("user"),
+    )
 
-async def get_pet_by_id(pet_id: str, token: str):
+
+async def start_http_client() -> httpx.AsyncClient:
+    """
+    Opens the shared PHP client. Called from the app lifespan on startup.
+    """
+    global _client
+    if _client is None or _client.is_closed:
+        _client = _build_client()
+        logger.info(
+            "PHP HTTP client started (max_connections=%s, max_keepalive=%s, http2=%s)",
+            PHP_POOL_MAX_CONNECTIONS, PHP_POOL_MAX_KEEPALIVE, PHP_HTTP2,
+        )
+    return _client
+
+
+async def close_http_client():
+    """
+    Closes the shared PHP client. Called from the app lifespan on shutdown.
+    """
+    global _client
+    if _client is not None and not _client.is_closed:
+        await _client.aclose()
+        logger.info("PHP HTTP client closed")
+    _client = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    # Lazily open the client for callers running outside the app lifespan (scripts, shells).
+    global _client
+    if _client is None or _client.is_closed:
+        _client = _build_client()
+    return _client
+
+
+def get_pool_stats() -> dict:
+    """
+    Returns request counters plus a snapshot of the underlying connection pool,
+    so the pool limits can be sized from real traffic.
+    """
+    stats = dict(_stats)
+    stats.update({
+        "max_connections": PHP_POOL_MAX_CONNECTIONS,
+        "max_keepalive_connections": PHP_POOL_MAX_KEEPALIVE,
+        "http2": PHP_HTTP2,
+        "open_connections": 0,
+        "idle_connections": 0,
+        "active_connections": 0,
+    })
+
+    # httpx does not expose pool state publicly; read it from httpcore when available.
+    pool = getattr(getattr(_client, "_transport", None), "_pool", None)
+    connections = getattr(pool, "connections", None) or []
+    for conn in connections:
+        stats["open_connections"] += 1
+        if conn.is_idle():
+            stats["idle_connections"] += 1
+        else:
+            stats["active_connections"] += 1
+    return stats
+
+
+async def _get(endpoint: str, path: str, token: str) -> httpx.Response:
     headers = {"Authorization": f"Bearer {token}"}
-    async with httpx.AsyncClient(timeout=10.0) as client:
-        response = await client.get(f"{API_BASE}/pets", headers=headers)
+    client = get_http_client()
+    _stats["requests_total"] += 1
+    _stats["in_flight"] += 1
+    _stats["peak_in_flight"] = max(_stats["peak_in_flight"], _stats["in_flight"])
+    try:
+        return await client.get(path, headers=headers, timeout=_timeout_for(endpoint))
+    except httpx.RequestError:
+        _stats["requests_failed"] += 1
+        raise
+    finally:
+        _stats["in_flight"] -= 1
+
+
+async def get_user_by_id(user_id: str, token: str):
+    try:
+        response = await _get("user", "/users/profile", token)
         response.raise_for_status()
-        pets = response.json().get("pets", [])
+        return response.json().get("user", {})
+    except httpx.HTTPStatusError as e:
+        logger.error("User API returned %s: %s", e.response.status_code, e)
+        raise
+    except httpx.RequestError as e:
+        logger.error("User API request error: %s", e)
+        raise
+
+async def get_pets(token: str) -> list:
+    response = await _get("pets", "/pets", token)
+    response.raise_for_status()
+    return response.json().get("pets", [])
+
+async def get_pet(pet_id: str, token: str):
+    """
+    Fetches a single pet through GET /pets/{pet_id}. Only used when
+    PHP_SINGLE_PET_ENDPOINT is enabled. Returns None when the pet does not exist.
+    """
+    response = await _get("pet", f"/pets/{pet_id}", token)
+    if response.status_code == 404:
+        return None
+    response.raise_for_status()
+    payload = response.json()
+    return payload.get("pet") or payload.get("data") or None
 
-    for pet in pets:
-        if str(pet.get("pet_id")) == str(pet_id):
-            return pet
+def index_pets(pets: list) -> dict:
+    return {str(pet.get("pet_id")): pet for pet in pets if pet.get("pet_id") is not None}
 
-    return None
+async def get_pet_by_id(pet_id: str, token: str):
+    if PHP_SINGLE_PET_ENDPOINT:
+        return await get_pet(pet_id, token)
+    pets = await get_pets(token)
+    return index_pets(pets).get(str(pet_id))
 
 async def get_pet_status_by_id(pet_id: str, token: str):
-    headers = {"Authorization": f"Bearer {token}"}
-    async with httpx.AsyncClient(timeout=10.0) as client:
-        response = await client.get(f"{API_BASE}/pets/{pet_id}/status", headers=headers)
+    response = await _get("pet_status", f"/pets/{pet_id}/status", token)
 
-        if response.status_code == 404:
-            print(f"⚠ No status found for pet {pet_id}. Returning default.")
-            return {}  
+    if response.status_code == 404:
+        logger.warning("No status found for pet %s. Returning default.", pet_id)
+        return {}
 
-        response.raise_for_status()
-        return response.json().get("data", {})
+    response.raise_for_status()
+    return response.json().get("data", {})
@@ -0,0 +1,175 @@
+import gzip
+import logging
+import os
+from functools import lru_cache
+from typing import Dict, List
+from decouple import config
+
+from app.utils.prompt_builder import build_pet_prompt, system_prompt
+
+logger = logging.getLogger("prompt_budget")
+
+# --- Tokenizer ---
+# By default the bundled o200k_base tokenizer, the encoding of the gpt-oss chat models
+# (built by scripts/export_prompt_tokenizer.py). PROMPT_TOKENIZER_PATH takes any
+# tokenizer.json, gzipped or not; PROMPT_TOKENIZER_NAME instead fetches one through the
+# Hugging Face hub on first use. If none loads we fall back to ~4 characters per token.
+DEFAULT_TOKENIZER_PATH = os.path.join(os.path.dirname(__file__), "tokenizers", "o200k_base.json.gz")
+PROMPT_TOKENIZER_PATH = config("PROMPT_TOKENIZER_PATH", default=DEFAULT_TOKENIZER_PATH)
+PROMPT_TOKENIZER_NAME = config("PROMPT_TOKENIZER_NAME", default="")
+
+# --- Budgets (input tokens for system + user prompt) ---
+PROMPT_TOKEN_BUDGET = config("PROMPT_TOKEN_BUDGET", default=3000, cast=int)
+# Per-model overrides, e.g. "llama-3.1-8b-instant=2000,qwen/qwen3-32b=4000"
+PROMPT_TOKEN_BUDGETS = config("PROMPT_TOKEN_BUDGETS", default="")
+
+
+def parse_model_budgets(spec: str) -> Dict[str, int]:
+    budgets = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        model, _, tokens = item.rpartition("=")
+        budgets[model.strip()] = int(tokens)
+    return budgets
+
+
+MODEL_PROMPT_BUDGETS = parse_model_budgets(PROMPT_TOKEN_BUDGETS)
+PROMPT_COMPACT_MODE = config("PROMPT_COMPACT_MODE", default=False, cast=bool)
+# History lines kept before low-priority sections are dropped
+MIN_HISTORY_MESSAGES = config("PROMPT_MIN_HISTORY_MESSAGES", default=2, cast=int)
+
+
+@lru_cache(maxsize=1)
+def get_tokenizer():
+    try:
+        from tokenizers import Tokenizer
+        if PROMPT_TOKENIZER_NAME:
+            return Tokenizer.from_pretrained(PROMPT_TOKENIZER_NAME)
+        if PROMPT_TOKENIZER_PATH.endswith(".gz"):
+            with gzip.open(PROMPT_TOKENIZER_PATH, "rt", encoding="utf-8") as f:
+                return Tokenizer.from_str(f.read())
+        if PROMPT_TOKENIZER_PATH:
+            return Tokenizer.from_file(PROMPT_TOKENIZER_PATH)
+        logger.warning("No prompt tokenizer configured; token budgets use a ~4 characters per token estimate")
+    except Exception as e:
+        logger.warning("Prompt tokenizer unavailable; token budgets use a ~4 characters per token estimate: %s", e)
+    return None
+
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    tokenizer = get_tokenizer()
+    if tokenizer is None:
+        return len(text) // 4 + 1
+    return len(tokenizer.encode(text, add_special_tokens=False).ids)
+
+
+def budget_for_model(model: str) -> int:
+    return MODEL_PROMPT_BUDGETS.get(model, PROMPT_TOKEN_BUDGET)
+
+
+def render_history(messages: List[Dict], owner_name: str, pet_name: str) -> List[str]:
+    return [
+        f"{owner_name}: {msg['text']}" if msg["sender"] == "user" else f"{pet_name}: {msg['text']}"
+        for msg in messages
+    ]
+
+
+def build_budgeted_prompts(
+    pet: dict,
+    owner_name: str,
+    pet_name: str,
+    history: List[Dict],
+    model: str,
+    pet_status: dict = None,
+    biography_snippet: dict = None,
+    message: str = "",
+    compact: bool = None,
+    recalled_memories: List[str] = None,
+    conversation_summary: str = "",
+) -> dict:
+    """
+    Builds the system and user prompts and keeps them within the model's token budget.
+    `history` is the unsummarized tail of the conversation; `conversation_summary`
+    covers everything before it. Over budget, the history is trimmed oldest-first down
+    to MIN_HISTORY_MESSAGES, then recalled long-term memories are dropped, then the
+    owner facts section, then the summary, then the remaining history.
+
+    Returns {"system_prompt", "prompt", "tokens", "budget", "history_kept", "dropped"}.
+    """
+    if compact is None:
+        compact = PROMPT_COMPACT_MODE
+    budget = budget_for_model(model)
+    lines = render_history(history, owner_name, pet_name)
+
+    built_system_prompt = system_prompt(pet, owner_name)
+    system_tokens = count_tokens(built_system_prompt)
+
+    def render(keep: int, include_knowledge: bool) -> str:
+        prompt = build_pet_prompt(
+            pet,
+            owner_name,
+            memory_snippet="\n".join(lines[len(lines) - keep:]) if keep else "",
+            pet_status=pet_status,
+            message=message,
+            biography_snippet=biography_snippet,
+            compact=compact,
+            include_knowledge=include_knowledge,
+            recalled_memories=recalled_memories,
+            conversation_summary=conversation_summary,
+        )
+        return prompt + f"\n{pet_name}:"
+
+    keep = len(lines)
+    include_knowledge = True
+    dropped = []
+    prompt = render(keep, include_knowledge)
+    tokens = system_tokens + count_tokens(prompt)
+
+    if tokens > budget and keep > MIN_HISTORY_MESSAGES:
+        # Estimate from per-line counts, then re-render once.
+        line_tokens = [count_tokens(line) + 1 for line in lines]
+        fixed = tokens - sum(line_tokens)
+        while keep > MIN_HISTORY_MESSAGES and fixed + sum(line_tokens[len(lines) - keep:]) > budget:
+            keep -= 1
+        dropped.append(f"history:{len(lines) - keep}")
+        prompt = render(keep, include_knowledge)
+        tokens = system_tokens + count_tokens(prompt)
+
+    if tokens > budget and recalled_memories:
+        dropped.append(f"memories:{len(recalled_memories)}")
+        recalled_memories = None
+        prompt = render(keep, include_knowledge)
+        tokens = system_tokens + count_tokens(prompt)
+
+    if tokens > budget and biography_snippet:
+        include_knowledge = False
+        dropped.append("knowledge")
+        prompt = render(keep, include_knowledge)
+        tokens = system_tokens + count_tokens(prompt)
+
+    if tokens > budget and conversation_summary:
+        dropped.append("summary")
+        conversation_summary = ""
+        prompt = render(keep, include_knowledge)
+        tokens = system_tokens + count_tokens(prompt)
+
+    if tokens > budget and keep:
+        dropped.append(f"history:{keep}")
+        keep = 0
+        prompt = render(keep, include_knowledge)
+        tokens = system_tokens + count_tokens(prompt)
+
+    if tokens > budget:
+        logger.warning("Prompt still over budget for %s: %d > %d tokens", model, tokens, budget)
+    if dropped:
+        logger.info("Prompt trimmed to %d tokens (budget %d): dropped %s", tokens, budget, ", ".join(dropped))
+
+    return {
+        "system_prompt": built_system_prompt,
+        "prompt": prompt,
+        "tokens": tokens,
+        "budget": budget,
+        "history_kept": keep,
+        "dropped": dropped,
+    }
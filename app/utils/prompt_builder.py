@@ -1,15 +1,36 @@
-from app.utils.pet_logic.behavior_engine import BehaviorEngine
+import re
+from functools import lru_cache
+from decouple import config
+
+from app.utils.pet_logic.behavior_engine import BehaviorEngine, Mood
 from app.utils.pet_logic.personality_engine import PersonalityEngine
 from app.utils.pet_logic.lifestage_engine import LifestageEngine
 from app.utils.pet_logic.breed_engine import BreedEngine
+from app.utils.metrics import timed
 
-def system_prompt(pet: dict, owner_name: str) -> str:
-    pet_type = (pet.get("pet_type") or pet.get("species", "pet")).capitalize()
-    name = pet.get("pet_name") or pet.get("name", "Buddy")
-    breed = pet.get("breed", "Unknown Breed")
-    personality = pet.get("personality", "Gentle")
-    gender_raw = pet.get("gender", "0")
-    gender = "Female" if gender_raw == "1" else "Male"
+# Upper bound on distinct (breed, personality, lifestage, mood, hibernating) templates kept in memory
+PROMPT_FRAGMENT_CACHE_SIZE = config("PROMPT_FRAGMENT_CACHE_SIZE", default=1024, cast=int)
+
+_FIELD_MARKER = re.compile("\x00([a-z_]+)\x00")
+_PROFILE_KEYS = ("age", "gender", "profession")
+
+
+def _field(name: str) -> str:
+    # Placeholder that survives the f-string below and is turned into a str.format field.
+    return f"\x00{name}\x00"
+
+
+def _compile(text: str) -> str:
+    """
+    Turns rendered static text with _field() markers into a str.format template,
+    so per-request values are filled in with one format_map call.
+    """
+    text = text.replace("{", "{{").replace("}", "}}")
+    return _FIELD_MARKER.sub(lambda m: "{" + m.group(1) + "}", text)
+
+
+@lru_cache(maxsize=PROMPT_FRAGMENT_CACHE_SIZE)
+def _system_prompt(name: str, pet_type: str, owner_name: str, breed: str, gender: str, personality: str) -> str:
     return f"""
 You are {name}, a virtual {pet_type.lower()}. Your owner's name is {owner_name}.
 
@@ -21,99 +42,77 @@ Your core identity is defined by these traits:
 You must ALWAYS respond in the character of {name}. Be playful, natural, and emotionally expressive. Do not break character.
 """.strip()
 
-def build_pet_prompt(
-    pet: dict,
-    owner_name: str,
-    memory_snippet: str = "",
-    pet_status: dict = None,
-    biography_snippet: dict = None,
-    message: str = ""
-) -> str:
-    # Basic Info
+def system_prompt(pet: dict, owner_name: str) -> str:
     pet_type = (pet.get("pet_type") or pet.get("species", "pet")).capitalize()
+    name = pet.get("pet_name") or pet.get("name", "Buddy")
     breed = pet.get("breed", "Unknown Breed")
-    knowledge_base = pet.get("knowledge_base", {})
-    owner_name = knowledge_base.get("owner_name", owner_name)
     personality = pet.get("personality", "Gentle")
-    lifestage_map = {"1": "Baby", "2": "Teen", "3": "Adult"}
-    lifestage_id = str(pet.get("life_stage_id", "3"))  
-    age_stage = lifestage_map.get(lifestage_id, "Adult")
-    
-    # Lifestage Engine
-    lifestage_engine = LifestageEngine(age_stage)
-    lifestage_summary = lifestage_engine.get_summary()
-    # Personality Engine
-    personality_engine = PersonalityEngine(personality)
-    personality_summary = personality_engine.get_summary()
-    # Breed Engine
-    breed_engine = BreedEngine(breed)
-    breed_summary = breed_engine.get_summary()
+    gender_raw = pet.get("gender", "0")
+    gender = "Female" if gender_raw == "1" else "Male"
+    return _system_prompt(name, pet_type, owner_name, breed, gender, personality)
 
-    # OWNER PROFILE BLOCK
-    
-    if biography_snippet is None:
-        biography_snippet = {}
-        
-    owner_profile_lines = [f"Owner Name: {owner_name}"]
 
-    if biography_snippet.get("age"):
-        owner_profile_lines.append(f"Age: {biography_snippet['age']}")
-    if biography_snippet.get("gender"):
-        owner_profile_lines.append(f"Gender: {biography_snippet['gender']}")
-    if biography_snippet.get("profession"):
-        owner_profile_lines.append(f"Profession: {biography_snippet['profession']}")
+@lru_cache(maxsize=PROMPT_FRAGMENT_CACHE_SIZE)
+def _pet_prompt_template(breed: str, personality: str, age_stage: str, mood: Mood, mood_modifier: str, hibernating: bool, compact: bool = False) -> str:
+    """
+    Renders everything in the pet prompt that only depends on the pet's traits and
+    current mood, leaving fields for the per-request parts. `mood` is None when
+    no pet status is available. The mood's modifier is part of the key, so edits to
+    the mood rules do not keep serving cached directives.
 
-    owner_profile_block = "\n".join(owner_profile_lines)
-    # Pet Status Block
-    status_block = ""
-    if pet_status:
-        behavior_engine_input = {
-            "hunger": float(pet_status.get("hunger_level", 0.0)),
-            "energy": float(pet_status.get("energy_level", 0.0)),
-            "health": float(pet_status.get("health_level", 100.0)),
-            "stress": float(pet_status.get("stress_level", 0.0)),
-            "cleanliness": float(pet_status.get("cleanliness_level", 100.0)),
-            "happiness": float(pet_status.get("happiness_level", 100.0)),
-            "is_sick": pet_status.get("is_sick", "0"),
-        }
-        behavior = BehaviorEngine(behavior_engine_input)
-        behavior_summary = behavior.get_summary()
-        
-        hibernating = pet_status.get("hibernation_mode") == "1"
+    The compact layout states the breed, personality and lifestage guidance once:
+    it drops the separate "Breed Behavior" block, and drops the trait rules that the
+    response directive already covers.
+    """
+    lifestage_summary = LifestageEngine(age_stage).get_summary()
+    personality_summary = PersonalityEngine(personality).get_summary()
+    breed_summary = BreedEngine(breed).get_summary()
 
+    status_block = ""
+    response_directive = ""
+    if mood is not None:
         status_block = f"""
         --- CURRENT PET STATUS (FOR CONTEXT) ---
-        Mood: {behavior_summary['mood'].capitalize()}
-        Happiness: {pet_status.get("happiness_level", "100.0")}
-        Health: {pet_status.get("health_level", "100.0")}
-        Energy: {pet_status.get("energy_level", "100.0")}
-        Hunger: {pet_status.get("hunger_level", "100.0")}
-        Cleanliness: {pet_status.get("cleanliness_level", "100.0")}
-        Stress: {pet_status.get("stress_level", "0.0")}
-        Sick: {"Yes" if behavior_engine_input["is_sick"] == "1" else "No"}
+        Mood: {mood.value.capitalize()}
+        Happiness: {_field("happiness")}
+        Health: {_field("health")}
+        Energy: {_field("energy")}
+        Hunger: {_field("hunger")}
+        Cleanliness: {_field("cleanliness")}
+        Stress: {_field("stress")}
+        Sick: {_field("sick")}
         Hibernating: {"Yes" if hibernating else "No"}
         """.strip()
 
         # Tone Instructions
         response_directive = "--- RESPONSE DIRECTIVE (ABSOLUTE RULES) ---\n"
         response_directive += "Your response is governed by a strict hierarchy. Follow these rules in order:\n"
-        
+
         if hibernating:
             response_directive += "1. **Primary State:** You are hibernating. Your response MUST be sleepy, minimal, and perhaps confused about being woken up.\n"
         else:
-            response_directive += f"1. **Primary State:** {behavior_summary['modifier']}\n"
-        
+            response_directive += f"1. **Primary State:** {mood_modifier}\n"
+
         response_directive += f"2. **Personality Filter:** After obeying Rule #1, apply your '{personality}' personality. ({personality_summary['modifier']})\n"
         response_directive += f"3. **Breed Filter:** Let your '{breed}' breed traits subtly influence your actions. ({breed_summary['modifier']})\n"
         response_directive += f"4. **Lifestage Filter:** Act your age. You are a '{age_stage}'. ({lifestage_summary['summary']})"
 
-    # --- Memory & Knowledge ---
-    memory_section = f"\n\n--- Memory Snippet ---\n{memory_snippet}" if memory_snippet else ""
-    knowledge_section = f"\n\n--- What You Know About Your Owner ---\n{biography_snippet}" if biography_snippet else ""
+    breed_behavior_block = f"- Breed Behavior -\n{breed_summary['modifier']}\n\n"
+    trait_rules = (
+        f"- Your current lifestage is \"{lifestage_summary['lifestage']}\". You must act your age: {lifestage_summary['summary']}\n"
+        f"- Let your breed's traits influence you: {breed_summary['modifier']}\n"
+        f"- Let your personality guide your tone: {personality_summary['modifier']}\n"
+    )
+    if compact:
+        breed_behavior_block = ""
+        status_block = "\n".join(line.strip() for line in status_block.splitlines())
+        if response_directive:
+            trait_rules = ""
+
     # Prompt
-    return f"""
+    text = f"""
 CONTEXT FOR YOUR RESPONSE:
-Your owner, {owner_name}, just sent you a message. You must respond based on your current status and the rules below.
+Your owner, {_field("owner_name")}, just sent you a message. You must respond based on your current status and the rules below.
 — Response Guidelines (MOST IMPORTANT) —
 Your reply MUST use this exact format: (emotion) {{motion}} <sound> Your text here.
 1. **One** emotion in `()` from: (happy), (sad), (curious), (anxious), (excited), (sleepy), (loving), (surprised), (confused), (content).
@@ -125,27 +124,141 @@ Your reply MUST use this exact format: (emotion) {{motion}} <sound> Your text he
 {response_directive}
 {status_block}
 Use the memory below for multiple-turn context if relevant:
-{memory_section}
-
-- Breed Behavior -
-{breed_summary["modifier"]}
+{_field("memory_section")}
 
-— Owner Profile —
-{owner_profile_block}
+{breed_behavior_block}— Owner Profile —
+{_field("owner_profile_block")}
 
 - User Preferences -
-{knowledge_section}\n\n
+{_field("knowledge_section")}\n\n
 
 
 — Personality & Behavior Rules —
-- Your current lifestage is "{lifestage_summary['lifestage']}". You must act your age: {lifestage_summary['summary']}
-- Let your breed's traits influence you: {breed_summary["modifier"]}
-- Let your personality guide your tone: {personality_summary["modifier"]}
-- Energy + Mood = determines tone (e.g., calm, hyper, clingy, etc.)
+{trait_rules}- Energy + Mood = determines tone (e.g., calm, hyper, clingy, etc.)
 
 — Language Rule —
 This is the user's latest message to you:
-\n{message}\n
+\n{_field("message")}\n
 **ALWAYS reply in the SAME LANGUAGE as the owner's latest message.** 
 Do not switch languages unless your owner does.
-""".strip()
\ No newline at end of file
+""".strip()
+    if compact:
+        text = re.sub(r"\n{3,}", "\n\n", text)
+    return _compile(text)
+
+
+def get_prompt_cache_stats() -> dict:
+    stats = {}
+    for name, cached in (("pet_prompt", _pet_prompt_template), ("system_prompt", _system_prompt)):
+        info = cached.cache_info()
+        lookups = info.hits + info.misses
+        stats[name] = {
+            "hits": info.hits,
+            "misses": info.misses,
+            "size": info.currsize,
+            "maxsize": info.maxsize,
+            "hit_rate": round(info.hits / lookups, 4) if lookups else 0.0,
+        }
+    return stats
+
+
+@timed("build_pet_prompt")
+def build_pet_prompt(
+    pet: dict,
+    owner_name: str,
+    memory_snippet: str = "",
+    pet_status: dict = None,
+    biography_snippet: dict = None,
+    message: str = "",
+    compact: bool = False,
+    include_knowledge: bool = True,
+    recalled_memories: list = None,
+    conversation_summary: str = "",
+) -> str:
+    """
+    Builds the per-turn user prompt. `compact` selects the deduplicated layout and
+    lists owner facts as lines instead of a dict; `include_knowledge=False` leaves
+    out the owner facts section (used by the prompt budgeter). `recalled_memories`
+    are older exchanges from long-term memory and `conversation_summary` the running
+    summary of everything before the recent history; both are shown ahead of it.
+    """
+    # Basic Info
+    breed = pet.get("breed", "Unknown Breed")
+    knowledge_base = pet.get("knowledge_base", {})
+    owner_name = knowledge_base.get("owner_name", owner_name)
+    personality = pet.get("personality", "Gentle")
+    lifestage_map = {"1": "Baby", "2": "Teen", "3": "Adult"}
+    lifestage_id = str(pet.get("life_stage_id", "3"))
+    age_stage = lifestage_map.get(lifestage_id, "Adult")
+
+    # OWNER PROFILE BLOCK
+
+    if biography_snippet is None:
+        biography_snippet = {}
+
+    owner_profile_lines = [f"Owner Name: {owner_name}"]
+
+    if biography_snippet.get("age"):
+        owner_profile_lines.append(f"Age: {biography_snippet['age']}")
+    if biography_snippet.get("gender"):
+        owner_profile_lines.append(f"Gender: {biography_snippet['gender']}")
+    if biography_snippet.get("profession"):
+        owner_profile_lines.append(f"Profession: {biography_snippet['profession']}")
+
+    owner_profile_block = "\n".join(owner_profile_lines)
+
+    # Pet Status: only the mood is part of the cached template, the numbers are filled in per request
+    mood = None
+    mood_modifier = None
+    hibernating = False
+    status_values = {}
+    if pet_status:
+        behavior_engine_input = {
+            "hunger": float(pet_status.get("hunger_level", 0.0)),
+            "energy": float(pet_status.get("energy_level", 0.0)),
+            "health": float(pet_status.get("health_level", 100.0)),
+            "stress": float(pet_status.get("stress_level", 0.0)),
+            "cleanliness": float(pet_status.get("cleanliness_level", 100.0)),
+            "happiness": float(pet_status.get("happiness_level", 100.0)),
+            "is_sick": pet_status.get("is_sick", "0"),
+        }
+        mood, mood_modifier, _ = BehaviorEngine(behavior_engine_input).evaluate()
+        hibernating = pet_status.get("hibernation_mode") == "1"
+        status_values = {
+            "happiness": pet_status.get("happiness_level", "100.0"),
+            "health": pet_status.get("health_level", "100.0"),
+            "energy": pet_status.get("energy_level", "100.0"),
+            "hunger": pet_status.get("hunger_level", "100.0"),
+            "cleanliness": pet_status.get("cleanliness_level", "100.0"),
+            "stress": pet_status.get("stress_level", "0.0"),
+            "sick": "Yes" if behavior_engine_input["is_sick"] == "1" else "No",
+        }
+
+    # --- Memory & Knowledge ---
+    memory_section = f"\n\n--- Memory Snippet ---\n{memory_snippet}" if memory_snippet else ""
+    if recalled_memories:
+        recalled = "\n".join("- " + memory.replace("\n", "\n  ") for memory in recalled_memories)
+        memory_section = f"\n\n--- Things You Remember From Earlier ---\n{recalled}{memory_section}"
+    if conversation_summary:
+        memory_section = f"\n\n--- Your Story So Far ---\n{conversation_summary}{memory_section}"
+    knowledge_section = ""
+    if biography_snippet and include_knowledge:
+        knowledge = biography_snippet
+        if compact:
+            # Age, gender and profession are already in the owner profile block.
+            knowledge = "\n".join(
+                f"- {key}: {value}" for key, value in biography_snippet.items()
+                if key not in _PROFILE_KEYS and value not in (None, "")
+            )
+        if knowledge:
+            knowledge_section = f"\n\n--- What You Know About Your Owner ---\n{knowledge}"
+
+    template = _pet_prompt_template(breed, personality, age_stage, mood, mood_modifier, hibernating, compact)
+    return template.format_map({
+        "owner_name": owner_name,
+        "memory_section": memory_section,
+        "owner_profile_block": owner_profile_block,
+        "knowledge_section": knowledge_section,
+        "message": message,
+        **status_values,
+    })
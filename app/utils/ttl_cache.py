@@ -0,0 +1,143 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable
+
+logger = logging.getLogger("ttl_cache")
+
+
+class AsyncTTLCache:
+    """
+    Bounded LRU cache with per-entry TTL for use inside the event loop.
+
+    - Entries are fresh for `ttl` seconds, then served stale for up to `stale_ttl`
+      more seconds while a single background refresh runs (stale-while-revalidate).
+    - Concurrent misses on the same key share one loader call (single-flight).
+    - Least recently used entries are evicted once `maxsize` is reached.
+    """
+
+    def __init__(self, name: str, maxsize: int, ttl: float, stale_ttl: float = 0.0, cache_none: bool = False):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.cache_none = cache_none
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._inflight: dict = {}
+        self._refresh_tasks: set = set()
+        self._stats = {
+            "hits": 0,
+            "stale_hits": 0,
+            "misses": 0,
+            "refreshes": 0,
+            "refresh_errors": 0,
+            "evictions": 0,
+        }
+
+    # --- Plain access ---
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Returns a fresh value without loading, or `default`."""
+        entry = self._entries.get(key)
+        if entry is None or entry[1] < time.monotonic():
+            return default
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def peek(self, key: Hashable, default: Any = None) -> Any:
+        """Returns a fresh or stale (not yet expired) value, without counting it as a use."""
+        entry = self._entries.get(key)
+        if entry is None or entry[2] < time.monotonic():
+            return default
+        return entry[0]
+
+    def set(self, key: Hashable, value: Any, ttl: float = None):
+        now = time.monotonic()
+        fresh_until = now + (self.ttl if ttl is None else ttl)
+        self._entries[key] = (value, fresh_until, fresh_until + self.stale_ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def invalidate(self, key: Hashable) -> bool:
+        return self._entries.pop(key, None) is not None
+
+    def invalidate_where(self, predicate: Callable[[Hashable], bool]) -> int:
+        keys = [key for key in self._entries if predicate(key)]
+        for key in keys:
+            del self._entries[key]
+        return len(keys)
+
+    def clear(self):
+        self._entries.clear()
+
+    # --- Loading access ---
+
+    async def get_or_load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        now = time.monotonic()
+        entry = self._entries.get(key)
+        if entry is not None:
+            value, fresh_until, stale_until = entry
+            if now < fresh_until:
+                self._stats["hits"] += 1
+                self._entries.move_to_end(key)
+                return value
+            if now < stale_until:
+                self._stats["stale_hits"] += 1
+                self._entries.move_to_end(key)
+                self._schedule_refresh(key, loader)
+                return value
+
+        self._stats["misses"] += 1
+        return await self._load(key, loader)
+
+    async def _load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        pending = self._inflight.get(key)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await loader()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as exc:
+            future.set_exception(exc)
+            # Mark retrieved so an unawaited failure does not log "exception never retrieved".
+            future.exception()
+            raise
+        else:
+            if value is not None or self.cache_none:
+                self.set(key, value)
+            future.set_result(value)
+            return value
+        finally:
+            self._inflight.pop(key, None)
+
+    def _schedule_refresh(self, key: Hashable, loader: Callable[[], Awaitable[Any]]):
+        if key in self._inflight:
+            return
+        self._stats["refreshes"] += 1
+        task = asyncio.create_task(self._refresh(key, loader))
+        self._refresh_tasks.add(task)
+        task.add_done_callback(self._refresh_tasks.discard)
+
+    async def _refresh(self, key: Hashable, loader: Callable[[], Awaitable[Any]]):
+        try:
+            await self._load(key, loader)
+        except Exception as exc:
+            # Keep serving the stale entry until it expires.
+            self._stats["refresh_errors"] += 1
+            logger.warning("[%s] background refresh failed for a cached entry: %s", self.name, exc)
+
+    def stats(self) -> dict:
+        stats = dict(self._stats)
+        lookups = stats["hits"] + stats["stale_hits"] + stats["misses"]
+        stats["size"] = len(self._entries)
+        stats["maxsize"] = self.maxsize
+        stats["hit_rate"] = round((stats["hits"] + stats["stale_hits"]) / lookups, 4) if lookups else 0.0
+        return stats
@@ -1,44 +1,93 @@
 import logging
 from datetime import datetime
+from decouple import config
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
 from app.db.connection import user_profiles_collection
+from app.utils.ttl_cache import AsyncTTLCache
 
 logger = logging.getLogger("user_operations")
 
+# --- Profile cache (seconds) ---
+# Profiles change only through fact extraction, which writes through to this cache;
+# the TTL bounds how long another instance's writes take to show up here.
+PROFILE_CACHE_MAXSIZE = config("PROFILE_CACHE_MAXSIZE", default=10000, cast=int)
+PROFILE_CACHE_TTL = config("PROFILE_CACHE_TTL", default=300.0, cast=float)
+PROFILE_CACHE_STALE_TTL = config("PROFILE_CACHE_STALE_TTL", default=600.0, cast=float)
+
+_profile_cache = AsyncTTLCache("user_profile", PROFILE_CACHE_MAXSIZE, PROFILE_CACHE_TTL, PROFILE_CACHE_STALE_TTL)
+
+
+def _new_profile_fields(user_data_from_php: dict) -> dict:
+    return {
+        "email": user_data_from_php.get("email"),
+        "first_name": user_data_from_php.get("first_name"),
+        "pet_ids": [], # Can be populated later
+        "biography": {}, # IMPORTANT: Start with an empty biography object
+        "preferences": {
+        },
+        "metadata": {
+            "createdAt": datetime.utcnow()
+        }
+    }
+
+
+async def _upsert_profile(user_id: int, user_data_from_php: dict) -> dict:
+    """
+    Returns the user's profile, creating it from the PHP data if it does not exist,
+    in one atomic round trip. The unique index on user_id makes concurrent first
+    messages converge on a single document.
+    """
+    try:
+        return await user_profiles_collection.find_one_and_update(
+            {"user_id": user_id},
+            {"$setOnInsert": _new_profile_fields(user_data_from_php)},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+    except DuplicateKeyError:
+        # Lost the insert race to another request; the winner's document is there now
+        return await user_profiles_collection.find_one({"user_id": user_id})
+
+
 async def get_or_create_user_profile(user_id: int, user_data_from_php: dict):
     """
     Finds a user profile by user_id. If it doesn't exist, it creates one
     using the data fetched from the external service. This is the entry point
     for ensuring a user exists in our local database.
+
+    Served from the in-process profile cache when possible. The caller gets its own
+    copy (with its own biography dict) and may modify it freely.
     """
     try:
-        # 1. Try to find the user in our database
-        profile = await user_profiles_collection.find_one({"user_id": user_id})
-
-        if profile:
-            # The user already exists, so we just return their profile
-            logger.info(f"Found existing profile for user_id: {user_id}")
-            return profile
-
-        # 2. If not found, we create the new document
-        logger.info(f"Creating new profile for user_id: {user_id}")
-        
-        new_profile_doc = {
-            "user_id": user_id,
-            "email": user_data_from_php.get("email"),
-            "first_name": user_data_from_php.get("first_name"),
-            "pet_ids": [], # Can be populated later
-            "biography": {}, # IMPORTANT: Start with an empty biography object
-            "preferences": {
-            },
-            "metadata": {
-                "createdAt": datetime.utcnow()
-            }
-        }
-        
-        await user_profiles_collection.insert_one(new_profile_doc)
-        
-        return new_profile_doc
-
+        profile = await _profile_cache.get_or_load(user_id, lambda: _upsert_profile(user_id, user_data_from_php))
     except Exception as e:
-        logger.error(f"Error in get_or_create_user_profile for user_id {user_id}: {e}", exc_info=True)
-        return None
\ No newline at end of file
+        logger.error("Error in get_or_create_user_profile for user_id %s: %s", user_id, e, exc_info=True)
+        return None
+    if profile is None:
+        return None
+    return {**profile, "biography": dict(profile.get("biography") or {})}
+
+
+def update_cached_profile(user_id: int, update_fields: dict):
+    """
+    Applies a `$set` document (dotted paths like "biography.name") to the cached
+    profile after it was written to Mongo, fresh or stale, so a stale entry served
+    while it revalidates already has the new facts. Uncached users are left alone;
+    their next read loads the stored document.
+    """
+    profile = _profile_cache.peek(user_id)
+    if profile is None:
+        return
+    for path, value in update_fields.items():
+        target = profile
+        *parents, leaf = path.split(".")
+        for key in parents:
+            if not isinstance(target.get(key), dict):
+                target[key] = {}
+            target = target[key]
+        target[leaf] = value
+
+
+def get_profile_cache_stats() -> dict:
+    return _profile_cache.stats()
@@ -0,0 +1,138 @@
+"""
+Embedding throughput: torch (sentence-transformers) vs the ONNX Runtime export.
+
+Two measurements per backend:
+  - backend: texts/sec when encoding fixed-size batches directly (best of --rounds)
+  - service: texts/sec through EmbeddingService with --concurrency coroutines each
+    embedding distinct texts, with micro-batching on and off (max_batch=1); the
+    cache is disabled so every request reaches the model
+
+The ONNX backend needs an export first: python scripts/export_embedding_onnx.py
+Backends that cannot load are reported as skipped.
+
+Usage:
+    python benchmarks/embedding_bench.py [--backends torch,onnx] [--batch-sizes 1,8,32,64]
+                                         [--texts 512] [--concurrency 64] [--output result.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+
+from benchmarks.fixtures import USER_MESSAGES, random_reply  # noqa: E402
+from app.utils.embedding_service import (  # noqa: E402
+    EMBEDDING_BATCH_WINDOW_MS,
+    EMBEDDING_MAX_BATCH,
+    EmbeddingService,
+    load_backend,
+)
+
+
+def build_texts(rng: random.Random, count: int) -> list:
+    # Exchanges shaped like the documents pet memory stores; all distinct
+    return [
+        f"Alex: {rng.choice(USER_MESSAGES)}\nMochi: {random_reply(rng)} #{i}"
+        for i in range(count)
+    ]
+
+
+def bench_backend(backend, texts: list, batch_size: int, rounds: int) -> dict:
+    backend.encode(texts[:batch_size])  # warm-up
+    timings = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        for start in range(0, len(texts), batch_size):
+            backend.encode(texts[start:start + batch_size])
+        timings.append(time.perf_counter() - started)
+    best = min(timings)
+    return {
+        "texts_per_sec": round(len(texts) / best, 1),
+        "ms_per_batch": round(best / -(-len(texts) // batch_size) * 1000, 3),
+        "spread": round((max(timings) - best) / best, 3),
+    }
+
+
+async def bench_service(backend, texts: list, concurrency: int, window_ms: int, max_batch: int) -> dict:
+    service = EmbeddingService(window_ms=window_ms, max_batch=max_batch, cache_size=0)
+    service.backend = backend
+    await service.start()
+    latencies = []
+    chunks = [texts[i::concurrency] for i in range(concurrency)]
+
+    async def worker(chunk):
+        for text in chunk:
+            started = time.perf_counter()
+            await service.embed(text)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(chunk) for chunk in chunks))
+    elapsed = time.perf_counter() - started
+    stats = service.stats()
+    await service.stop()
+    latencies.sort()
+    return {
+        "texts_per_sec": round(len(texts) / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies) * 1000, 2),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 2),
+        "avg_batch_size": stats["avg_batch_size"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare torch and ONNX embedding throughput.")
+    parser.add_argument("--backends", default="torch,onnx")
+    parser.add_argument("--batch-sizes", default="1,8,32,64")
+    parser.add_argument("--texts", type=int, default=512)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--window-ms", type=int, default=EMBEDDING_BATCH_WINDOW_MS)
+    parser.add_argument("--max-batch", type=int, default=EMBEDDING_MAX_BATCH)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Also write the JSON report to this file.")
+    args = parser.parse_args()
+
+    texts = build_texts(random.Random(args.seed), args.texts)
+    batch_sizes = [int(size) for size in args.batch_sizes.split(",")]
+    report = {"texts": len(texts), "backends": {}}
+
+    for name in args.backends.split(","):
+        try:
+            backend = load_backend(name)
+        except Exception as e:
+            print(f"{name}: skipped ({e})", file=sys.stderr)
+            report["backends"][name] = {"skipped": str(e)}
+            continue
+
+        result = {"backend": {}, "service": {}}
+        for size in batch_sizes:
+            result["backend"][f"batch_{size}"] = bench_backend(backend, texts, size, args.rounds)
+            print(f"{name:<6} batch {size:<4} {result['backend'][f'batch_{size}']['texts_per_sec']:>10,.0f} texts/s", file=sys.stderr)
+        for label, window, max_batch in (("batched", args.window_ms, args.max_batch), ("unbatched", 0, 1)):
+            result["service"][label] = asyncio.run(bench_service(backend, texts, args.concurrency, window, max_batch))
+            print(f"{name:<6} service {label:<10} {result['service'][label]['texts_per_sec']:>8,.0f} texts/s", file=sys.stderr)
+        report["backends"][name] = result
+
+    measured = {name: r for name, r in report["backends"].items() if "skipped" not in r}
+    if "torch" in measured and "onnx" in measured:
+        report["onnx_speedup"] = {
+            key: round(measured["onnx"]["backend"][key]["texts_per_sec"] / measured["torch"]["backend"][key]["texts_per_sec"], 2)
+            for key in measured["torch"]["backend"]
+        }
+
+    payload = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(payload + "\n")
+    print(payload)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Randomized but realistic inputs shared by the benchmark scripts: PHP pet and status
+payloads, owner profiles, chat messages and LLM replies. All generators take a
+random.Random so runs are reproducible with a fixed seed.
+"""
+import random
+
+from app.utils.extract_response import VALID_EMOTIONS
+from app.utils.pet_logic.breed_engine import Breed
+from app.utils.pet_logic.personality_engine import Personality
+
+MOTIONS = [
+    "bow head", "crouch down", "jump up", "lick", "lie down", "paw scratching", "perk ears",
+    "raise paw", "roll over showing belly", "shake body", "sit", "sniff", "chase tail",
+    "stretch", "tilt head", "wag tail",
+]
+SOUNDS = ["growl", "whimper", "bark", "pant", "yawn", "sniff", "yip", "meow", "purr"]
+REPLY_TEXTS = [
+    "I missed you so much today!",
+    "Can we go for a walk now?",
+    "My tummy is rumbling...",
+    "Is that a new toy for me?",
+    "I'm so sleepy, five more minutes.",
+    "You smell like the park!",
+    "I don't feel so good today.",
+    "Let's play fetch again!",
+]
+USER_MESSAGES = [
+    "Hi buddy, how are you today?",
+    "Did you miss me?",
+    "Want to go to the park?",
+    "I'm home!",
+    "Good morning sunshine",
+    "Are you hungry?",
+    "My name is Alex and I love hiking",
+    "I work as a nurse, long day today",
+    "I live in Seoul now",
+    "What did you do while I was out?",
+    "오늘 기분 어때?",
+    "Let's take a nap together",
+]
+
+
+def random_pet(rng: random.Random, pet_id: int) -> dict:
+    return {
+        "pet_id": pet_id,
+        "name": rng.choice(["Mochi", "Coco", "Bori", "Luna", "Max", "Nabi"]),
+        "pet_type": rng.choice(["dog", "cat"]),
+        "breed": rng.choice(list(Breed)).value,
+        "personality": rng.choice(list(Personality)).value,
+        "gender": rng.choice(["0", "1"]),
+        "life_stage_id": rng.choice(["1", "2", "3"]),
+    }
+
+
+def random_pet_status(rng: random.Random) -> dict:
+    # The PHP API sends levels as strings; a few statuses sit near the mood thresholds.
+    def level(low=0.0, high=100.0):
+        return f"{rng.uniform(low, high):.1f}"
+
+    return {
+        "hunger_level": level(),
+        "energy_level": level(),
+        "health_level": level(20.0),
+        "stress_level": level(0.0, 80.0),
+        "cleanliness_level": level(10.0),
+        "happiness_level": level(10.0),
+        "is_sick": "1" if rng.random() < 0.1 else "0",
+        "hibernation_mode": "1" if rng.random() < 0.05 else "0",
+    }
+
+
+def random_user(rng: random.Random, user_id: int) -> dict:
+    return {
+        "user_id": user_id,
+        "first_name": rng.choice(["Alex", "Jin", "Sam", "Mina", "Chris"]),
+        "email": f"user{user_id}@example.com",
+        "profession": rng.choice(["nurse", "engineer", "teacher", ""]),
+        "gender": rng.choice(["0", "1", "2"]),
+        "birth_date": f"{rng.randint(1960, 2010)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+    }
+
+
+def random_biography(rng: random.Random) -> dict:
+    biography = {"age": rng.randint(16, 70), "gender": rng.choice(["he/him", "she/her", "they/them"])}
+    if rng.random() < 0.5:
+        biography["profession"] = rng.choice(["NURSE", "ENGINEER", "TEACHER"])
+    if rng.random() < 0.5:
+        biography["favorite_food"] = rng.choice(["pizza", "kimchi", "burgers"])
+    return biography
+
+
+def random_reply(rng: random.Random, pet_name: str = "") -> str:
+    reply = (
+        f"({rng.choice(VALID_EMOTIONS)}) {{{rng.choice(MOTIONS)}}} <{rng.choice(SOUNDS)}> "
+        f"{rng.choice(REPLY_TEXTS)}"
+    )
+    if pet_name and rng.random() < 0.3:
+        reply = f"{pet_name}: {reply}"
+    return reply
+
+
+def random_history(rng: random.Random, length: int) -> list:
+    return [
+        {"sender": "user" if i % 2 == 0 else "ai", "text": rng.choice(USER_MESSAGES) if i % 2 == 0 else random_reply(rng)}
+        for i in range(length)
+    ]
@@ -0,0 +1,303 @@
+"""
+End-to-end load test for the chat API without any external service.
+
+The FastAPI app runs in-process (lifespan included) with three local stand-ins:
+  - a fake PHP API, served through an ASGI transport in place of php_service's client
+  - a fake LLM provider (configurable latency, jitter and error rate) in place of Groq,
+    behind the model router that generate_response / stream_response use
+  - an in-process Mongo substitute (mongomock-motor) patched over the app's collections
+
+Simulated users send a weighted mix of /chat, /chat/stream and /history requests.
+The report is JSON: throughput plus p50/p95/p99 latency per endpoint, and the app's
+own cache, router and background job stats.
+
+Requires `pip install mongomock-motor` in addition to the app requirements.
+
+Usage:
+    python benchmarks/load_test.py [--users 20] [--duration 30] [--llm-latency 0.6]
+                                   [--mix chat=0.7,stream=0.2,history=0.1] [--output result.json]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from urllib.parse import urlparse
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+
+# Settings that keep the run hermetic; explicit environment values still win.
+os.environ.setdefault("MONGO_URI", "mongodb://load-test.invalid")  # never contacted
+os.environ.setdefault("GROQ_API_KEY", "load-test")
+os.environ.setdefault("BACKGROUND_JOB_BACKEND", "memory")
+os.environ.setdefault("PROMPT_TOKENIZER_NAME", "")
+os.environ.setdefault("PET_MEMORY_ENABLED", "false")
+
+import httpx  # noqa: E402
+from fastapi import FastAPI, Header, HTTPException  # noqa: E402
+
+from benchmarks.fixtures import USER_MESSAGES, random_pet, random_pet_status, random_reply, random_user  # noqa: E402
+
+logger = logging.getLogger("load_test")
+
+ENDPOINTS = ("chat", "stream", "history")
+
+
+# --- Stand-ins ---
+
+def build_fake_php(rng: random.Random, latency: float, jitter: float, pets_per_user: int) -> FastAPI:
+    """PHP API double for the endpoints php_service calls. Tokens look like "user-<id>"."""
+    php = FastAPI()
+    users, pets = {}, {}
+
+    def owner(authorization: str) -> int:
+        try:
+            return int(authorization.split("user-", 1)[1])
+        except (IndexError, ValueError):
+            raise HTTPException(status_code=401)
+
+    def user_pets(user_id: int) -> list:
+        if user_id not in pets:
+            pets[user_id] = [random_pet(rng, user_id * 10 + k) for k in range(pets_per_user)]
+        return pets[user_id]
+
+    async def delay():
+        await asyncio.sleep(max(0.0, latency + rng.uniform(-jitter, jitter)))
+
+    @php.get("/users/profile")
+    async def profile(authorization: str = Header("")):
+        await delay()
+        user_id = owner(authorization)
+        if user_id not in users:
+            users[user_id] = random_user(rng, user_id)
+        return {"user": users[user_id]}
+
+    @php.get("/pets")
+    async def list_pets(authorization: str = Header("")):
+        await delay()
+        return {"pets": user_pets(owner(authorization))}
+
+    @php.get("/pets/{pet_id}")
+    async def get_pet(pet_id: int, authorization: str = Header("")):
+        await delay()
+        for pet in user_pets(owner(authorization)):
+            if pet["pet_id"] == pet_id:
+                return {"pet": pet}
+        raise HTTPException(status_code=404)
+
+    @php.get("/pets/{pet_id}/status")
+    async def get_status(pet_id: int, authorization: str = Header("")):
+        await delay()
+        return {"data": random_pet_status(rng)}
+
+    return php
+
+
+def fake_llm_responder(rng: random.Random):
+    def respond(system_prompt: str, prompt: str) -> str:
+        if "extracts personal facts" in system_prompt:
+            return '{"results": []}' if '"results"' in prompt else "{}"
+        if "summarizes conversations" in system_prompt:
+            return "They chatted about walks, food and the owner's day."
+        # The chat prompt ends with "<pet name>:"
+        pet_name = prompt.rstrip().rsplit("\n", 1)[-1].rstrip(":")
+        return random_reply(rng, pet_name)
+    return respond
+
+
+def install_fake_mongo():
+    try:
+        from mongomock_motor import AsyncMongoMockClient
+    except ImportError:
+        sys.exit("The load test needs mongomock-motor: pip install mongomock-motor")
+    from motor.motor_asyncio import AsyncIOMotorCollection
+
+    fake_db = AsyncMongoMockClient().petpal_db
+    # Modules import collections by name, so every module-level reference is swapped.
+    for name, module in list(sys.modules.items()):
+        if not name.startswith("app.") or module is None:
+            continue
+        for attr, value in list(vars(module).items()):
+            if isinstance(value, AsyncIOMotorCollection):
+                setattr(module, attr, fake_db[value.name])
+    return fake_db
+
+
+# --- Load ---
+
+def percentile(ordered: list, q: float) -> float:
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, max(0, int(round(q * len(ordered))) - 1))]
+
+
+def summarize(samples: dict, elapsed: float) -> dict:
+    report = {}
+    for endpoint, records in samples.items():
+        latencies = sorted(latency for latency, ok, _ in records if ok)
+        statuses = defaultdict(int)
+        for _, _, status in records:
+            statuses[str(status)] += 1
+        report[endpoint] = {
+            "requests": len(records),
+            "errors": sum(1 for _, ok, _ in records if not ok),
+            "throughput_rps": round(len(records) / elapsed, 2) if elapsed else 0.0,
+            "mean_ms": round(sum(latencies) / len(latencies) * 1000, 2) if latencies else None,
+            "p50_ms": round(percentile(latencies, 0.50) * 1000, 2) if latencies else None,
+            "p95_ms": round(percentile(latencies, 0.95) * 1000, 2) if latencies else None,
+            "p99_ms": round(percentile(latencies, 0.99) * 1000, 2) if latencies else None,
+            "max_ms": round(latencies[-1] * 1000, 2) if latencies else None,
+            "status_codes": dict(statuses),
+        }
+    return report
+
+
+async def simulated_user(client, index: int, args, mix, rng, samples, measure_from: float, deadline: float):
+    user_id = 1000 + index
+    sent = 0
+    while time.monotonic() < deadline and (not args.requests or sent < args.requests):
+        endpoint = rng.choices(list(mix), weights=list(mix.values()))[0]
+        pet_id = user_id * 10 + rng.randrange(args.pets_per_user)
+        started = time.monotonic()
+        status = "exception"
+        ok = False
+        try:
+            if endpoint == "history":
+                response = await client.post(
+                    "/api/v1/history", params={"user_id": user_id, "pet_id": pet_id, "limit": 20}
+                )
+            else:
+                path = "/api/v1/chat" if endpoint == "chat" else "/api/v1/chat/stream"
+                response = await client.post(
+                    path,
+                    data={"user_id": user_id, "pet_id": pet_id, "message": rng.choice(USER_MESSAGES)},
+                    headers={"Authorization": f"user-{user_id}"},
+                )
+            status = response.status_code
+            ok = status == 200 and (endpoint != "stream" or "event: done" in response.text)
+        except Exception as e:
+            logger.warning("%s request failed: %s", endpoint, e)
+        if started >= measure_from:
+            samples[endpoint].append((time.monotonic() - started, ok, status))
+        sent += 1
+        if args.think_ms:
+            await asyncio.sleep(rng.expovariate(1000.0 / args.think_ms))
+
+
+async def run(args) -> dict:
+    import main
+    from app.utils import chat_handler, php_service
+    from app.utils.model_router import FakeProvider
+    from app.utils.background_jobs import get_background_job_stats
+    from app.utils.php_cache import get_php_cache_stats
+    from app.utils.prompt_builder import get_prompt_cache_stats
+    from app.utils.fact_extractor import get_fact_extraction_stats
+    from app.utils.chat_summary import get_chat_summary_stats
+    from app.utils.user_operations import get_profile_cache_stats
+
+    mix = {name: float(weight) for name, weight in (item.split("=") for item in args.mix.split(","))}
+    unknown = set(mix) - set(ENDPOINTS)
+    if unknown:
+        sys.exit(f"Unknown endpoints in --mix: {', '.join(sorted(unknown))}")
+
+    install_fake_mongo()
+    fake_php = build_fake_php(random.Random(args.seed + 1), args.php_latency, args.php_jitter, args.pets_per_user)
+    # API_BASE carries a path prefix, so the fake API is mounted under it.
+    php_root = FastAPI()
+    php_root.mount(urlparse(php_service.API_BASE).path.rstrip("/"), fake_php)
+    php_service._client = httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=php_root), base_url=php_service.API_BASE
+    )
+    chat_handler.router.providers["groq"] = FakeProvider(
+        latency=args.llm_latency,
+        jitter=args.llm_jitter,
+        error_rate=args.llm_error_rate,
+        responder=fake_llm_responder(random.Random(args.seed + 2)),
+        seed=args.seed + 3,
+    )
+
+    samples = {endpoint: [] for endpoint in mix}
+    async with main.app.router.lifespan_context(main.app):
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=main.app), base_url="http://petpal", timeout=60.0
+        ) as client:
+            started = time.monotonic()
+            measure_from = started + args.warmup
+            deadline = measure_from + args.duration if not args.requests else float("inf")
+            await asyncio.gather(*(
+                simulated_user(client, i, args, mix, random.Random(args.seed * 1000 + i), samples, measure_from, deadline)
+                for i in range(args.users)
+            ))
+            elapsed = time.monotonic() - max(measure_from, started) if not args.requests else time.monotonic() - started
+        app_stats = {
+            "php_cache": get_php_cache_stats(),
+            "prompt_cache": get_prompt_cache_stats(),
+            "profile_cache": get_profile_cache_stats(),
+            "llm_router": chat_handler.get_model_router_stats(),
+            "fact_extraction": get_fact_extraction_stats(),
+            "chat_summary": get_chat_summary_stats(),
+            "background_jobs": await get_background_job_stats(),
+        }
+
+    endpoints = summarize(samples, elapsed)
+    total = sum(report["requests"] for report in endpoints.values())
+    return {
+        "commit": _git_commit(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "log_level")},
+        "elapsed_s": round(elapsed, 3),
+        "total": {
+            "requests": total,
+            "errors": sum(report["errors"] for report in endpoints.values()),
+            "throughput_rps": round(total / elapsed, 2) if elapsed else 0.0,
+        },
+        "endpoints": endpoints,
+        "app_stats": app_stats,
+    }
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except Exception:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the chat API against local stand-ins.")
+    parser.add_argument("--users", type=int, default=20, help="Concurrent simulated users.")
+    parser.add_argument("--duration", type=float, default=30.0, help="Measured seconds per run.")
+    parser.add_argument("--warmup", type=float, default=2.0, help="Seconds of traffic before measuring.")
+    parser.add_argument("--requests", type=int, default=0, help="Requests per user instead of a fixed duration.")
+    parser.add_argument("--mix", default="chat=0.7,stream=0.2,history=0.1", help="Weighted endpoint mix.")
+    parser.add_argument("--think-ms", type=float, default=0.0, help="Mean pause between a user's requests.")
+    parser.add_argument("--pets-per-user", type=int, default=2)
+    parser.add_argument("--llm-latency", type=float, default=0.6, help="Fake LLM latency in seconds.")
+    parser.add_argument("--llm-jitter", type=float, default=0.2, help="Uniform +/- jitter on LLM latency.")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--php-latency", type=float, default=0.03, help="Fake PHP API latency in seconds.")
+    parser.add_argument("--php-jitter", type=float, default=0.01)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--log-level", default="WARNING")
+    parser.add_argument("--output", help="Also write the JSON report to this file.")
+    args = parser.parse_args()
+    if args.requests:
+        args.warmup = 0.0
+    # Read by the app's logging setup when the lifespan starts
+    os.environ["LOG_LEVEL"] = args.log_level.upper()
+
+    report = asyncio.run(run(args))
+    payload = json.dumps(report, indent=2, default=str)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(payload + "\n")
+    print(payload)
+
+
+if __name__ == "__main__":
+    main()
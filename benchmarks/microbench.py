@@ -0,0 +1,248 @@
+"""
+Microbenchmarks for the CPU-bound code on the chat hot path: the pet_logic engines,
+prompt building and response feature extraction.
+
+Every benchmark cycles through a fixed, seeded set of realistic inputs (see
+benchmarks/fixtures.py). For each one we report:
+  - ops_per_sec: calls per second in the fastest of --rounds timed rounds, each round
+    calibrated to run at least --min-time seconds (as timeit does)
+  - alloc_bytes_per_call: mean peak traced allocation of a single call (tracemalloc)
+  - relative: speed relative to the reference workload (see below)
+
+Log records are formatted and then discarded, so logging cost stays in the numbers
+without flooding the terminal. Timed rounds alternate with a fixed pure-Python
+reference workload, and --check compares `relative` (the median per-round ratio of
+ops/sec to the reference), so a baseline survives a slower or busier machine.
+
+Usage:
+    python benchmarks/microbench.py                     # print results as JSON
+    python benchmarks/microbench.py --save-baseline     # write benchmarks/baseline.json
+    python benchmarks/microbench.py --check             # exit 1 on regressions vs the baseline
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+
+from benchmarks.fixtures import (  # noqa: E402
+    USER_MESSAGES,
+    random_biography,
+    random_history,
+    random_pet,
+    random_pet_status,
+    random_reply,
+)
+from app.utils.extract_response import StreamingFeatureParser, extract_response_features  # noqa: E402
+from app.utils.pet_logic.behavior_engine import BehaviorEngine  # noqa: E402
+from app.utils.pet_logic.breed_engine import BreedEngine  # noqa: E402
+from app.utils.pet_logic.lifestage_engine import LifestageEngine  # noqa: E402
+from app.utils.pet_logic.personality_engine import PersonalityEngine  # noqa: E402
+from app.utils.prompt_builder import build_pet_prompt, system_prompt  # noqa: E402
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+CASES = 256
+
+
+class _DiscardHandler(logging.Handler):
+    def emit(self, record):
+        self.format(record)
+
+
+def _engine_status(pet_status: dict) -> dict:
+    # Same mapping build_pet_prompt applies to the PHP payload
+    return {
+        "hunger": float(pet_status["hunger_level"]),
+        "energy": float(pet_status["energy_level"]),
+        "health": float(pet_status["health_level"]),
+        "stress": float(pet_status["stress_level"]),
+        "cleanliness": float(pet_status["cleanliness_level"]),
+        "happiness": float(pet_status["happiness_level"]),
+        "is_sick": pet_status["is_sick"],
+    }
+
+
+def build_cases(seed: int) -> list:
+    rng = random.Random(seed)
+    cases = []
+    for i in range(CASES):
+        pet = random_pet(rng, i)
+        status = random_pet_status(rng)
+        cases.append({
+            "pet": pet,
+            "status": status,
+            "engine_status": _engine_status(status),
+            "biography": random_biography(rng),
+            "memory": "\n".join(
+                f"Alex: {m['text']}" if m["sender"] == "user" else f"{pet['name']}: {m['text']}"
+                for m in random_history(rng, 10)
+            ),
+            "message": rng.choice(USER_MESSAGES),
+            "reply": random_reply(rng, pet["name"]),
+            "stage": {"1": "Baby", "2": "Teen", "3": "Adult"}[pet["life_stage_id"]],
+        })
+    return cases
+
+
+def _stream_reply(case):
+    reply = case["reply"]
+    parser = StreamingFeatureParser(case["pet"]["name"])
+    for start in range(0, len(reply), 6):
+        parser.feed(reply[start:start + 6])
+    parser.close()
+    return parser.text
+
+
+BENCHMARKS = {
+    "behavior.get_primary_mood": lambda c: BehaviorEngine(c["engine_status"]).get_primary_mood(),
+    "behavior.get_summary": lambda c: BehaviorEngine(c["engine_status"]).get_summary(),
+    "breed.get_summary": lambda c: BreedEngine(c["pet"]["breed"]).get_summary(),
+    "personality.get_summary": lambda c: PersonalityEngine(c["pet"]["personality"]).get_summary(),
+    "lifestage.get_summary": lambda c: LifestageEngine(c["stage"]).get_summary(),
+    "prompt.system_prompt": lambda c: system_prompt(c["pet"], "Alex"),
+    "prompt.build_pet_prompt": lambda c: build_pet_prompt(
+        c["pet"], "Alex", memory_snippet=c["memory"], pet_status=c["status"],
+        biography_snippet=c["biography"], message=c["message"],
+    ),
+    "prompt.build_pet_prompt_compact": lambda c: build_pet_prompt(
+        c["pet"], "Alex", memory_snippet=c["memory"], pet_status=c["status"],
+        biography_snippet=c["biography"], message=c["message"], compact=True,
+    ),
+    "response.extract_features": lambda c: extract_response_features(c["reply"]),
+    "response.streaming_parser": _stream_reply,
+}
+
+
+def _time(func, cases: list, number: int) -> float:
+    count = len(cases)
+    started = time.perf_counter()
+    for i in range(number):
+        func(cases[i % count])
+    return time.perf_counter() - started
+
+
+def _calibrate(func, cases: list, min_time: float) -> int:
+    number = len(cases)
+    while _time(func, cases, number) < min_time:
+        number *= 2
+    return number
+
+
+def run_benchmark(func, cases: list, min_time: float, rounds: int, alloc_samples: int) -> dict:
+    for case in cases:
+        func(case)  # warm caches the way a running server would
+
+    # Rounds alternate with the reference workload; `relative` is the median per-round ratio.
+    number = _calibrate(func, cases, min_time)
+    reference_number = _calibrate(_reference, cases, min_time)
+    timings, ratios = [], []
+    for _ in range(rounds):
+        reference_time = _time(_reference, cases, reference_number)
+        timing = _time(func, cases, number)
+        timings.append(timing)
+        ratios.append((number / timing) / (reference_number / reference_time))
+
+    tracemalloc.start()
+    peaks = []
+    for i in range(alloc_samples):
+        case = cases[i % len(cases)]
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        func(case)
+        peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+    tracemalloc.stop()
+
+    return {
+        "ops_per_sec": round(number / min(timings), 1),
+        "relative": round(statistics.median(ratios), 5),
+        "alloc_bytes_per_call": round(statistics.mean(peaks), 1),
+    }
+
+
+def _reference(case):
+    # Mix of dict access, float math and string formatting, close to what the engines do
+    status = case["engine_status"]
+    total = sum(value for value in status.values() if isinstance(value, float))
+    return f"{case['pet']['name']}: {total:.1f} {case['message'].lower()}"
+
+
+def compare(results: dict, baseline: dict, tolerance: float, alloc_tolerance: float) -> list:
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        if result["relative"] < base["relative"] * (1 - tolerance):
+            regressions.append(
+                f"{name}: {result['relative']:.4f} x reference vs baseline {base['relative']:.4f} "
+                f"(-{(1 - result['relative'] / base['relative']) * 100:.0f}%)"
+            )
+        if result["alloc_bytes_per_call"] > base["alloc_bytes_per_call"] * (1 + alloc_tolerance) + 64:
+            regressions.append(
+                f"{name}: {result['alloc_bytes_per_call']:.0f} B/call vs baseline {base['alloc_bytes_per_call']:.0f}"
+            )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Microbenchmarks for pet logic, prompts and feature extraction.")
+    parser.add_argument("--filter", default="", help="Only run benchmarks whose name contains this text.")
+    parser.add_argument("--min-time", type=float, default=0.1, help="Minimum seconds per timed round.")
+    parser.add_argument("--rounds", type=int, default=7)
+    parser.add_argument("--alloc-samples", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--log-level", default="INFO", help="Root log level during the run (the app's default is INFO).")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="Write the results as the new baseline.")
+    parser.add_argument("--check", action="store_true", help="Exit 1 if any benchmark regressed against the baseline.")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed drop in relative speed as a fraction.")
+    parser.add_argument("--alloc-tolerance", type=float, default=0.25, help="Allowed allocation growth as a fraction.")
+    args = parser.parse_args()
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_DiscardHandler())
+    root.setLevel(args.log_level)
+
+    cases = build_cases(args.seed)
+    results = {}
+    for name, func in BENCHMARKS.items():
+        if args.filter and args.filter not in name:
+            continue
+        results[name] = run_benchmark(func, cases, args.min_time, args.rounds, args.alloc_samples)
+        print(f"{name:<36} {results[name]['ops_per_sec']:>12,.0f} ops/s {results[name]['alloc_bytes_per_call']:>10,.0f} B/call", file=sys.stderr)
+
+    if args.save_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, encoding="utf-8") as f:
+                baseline = json.load(f).get("benchmarks", {})
+        baseline.update(results)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({"python": sys.version.split()[0], "seed": args.seed, "benchmarks": baseline}, f, indent=2, sort_keys=True)
+            f.write("\n")
+
+    print(json.dumps(results, indent=2))
+
+    if args.check:
+        if not os.path.exists(args.baseline):
+            sys.exit(f"No baseline at {args.baseline}; run with --save-baseline first.")
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["benchmarks"]
+        regressions = compare(results, baseline, args.tolerance, args.alloc_tolerance)
+        if regressions:
+            print("Regressions:\n  " + "\n  ".join(regressions), file=sys.stderr)
+            sys.exit(1)
+        print("No regressions against the baseline.", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
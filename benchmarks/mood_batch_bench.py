@@ -0,0 +1,103 @@
+"""
+Batch mood evaluation: the per-pet BehaviorEngine loop vs the vectorized
+MoodRuleTable.evaluate_batch path behind POST /api/v1/moods/batch.
+
+For each fleet size both paths compute mood and behavior tag for every pet (best of
+--rounds). The loop starts from the status dicts; the batch path starts from the
+columnar lists the endpoint receives, so list-to-array conversion is included.
+Results are checked to agree pet for pet before anything is reported.
+
+Usage:
+    python benchmarks/mood_batch_bench.py [--sizes 1000,10000,100000] [--rounds 5] [--output result.json]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+
+from benchmarks.fixtures import random_pet_status  # noqa: E402
+from app.utils.pet_logic.behavior_engine import MOOD_VALUES, BehaviorEngine, get_mood_rules  # noqa: E402
+
+STATUS_FIELDS = ("hunger", "energy", "health", "stress", "cleanliness", "happiness")
+
+
+def build_fleet(rng: random.Random, size: int) -> list:
+    # Same mapping build_pet_prompt applies to the PHP payload
+    fleet = []
+    for _ in range(size):
+        status = random_pet_status(rng)
+        engine_status = {field: float(status[f"{field}_level"]) for field in STATUS_FIELDS}
+        engine_status["is_sick"] = status["is_sick"]
+        fleet.append(engine_status)
+    return fleet
+
+
+def to_columns(fleet: list) -> dict:
+    return {field: [status[field] for status in fleet] for field in STATUS_FIELDS + ("is_sick",)}
+
+
+def run_loop(fleet: list) -> tuple:
+    moods, tags = [], []
+    for status in fleet:
+        outcome = BehaviorEngine(status).evaluate()
+        moods.append(outcome.mood.value)
+        tags.append(outcome.behavior_tag)
+    return moods, tags
+
+
+def run_batch(columns: dict) -> tuple:
+    rules = get_mood_rules()
+    codes = rules.evaluate_batch(columns)
+    return MOOD_VALUES[codes].tolist(), rules.tags[codes].tolist()
+
+
+def best_of(fn, arg, rounds: int) -> float:
+    timings = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        fn(arg)
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare per-pet and vectorized mood evaluation.")
+    parser.add_argument("--sizes", default="1000,10000,100000")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Also write the JSON report to this file.")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    report = {"sizes": {}}
+    for size in (int(value) for value in args.sizes.split(",")):
+        fleet = build_fleet(rng, size)
+        columns = to_columns(fleet)
+        if run_loop(fleet) != run_batch(columns):
+            sys.exit(f"Batch and per-pet moods disagree for a fleet of {size}")
+
+        loop_time = best_of(run_loop, fleet, args.rounds)
+        batch_time = best_of(run_batch, columns, args.rounds)
+        report["sizes"][str(size)] = {
+            "loop_pets_per_sec": round(size / loop_time),
+            "batch_pets_per_sec": round(size / batch_time),
+            "loop_ms": round(loop_time * 1000, 3),
+            "batch_ms": round(batch_time * 1000, 3),
+            "speedup": round(loop_time / batch_time, 2),
+        }
+        print(f"{size:>8} pets  loop {loop_time * 1000:>9.2f} ms  batch {batch_time * 1000:>8.2f} ms", file=sys.stderr)
+
+    payload = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(payload + "\n")
+    print(payload)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,65 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
 import os
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, PlainTextResponse
 
 from app.api.llm_chat_route import router as chat_router
 from app.api.chat_history_route import router as history_router
+from app.api.pet_mood_route import router as mood_router
+from app.utils.php_service import start_http_client, close_http_client, get_pool_stats
+from app.utils.php_cache import get_php_cache_stats
+from app.utils.prompt_builder import get_prompt_cache_stats
+from app.utils.prompt_budget import get_tokenizer
+from app.utils.chat_handler import get_llm_gateway_stats, get_model_router_stats
+from app.utils.fact_extractor import get_fact_extraction_stats, fact_batcher, FACT_BATCH_ENABLED
+from app.utils.background_jobs import (
+    ForegroundTrackingMiddleware,
+    start_background_jobs,
+    stop_background_jobs,
+    get_background_job_stats,
+)
+from app.utils.metrics import render_metrics, setup_tracing, shutdown_tracing
+from app.utils.logging_config import configure_logging, stop_logging
+from app.utils.pet_memory import start_pet_memory, stop_pet_memory, get_pet_memory_stats
+from app.utils.embedding_service import get_embedding_stats
+from app.utils.chat_summary import get_chat_summary_stats
+from app.utils.user_operations import get_profile_cache_stats
+from app.utils.pet_logic.behavior_engine import get_mood_rules_stats, start_mood_rules_watcher, stop_mood_rules_watcher
+from app.db.connection import ensure_indexes
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Text logs in dev; queued JSON logs written off the event loop with LOG_MODE=production
+    configure_logging()
+    # Shared, pooled HTTP client for the PHP backend
+    await start_http_client()
+    await ensure_indexes()
+    # Load the prompt tokenizer off the event loop before the first request needs it
+    await asyncio.to_thread(get_tokenizer)
+    # Long-term memory store and its embedding model, loaded off the loop as well
+    await start_pet_memory()
+    if FACT_BATCH_ENABLED:
+        await fact_batcher.start()
+    await start_background_jobs()
+    # Picks up edits to the mood rules file without a restart
+    start_mood_rules_watcher()
+    try:
+        yield
+    finally:
+        # Let running jobs finish before their batcher and clients go away
+        await stop_mood_rules_watcher()
+        await stop_background_jobs()
+        await stop_pet_memory()
+        # Flush pending fact extractions while the LLM and DB clients are still up
+        await fact_batcher.stop()
+        await close_http_client()
+        shutdown_tracing()
+        stop_logging()
 
 
 # FastAPI App Initialization
@@ -14,6 +67,7 @@ app = FastAPI(
     title="PetPal",
     description="Virtual Pet Simulator.",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 app.add_middleware(
@@ -22,11 +76,18 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # /history returns its pagination cursor in this header
+    expose_headers=["X-Next-Cursor"],
 )
+# Background workers yield to in-flight chat requests
+app.add_middleware(ForegroundTrackingMiddleware, prefixes=("/api/v1/chat",))
+# OpenTelemetry spans for the chat stages, only when OTEL_ENABLED is set
+setup_tracing(app)
 
 # Routers
 app.include_router(chat_router, prefix="/api/v1", tags=["Chat"])
 app.include_router(history_router, prefix="/api/v1", tags=["Chat History"]) 
+app.include_router(mood_router, prefix="/api/v1", tags=["Pet Mood"])
 docs_dir = os.path.join(os.path.dirname(__file__), "docs", "spec")
 if os.path.isdir(docs_dir):
     app.mount("/spec", StaticFiles(directory=docs_dir), name="spec")
@@ -62,6 +123,59 @@ async def root():
 def health_check():
     return {"status": "ok"}
 
+@app.get("/health/php-pool", include_in_schema=False)
+def php_pool_stats():
+    return get_pool_stats()
+
+@app.get("/health/php-cache", include_in_schema=False)
+def php_cache_stats():
+    return get_php_cache_stats()
+
+@app.get("/health/prompt-cache", include_in_schema=False)
+def prompt_cache_stats():
+    return get_prompt_cache_stats()
+
+@app.get("/health/fact-extraction", include_in_schema=False)
+def fact_extraction_stats():
+    return get_fact_extraction_stats()
+
+@app.get("/health/llm-gateway", include_in_schema=False)
+def llm_gateway_stats():
+    return get_llm_gateway_stats()
+
+@app.get("/health/llm-router", include_in_schema=False)
+def llm_router_stats():
+    return get_model_router_stats()
+
+@app.get("/health/background-jobs", include_in_schema=False)
+async def background_job_stats():
+    return await get_background_job_stats()
+
+@app.get("/health/pet-memory", include_in_schema=False)
+def pet_memory_stats():
+    return get_pet_memory_stats()
+
+@app.get("/health/embeddings", include_in_schema=False)
+def embedding_stats():
+    return get_embedding_stats()
+
+@app.get("/health/chat-summary", include_in_schema=False)
+def chat_summary_stats():
+    return get_chat_summary_stats()
+
+@app.get("/health/profile-cache", include_in_schema=False)
+def profile_cache_stats():
+    return get_profile_cache_stats()
+
+@app.get("/health/mood-rules", include_in_schema=False)
+def mood_rules_stats():
+    return get_mood_rules_stats()
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    # Prometheus text format: per-stage latency histograms for chat turns
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 8084))
     uvicorn.run(app, host="0.0.0.0", port=port)
@@ -0,0 +1,76 @@
+"""
+Merges duplicate `user_profiles` documents (several documents with the same user_id,
+left behind by the old find-then-insert profile creation) so the unique index on
+user_id can be built.
+
+For each duplicated user_id the oldest document is kept; biography and preferences
+fields from the newer duplicates are merged into it (newer values win), pet_ids are
+unioned, and the duplicates are deleted. The unique index is created at the end.
+
+Usage:
+    python scripts/dedupe_user_profiles.py [--dry-run]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.db.connection import ensure_indexes, user_profiles_collection  # noqa: E402
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+logger = logging.getLogger("dedupe_user_profiles")
+
+
+def merge_profiles(profiles: list) -> dict:
+    # Oldest first (ObjectId order); later documents overwrite individual fields
+    keeper = profiles[0]
+    fields = {"biography": {}, "preferences": {}, "pet_ids": []}
+    for profile in profiles:
+        fields["biography"].update(profile.get("biography") or {})
+        fields["preferences"].update(profile.get("preferences") or {})
+        for pet_id in profile.get("pet_ids") or []:
+            if pet_id not in fields["pet_ids"]:
+                fields["pet_ids"].append(pet_id)
+        for key in ("email", "first_name"):
+            if profile.get(key):
+                fields[key] = profile[key]
+    return {"_id": keeper["_id"], "fields": fields, "drop": [p["_id"] for p in profiles[1:]]}
+
+
+async def dedupe(dry_run: bool):
+    pipeline = [
+        {"$group": {"_id": "$user_id", "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}},
+    ]
+    duplicated = await user_profiles_collection.aggregate(pipeline).to_list(length=None)
+    logger.info("Found %d user_ids with duplicate profiles", len(duplicated))
+
+    removed = 0
+    for group in duplicated:
+        profiles = await user_profiles_collection.find({"_id": {"$in": group["ids"]}}).sort("_id", 1).to_list(length=None)
+        merged = merge_profiles(profiles)
+        if dry_run:
+            logger.info("user_id %s: would keep %s and remove %d duplicates", group["_id"], merged["_id"], len(merged["drop"]))
+            continue
+        await user_profiles_collection.update_one({"_id": merged["_id"]}, {"$set": merged["fields"]})
+        result = await user_profiles_collection.delete_many({"_id": {"$in": merged["drop"]}})
+        removed += result.deleted_count
+
+    if dry_run:
+        return
+    logger.info("Removed %d duplicate profiles", removed)
+    await ensure_indexes()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Merge duplicate user profiles and build the unique index.")
+    parser.add_argument("--dry-run", action="store_true", help="Report duplicates without changing anything.")
+    args = parser.parse_args()
+    asyncio.run(dedupe(args.dry_run))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Exports the sentence embedding model to ONNX for the embedding service's "onnx"
+backend. Writes model.onnx (and model_quantized.onnx with --quantize) plus the
+tokenizer files into the output directory, which is what EMBEDDING_ONNX_DIR points at.
+
+With --verify, the export is checked against sentence-transformers on a few sentences.
+
+Requires torch and transformers (export only; serving needs just onnxruntime and tokenizers).
+
+Usage:
+    python scripts/export_embedding_onnx.py [--model sentence-transformers/all-MiniLM-L6-v2]
+                                            [--output models/all-MiniLM-L6-v2-onnx]
+                                            [--opset 17] [--quantize] [--verify]
+"""
+import argparse
+import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.utils.embedding_service import EMBEDDING_MODEL, EMBEDDING_ONNX_DIR, OnnxBackend  # noqa: E402
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+logger = logging.getLogger("export_embedding_onnx")
+
+VERIFY_SENTENCES = [
+    "I love burgers.",
+    "My name is Alex and I work as a nurse.",
+    "Let's go to the park after lunch!",
+    "오늘 기분 어때?",
+]
+
+
+def export(model_name: str, output_dir: str, opset: int):
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    os.makedirs(output_dir, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModel.from_pretrained(model_name)
+    model.eval()
+
+    sample = tokenizer(["export sample"], return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+
+    path = os.path.join(output_dir, "model.onnx")
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            tuple(sample[name] for name in input_names),
+            path,
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=opset,
+            do_constant_folding=True,
+        )
+    # tokenizer.json is what the serving side loads
+    tokenizer.save_pretrained(output_dir)
+    logger.info("Exported %s to %s", model_name, path)
+    return path
+
+
+def quantize(output_dir: str):
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    source = os.path.join(output_dir, "model.onnx")
+    target = os.path.join(output_dir, "model_quantized.onnx")
+    quantize_dynamic(source, target, weight_type=QuantType.QInt8)
+    logger.info("Wrote int8 weights to %s (use EMBEDDING_ONNX_FILE=model_quantized.onnx)", target)
+
+
+def verify(model_name: str, output_dir: str, model_file: str) -> float:
+    import numpy as np
+    from sentence_transformers import SentenceTransformer
+
+    reference = SentenceTransformer(model_name, device="cpu").encode(VERIFY_SENTENCES, normalize_embeddings=True)
+    exported = OnnxBackend(output_dir, model_file).encode(VERIFY_SENTENCES)
+    similarity = float(np.min(np.sum(reference * exported, axis=1)))
+    logger.info("%s: lowest cosine similarity to sentence-transformers = %.5f", model_file, similarity)
+    return similarity
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the embedding model to ONNX.")
+    parser.add_argument("--model", default=EMBEDDING_MODEL)
+    parser.add_argument("--output", default=EMBEDDING_ONNX_DIR)
+    parser.add_argument("--opset", type=int, default=17)
+    parser.add_argument("--quantize", action="store_true", help="Also write a dynamically quantized int8 model.")
+    parser.add_argument("--verify", action="store_true", help="Compare the export with sentence-transformers.")
+    args = parser.parse_args()
+
+    export(args.model, args.output, args.opset)
+    if args.quantize:
+        quantize(args.output)
+    if args.verify:
+        files = ["model.onnx"] + (["model_quantized.onnx"] if args.quantize else [])
+        # Quantized weights drift a little; anything below this means a broken export
+        if min(verify(args.model, args.output, name) for name in files) < 0.98:
+            sys.exit("Exported embeddings do not match sentence-transformers")
+
+
+if __name__ == "__main__":
+    main()
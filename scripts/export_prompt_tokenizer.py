@@ -0,0 +1,177 @@
+"""
+Builds the prompt budgeter's bundled tokenizer: converts a tiktoken BPE file
+(o200k_base, the encoding of the openai/gpt-oss models the chat route uses) into a
+Hugging Face tokenizer.json that the `tokenizers` package can load offline, and
+writes it gzipped to PROMPT_TOKENIZER_PATH's default location.
+
+The BPE file is o200k_base.tiktoken from tiktoken's public encodings; any local copy
+works (tiktoken's cache, or the copy some packages vendor). With --verify, token
+counts are checked against tiktoken on a few sentences and the repo's fixtures.
+
+Requires tiktoken for --verify only.
+
+Usage:
+    python scripts/export_prompt_tokenizer.py --bpe o200k_base.tiktoken [--output app/utils/tokenizers/o200k_base.json.gz] [--verify]
+"""
+import argparse
+import base64
+import gzip
+import json
+import logging
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.utils.prompt_budget import DEFAULT_TOKENIZER_PATH  # noqa: E402
+from benchmarks.fixtures import random_reply  # noqa: E402
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+logger = logging.getLogger("export_prompt_tokenizer")
+
+# tiktoken's o200k_base split pattern
+O200K_PATTERN = "|".join([
+    r"""[^\r\n\p{L}\p{N}]?[\p{Lu}\p{Lt}\p{Lm}\p{Lo}\p{M}]*[\p{Ll}\p{Lm}\p{Lo}\p{M}]+(?i:'s|'t|'re|'ve|'m|'ll|'d)?""",
+    r"""[^\r\n\p{L}\p{N}]?[\p{Lu}\p{Lt}\p{Lm}\p{Lo}\p{M}]+[\p{Ll}\p{Lm}\p{Lo}\p{M}]*(?i:'s|'t|'re|'ve|'m|'ll|'d)?""",
+    r"""\p{N}{1,3}""",
+    r""" ?[^\s\p{L}\p{N}]+[\r\n/]*""",
+    r"""\s*[\r\n]+""",
+    r"""\s+(?!\S)""",
+    r"""\s+""",
+])
+
+VERIFY_SENTENCES = [
+    "I love burgers.",
+    "My name is Alex and I work as a nurse.",
+    "(excited) {jump up} <yip> Let’s go outside!",
+    "오늘 기분 어때?",
+    "  Mixed   whitespace\n\nand 12345 numbers, isn't it?",
+]
+
+
+def load_bpe(path: str) -> dict:
+    ranks = {}
+    with open(path, "rb") as f:
+        for line in f:
+            if line.strip():
+                token, rank = line.split()
+                ranks[base64.b64decode(token)] = int(rank)
+    return ranks
+
+
+def _byte_to_unicode() -> dict:
+    # GPT-2's printable stand-ins for raw bytes, which the ByteLevel decoder expects
+    printable = list(range(ord("!"), ord("~") + 1)) + list(range(ord("¡"), ord("¬") + 1)) + list(range(ord("®"), ord("ÿ") + 1))
+    codes = printable[:]
+    extra = 0
+    for byte in range(256):
+        if byte not in printable:
+            printable.append(byte)
+            codes.append(256 + extra)
+            extra += 1
+    return dict(zip(printable, map(chr, codes)))
+
+
+def _split(ranks: dict, token: bytes, max_rank: int) -> list:
+    # Replays BPE on the token with lower-ranked merges only; what is left are the two halves merged at max_rank
+    parts = [bytes([byte]) for byte in token]
+    while True:
+        best = None
+        for i in range(len(parts) - 1):
+            rank = ranks.get(parts[i] + parts[i + 1])
+            if rank is not None and rank < max_rank and (best is None or rank < best[1]):
+                best = (i, rank)
+        if best is None:
+            return parts
+        i = best[0]
+        parts[i:i + 2] = [parts[i] + parts[i + 1]]
+
+
+def build_tokenizer_json(ranks: dict) -> dict:
+    to_unicode = _byte_to_unicode()
+
+    def encode(token: bytes) -> str:
+        return "".join(to_unicode[byte] for byte in token)
+
+    merges = []
+    for token, rank in sorted(ranks.items(), key=lambda item: item[1]):
+        if len(token) == 1:
+            continue
+        left, right = _split(ranks, token, rank)
+        merges.append(f"{encode(left)} {encode(right)}")
+
+    return {
+        "version": "1.0",
+        "truncation": None,
+        "padding": None,
+        "added_tokens": [],
+        "normalizer": None,
+        "pre_tokenizer": {
+            "type": "Sequence",
+            "pretokenizers": [
+                {"type": "Split", "pattern": {"Regex": O200K_PATTERN}, "behavior": "Isolated", "invert": False},
+                {"type": "ByteLevel", "add_prefix_space": False, "trim_offsets": True, "use_regex": False},
+            ],
+        },
+        "post_processor": None,
+        "decoder": {"type": "ByteLevel", "add_prefix_space": True, "trim_offsets": True, "use_regex": True},
+        "model": {
+            "type": "BPE",
+            "dropout": None,
+            "unk_token": None,
+            "continuing_subword_prefix": None,
+            "end_of_word_suffix": None,
+            "fuse_unk": False,
+            "byte_fallback": False,
+            "ignore_merges": True,
+            "vocab": {encode(token): rank for token, rank in ranks.items()},
+            "merges": merges,
+        },
+    }
+
+
+def verify(tokenizer_path: str, bpe_path: str, ranks: dict):
+    import tiktoken
+    from tokenizers import Tokenizer
+
+    reference = tiktoken.Encoding("o200k_base", pat_str=O200K_PATTERN, mergeable_ranks=ranks, special_tokens={})
+    with gzip.open(tokenizer_path, "rt", encoding="utf-8") as f:
+        tokenizer = Tokenizer.from_str(f.read())
+    rng = random.Random(42)
+    texts = VERIFY_SENTENCES + [random_reply(rng) for _ in range(200)]
+    mismatches = 0
+    for text in texts:
+        expected = reference.encode(text)
+        actual = tokenizer.encode(text, add_special_tokens=False).ids
+        if expected != actual:
+            mismatches += 1
+            logger.error("Token mismatch for %r: %s != %s", text, actual, expected)
+    if mismatches:
+        sys.exit(f"{mismatches} of {len(texts)} texts tokenize differently from tiktoken")
+    logger.info("Verified %d texts against tiktoken (%s)", len(texts), bpe_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert a tiktoken BPE file into the bundled prompt tokenizer.")
+    parser.add_argument("--bpe", required=True, help="Path to o200k_base.tiktoken.")
+    parser.add_argument("--output", default=DEFAULT_TOKENIZER_PATH)
+    parser.add_argument("--verify", action="store_true", help="Compare token ids with tiktoken.")
+    args = parser.parse_args()
+
+    ranks = load_bpe(args.bpe)
+    logger.info("Loaded %d ranks from %s", len(ranks), args.bpe)
+    tokenizer_json = build_tokenizer_json(ranks)
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    # mtime=0 keeps the gzip output byte-identical across runs
+    with open(args.output, "wb") as raw, gzip.GzipFile(fileobj=raw, mode="wb", mtime=0) as f:
+        f.write(json.dumps(tokenizer_json, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+    logger.info("Wrote %s (%d bytes)", args.output, os.path.getsize(args.output))
+
+    if args.verify:
+        verify(args.output, args.bpe, ranks)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Moves chat history from the legacy layout (one `chats` document per user/pet with an
+ever-growing `messages` array) into fixed-size documents in `chat_buckets`.
+
+The `chats` document is kept as the conversation header; its `messages` array is
+removed once the buckets are written (unless --keep-legacy is given), and it is
+marked with `migratedToBuckets` so the script can be re-run safely. Buckets get
+deterministic _ids and are written with insert-only upserts, so a run that stopped
+between writing a conversation's buckets and marking it does not duplicate them.
+
+Usage:
+    python scripts/migrate_chat_buckets.py [--dry-run] [--keep-legacy] [--limit N]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+from datetime import datetime
+
+from bson import ObjectId
+from pymongo import UpdateOne
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.db.connection import chats_collection, chat_buckets_collection, ensure_indexes  # noqa: E402
+from app.utils.chat_retention import CHAT_BUCKET_SIZE  # noqa: E402
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+logger = logging.getLogger("migrate_chat_buckets")
+
+
+def _legacy_message_id(timestamp) -> str:
+    # Keep the creation-time prefix so migrated ids sort before newer messages.
+    if isinstance(timestamp, datetime):
+        return str(ObjectId.from_datetime(timestamp))[:8] + str(ObjectId())[8:]
+    return str(ObjectId())
+
+
+def build_buckets(user_id, pet_id, messages: list) -> list:
+    buckets = []
+    for start in range(0, len(messages), CHAT_BUCKET_SIZE):
+        chunk = []
+        for msg in messages[start:start + CHAT_BUCKET_SIZE]:
+            msg = dict(msg)
+            msg.setdefault("timestamp", datetime.utcnow())
+            msg.setdefault("message_id", _legacy_message_id(msg["timestamp"]))
+            chunk.append(msg)
+        buckets.append({
+            "_id": f"legacy:{user_id}:{pet_id}:{start // CHAT_BUCKET_SIZE}",
+            "user_id": user_id,
+            "pet_id": pet_id,
+            "count": len(chunk),
+            "messages": chunk,
+            "start_ts": chunk[0]["timestamp"],
+            "first_message_id": chunk[0]["message_id"],
+            "end_ts": chunk[-1]["timestamp"],
+            "createdAt": datetime.utcnow(),
+        })
+    return buckets
+
+
+async def migrate(dry_run: bool, keep_legacy: bool, limit: int):
+    await ensure_indexes()
+    query = {"messages.0": {"$exists": True}, "migratedToBuckets": {"$ne": True}}
+    cursor = chats_collection.find(query)
+    if limit:
+        cursor = cursor.limit(limit)
+
+    conversations = 0
+    moved = 0
+    async for doc in cursor:
+        messages = doc.get("messages", [])
+        buckets = build_buckets(doc["user_id"], doc["pet_id"], messages)
+        conversations += 1
+        moved += len(messages)
+        logger.info(
+            "user %s / pet %s: %d messages -> %d buckets",
+            doc["user_id"], doc["pet_id"], len(messages), len(buckets),
+        )
+        if dry_run:
+            continue
+
+        # Buckets already written by an interrupted run are left as they are
+        await chat_buckets_collection.bulk_write(
+            [
+                UpdateOne(
+                    {"_id": bucket["_id"]},
+                    {"$setOnInsert": {key: value for key, value in bucket.items() if key != "_id"}},
+                    upsert=True,
+                )
+                for bucket in buckets
+            ],
+            ordered=True,
+        )
+        update = {"$set": {"migratedToBuckets": True, "migratedAt": datetime.utcnow()}}
+        if not keep_legacy:
+            update["$unset"] = {"messages": ""}
+        await chats_collection.update_one({"_id": doc["_id"]}, update)
+
+    logger.info(
+        "%s %d conversations, %d messages",
+        "Would migrate" if dry_run else "Migrated", conversations, moved,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrate chat history into chat_buckets.")
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would be migrated.")
+    parser.add_argument("--keep-legacy", action="store_true", help="Leave the old messages array in place.")
+    parser.add_argument("--limit", type=int, default=0, help="Migrate at most N conversations.")
+    args = parser.parse_args()
+    asyncio.run(migrate(args.dry_run, args.keep_legacy, args.limit))
+
+
+if __name__ == "__main__":
+    main()
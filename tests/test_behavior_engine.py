@@ -0,0 +1,36 @@
+import unittest
+
+import numpy as np
+
+from app.utils.pet_logic.behavior_engine import MOOD_VALUES, BehaviorEngine, get_mood_rules
+
+# Healthy and happy unless the flag counts as set
+HEALTHY = {"hunger": 90.0, "energy": 90.0, "health": 90.0, "stress": 10.0, "cleanliness": 90.0, "happiness": 90.0}
+FLAG_VALUES = ["1", 1, 1.0, True, "0", 0, False, None, "true", "yes", "01", 2]
+
+
+class MoodEvaluationTest(unittest.TestCase):
+    def scalar_moods(self, flags):
+        return [BehaviorEngine({**HEALTHY, "is_sick": flag}).evaluate().mood.value for flag in flags]
+
+    def batch_moods(self, flag_column):
+        columns = {field: [value] * len(flag_column) for field, value in HEALTHY.items()}
+        columns["is_sick"] = flag_column
+        return MOOD_VALUES[get_mood_rules().evaluate_batch(columns)].tolist()
+
+    def test_flag_values_agree_between_scalar_and_batch(self):
+        expected = self.scalar_moods(FLAG_VALUES)
+        self.assertEqual(expected[:4], ["sick"] * 4)
+        self.assertNotIn("sick", expected[4:])
+        self.assertEqual(self.batch_moods(FLAG_VALUES), expected)
+
+    def test_flag_arrays_agree_with_scalar(self):
+        for column in (np.array(["1", "0", "1"]), np.array([1, 0, 1]), np.array([1.0, 0.0, 1.0]), np.array([True, False, True])):
+            self.assertEqual(self.batch_moods(column), self.scalar_moods(column.tolist()), column.dtype)
+
+    def test_missing_flag_means_not_sick(self):
+        self.assertEqual(BehaviorEngine(dict(HEALTHY)).evaluate().mood.value, "happy")
+
+
+if __name__ == "__main__":
+    unittest.main()
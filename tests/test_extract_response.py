@@ -0,0 +1,56 @@
+import random
+import unittest
+
+from app.utils.extract_response import StreamingFeatureParser, extract_response_features
+
+
+def stream_features(text: str, chunks: list, pet_name: str = "") -> tuple:
+    parser = StreamingFeatureParser(pet_name)
+    events = []
+    for chunk in chunks:
+        events += parser.feed(chunk)
+    events += parser.close()
+    features = {"motions": [], "sounds": [], "emotions": []}
+    for kind, payload in events:
+        if kind == "feature":
+            features[payload["type"] + "s"].append(payload["value"])
+    return features, "".join(payload for kind, payload in events if kind == "delta")
+
+
+def random_chunks(rng: random.Random, text: str) -> list:
+    cuts = sorted(rng.sample(range(1, len(text)), min(len(text) - 1, rng.randint(0, 8)))) if len(text) > 1 else []
+    return [text[start:end] for start, end in zip([0] + cuts, cuts + [len(text)])]
+
+
+class StreamingFeatureParserTest(unittest.TestCase):
+    def test_unclosed_opener_does_not_hide_later_tags(self):
+        text = "a < b and {x} (sad) <"
+        features, _ = stream_features(text, list(text))
+        self.assertEqual(features, extract_response_features(text))
+        self.assertEqual(features["motions"], ["x"])
+        self.assertEqual(features["emotions"], ["sad"])
+
+    def test_nested_and_overlapping_tags_match_regex(self):
+        for text in ["{a{b} <c (happy) d>", "(hap(happy)", "(nope) {} <> {ok}", "<a {b> c}"]:
+            features, _ = stream_features(text, list(text))
+            self.assertEqual(features, extract_response_features(text), text)
+
+    def test_random_chunkings_match_extract_response_features(self):
+        rng = random.Random(7)
+        pieces = ["(", ")", "{", "}", "<", ">", " ", "happy", "sad", "hap", "wag tail", "bark", "x"]
+        for _ in range(2000):
+            text = "".join(rng.choice(pieces) for _ in range(rng.randint(1, 20))).strip()
+            if not text:
+                continue
+            features, streamed = stream_features(text, random_chunks(rng, text))
+            self.assertEqual(streamed, text)
+            self.assertEqual(features, extract_response_features(text), text)
+
+    def test_pet_name_prefix_is_dropped(self):
+        features, streamed = stream_features("Rex: (happy) {wag tail} <bark> Hi!", ["Re", "x: (hap", "py) {wag tail} <bark> Hi!"], "Rex")
+        self.assertEqual(streamed, "(happy) {wag tail} <bark> Hi!")
+        self.assertEqual(features, {"motions": ["wag tail"], "sounds": ["bark"], "emotions": ["happy"]})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+import unittest
+from unittest import mock
+
+from app.utils import model_router
+from app.utils.model_router import FakeProvider, ModelRouter, ModelSpec, Route
+
+
+def make_router(provider: FakeProvider, hedge: bool = True, slo: float = 0.05) -> ModelRouter:
+    routes = {
+        "chat": Route(models=[ModelSpec("fake", "a"), ModelSpec("fake", "b")], slo=slo, hedge=hedge),
+        "fact_extraction": Route(models=[ModelSpec("fake", "b"), ModelSpec("fake", "a")], slo=slo),
+    }
+    return ModelRouter(routes, {"fake": provider})
+
+
+# Probing keeps the configured order on a random share of calls; turn it off so routing is deterministic
+@mock.patch.object(model_router, "LLM_ROUTER_PROBE_RATE", 0.0)
+class ModelRouterTest(unittest.IsolatedAsyncioTestCase):
+    async def test_falls_back_when_primary_fails(self):
+        provider = FakeProvider(latency=0.001, per_model={"a": {"error_rate": 1.0}}, seed=1)
+        result = await make_router(provider, hedge=False).complete("chat", "system", "hi")
+        self.assertTrue(result.ok)
+        self.assertEqual(result.model, "b")
+
+    async def test_hedged_route_falls_back_when_primary_fails_before_slo(self):
+        provider = FakeProvider(latency=0.001, per_model={"a": {"error_rate": 1.0}}, seed=1)
+        router = make_router(provider, hedge=True)
+        result = await router.complete("chat", "system", "hi")
+        self.assertTrue(result.ok)
+        self.assertEqual(result.model, "b")
+        self.assertEqual(router.stats()["hedges"], 0)
+        self.assertEqual(router.stats()["fallbacks"], 1)
+
+    async def test_hedge_starts_second_model_after_slo(self):
+        provider = FakeProvider(latency=0.001, per_model={"a": {"latency": 0.5}}, seed=1)
+        router = make_router(provider, hedge=True, slo=0.02)
+        result = await router.complete("chat", "system", "hi")
+        self.assertEqual(result.model, "b")
+        self.assertEqual(router.stats()["hedges"], 1)
+        self.assertEqual(router.stats()["hedge_wins"], 1)
+
+    async def test_returns_last_error_when_every_model_fails(self):
+        provider = FakeProvider(latency=0.001, error_rate=1.0, seed=1)
+        router = make_router(provider, hedge=True)
+        result = await router.complete("chat", "system", "hi")
+        self.assertFalse(result.ok)
+        self.assertEqual(router.health["fake:a"].calls + router.health["fake:b"].calls, 2)
+
+    async def test_slow_primary_is_demoted(self):
+        provider = FakeProvider(latency=0.001, per_model={"a": {"latency": 0.06}}, seed=1)
+        router = make_router(provider, hedge=False, slo=0.05)
+        for _ in range(model_router.LLM_ROUTER_MIN_SAMPLES):
+            await router._call(ModelSpec("fake", "a"), "system", "hi", 10, None)
+        self.assertEqual([spec.model for spec in router.order("chat")], ["b", "a"])
+        result = await router.complete("chat", "system", "hi")
+        self.assertEqual(result.model, "b")
+
+    async def test_routes_per_call_type(self):
+        router = make_router(FakeProvider(latency=0.001, seed=1))
+        result = await router.complete("fact_extraction", "system", "hi")
+        self.assertEqual(result.model, "b")
+
+    async def test_stream_falls_back_before_first_delta(self):
+        provider = FakeProvider(latency=0.001, per_model={"a": {"error_rate": 1.0}}, text="hello there", seed=1)
+        router = make_router(provider)
+        deltas = [delta async for delta in router.stream("chat", "system", "hi")]
+        self.assertEqual("".join(deltas).strip(), "hello there")
+        self.assertEqual(router.stats()["fallbacks"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,37 @@
+import unittest
+from unittest import mock
+
+from app.utils import user_operations
+from app.utils.ttl_cache import AsyncTTLCache
+
+
+class UpdateCachedProfileTest(unittest.TestCase):
+    def setUp(self):
+        cache = AsyncTTLCache("user_profile", maxsize=10, ttl=300.0, stale_ttl=600.0)
+        patcher = mock.patch.object(user_operations, "_profile_cache", cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.cache = cache
+
+    def test_updates_fresh_entry(self):
+        self.cache.set(1, {"user_id": 1, "biography": {}})
+        user_operations.update_cached_profile(1, {"biography.name": "Alex", "first_name": "Alex"})
+        self.assertEqual(self.cache.peek(1), {"user_id": 1, "biography": {"name": "Alex"}, "first_name": "Alex"})
+
+    def test_updates_stale_entry(self):
+        # Past its TTL but inside the stale-while-revalidate window
+        self.cache.set(1, {"user_id": 1, "biography": {"job": "nurse"}}, ttl=-1.0)
+        self.assertIsNone(self.cache.get(1))
+        user_operations.update_cached_profile(1, {"biography.food": "burgers"})
+        self.assertEqual(self.cache.peek(1)["biography"], {"job": "nurse", "food": "burgers"})
+
+    def test_ignores_uncached_and_expired_users(self):
+        self.cache.set(2, {"user_id": 2, "biography": {}}, ttl=-601.0)
+        user_operations.update_cached_profile(1, {"biography.name": "Alex"})
+        user_operations.update_cached_profile(2, {"biography.name": "Sam"})
+        self.assertIsNone(self.cache.peek(1))
+        self.assertIsNone(self.cache.peek(2))
+
+
+if __name__ == "__main__":
+    unittest.main()